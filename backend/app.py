@@ -1,12 +1,47 @@
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
 import uvicorn
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
+import asyncio
+import json
 import os
+import time
 
 from services.llm_service import LLMService
 from services.product_service import ProductService
+from services.cache_warmer import CacheWarmer
+from services.catalog_response import etag_matches
+from services.catalog_snapshot import json_default
+from services.metrics import (
+    HTTP_REQUEST_SECONDS, REGISTRY, server_timing, start_request_timing, stop_request_timing
+)
+from services.structured_logging import (
+    configure_logging, dropped_records, get_logger, parse_levels, parse_sample_rates, shutdown_logging
+)
+from config import config
+
+def setup_logging(queued=True):
+    configure_logging(
+        level=config['LOG_LEVEL'],
+        fmt=config['LOG_FORMAT'],
+        sample_rates=parse_sample_rates(config['LOG_SAMPLE_RATES']),
+        logger_levels=parse_levels(config['LOG_LEVELS']),
+        queue_size=config['LOG_QUEUE_SIZE'],
+        queued=queued
+    )
+
+# before the services start, so that catalog loading is logged too
+setup_logging()
+log = get_logger("app")
+
+# server.py forks several workers from this module; jobs that must run once
+# per host (cache warm-up, co-view snapshots) only run in the primary one
+primary_worker = True
+# set by server.py: the other workers forward browsing histories to the
+# primary one through this file (see CoViewModel.start)
+coview_spool_path = None
 
 app = FastAPI(title="AI Product Recommendation API")
 
@@ -17,11 +52,66 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Allows all methods
     allow_headers=["*"],  # Allows all headers
+    expose_headers=["ETag", "X-Next-Cursor", "Server-Timing"],
 )
 
 # Initialize services
 product_service = ProductService()
-llm_service = LLMService()
+llm_service = LLMService(product_service)
+cache_warmer = CacheWarmer(
+    llm_service,
+    price_ranges=[r.strip() for r in config['CACHE_WARMUP_PRICE_RANGES'].split(',') if r.strip()],
+    max_categories=config['CACHE_WARMUP_MAX_CATEGORIES'],
+    max_brands=config['CACHE_WARMUP_MAX_BRANDS'],
+    rate=config['CACHE_WARMUP_RATE'],
+    concurrency=config['LLM_MAX_CONCURRENCY'],
+    refresh_margin_hours=config['CACHE_WARMUP_REFRESH_MARGIN_HOURS']
+)
+background_tasks = []
+
+def collect_service_metrics():
+    """Counters kept by the services themselves, read at scrape time"""
+    memory = llm_service.cache_service.get_memory_stats()
+    requests = llm_service.get_request_stats()
+    families = [
+        ("recommendation_cache_lookups_total", "counter", "Recommendation cache lookups by result",
+         [({"result": result}, memory[stat]) for result, stat in
+          (("l1_hit", "l1_hits"), ("l2_hit", "l2_hits"), ("miss", "misses"), ("expired", "expired"))]),
+        ("recommendation_requests_total", "counter", "Recommendation requests by how they were answered",
+         [({"outcome": outcome}, requests[outcome]) for outcome in
+          ("cache_hits", "cache_misses", "coalesced", "fast", "slo_misses", "fallbacks")]),
+        ("llm_calls_in_flight", "gauge", "LLM calls currently in flight", [({}, requests["in_flight"])]),
+        ("catalog_products", "gauge", "Products in the current catalog version",
+         [({}, len(product_service.get_all_products()))]),
+    ]
+    if llm_service.coview_model is not None:
+        families.append(("coview_sessions_total", "counter", "Browsing histories ingested by the co-view model",
+                         [({}, llm_service.coview_model.sessions)]))
+    families.append(("log_records_dropped_total", "counter", "Log records dropped because the log queue was full",
+                     [({}, dropped_records())]))
+    return families
+
+REGISTRY.add_collector(collect_service_metrics)
+
+@app.middleware("http")
+async def time_requests(request: Request, call_next):
+    """
+    Record request latency per route and send the stage timings of the
+    request in a Server-Timing header
+    """
+    timings, token = start_request_timing()
+    started = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        stop_request_timing(token)
+    elapsed = time.perf_counter() - started
+    route = request.scope.get("route")
+    HTTP_REQUEST_SECONDS.observe(
+        elapsed, method=request.method, route=getattr(route, "path", "unmatched"), status=response.status_code
+    )
+    response.headers["Server-Timing"] = server_timing(timings, elapsed)
+    return response
 
 # Define request models
 class UserPreferences(BaseModel):
@@ -33,13 +123,46 @@ class RecommendationRequest(BaseModel):
     preferences: UserPreferences
     browsing_history: List[str] = []
 
+class BatchRecommendationRequest(BaseModel):
+    # validated one by one, so a malformed item only fails itself
+    requests: List[Dict[str, Any]]
+    concurrency: Optional[int] = None
+
 @app.get("/api/products")
-async def get_products():
+async def get_products(
+    request: Request,
+    fields: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=1000)
+):
     """
-    Return the full product catalog
+    Return the product catalog
+
+    Bodies are pre-encoded per catalog version. Supports `fields=` projection
+    (e.g. fields=id,name,price), cursor pagination (`limit`, then pass the
+    X-Next-Cursor header back as `cursor`), ETag / If-None-Match and gzip.
+    Without parameters the whole catalog is returned, as before.
     """
-    products = product_service.get_all_products()
-    return products
+    catalog = product_service.catalog_response
+    offset = catalog.cursor_offset(cursor)
+    if offset is None:
+        raise HTTPException(status_code=400, detail=f"Unknown cursor: {cursor}")
+
+    page = catalog.page(catalog.parse_fields(fields), offset, limit)
+    use_gzip = "gzip" in request.headers.get("accept-encoding", "")
+    # each encoding is a different representation, so it gets its own tag
+    etag = page["etag"][:-1] + '-gzip"' if use_gzip else page["etag"]
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if page["next_cursor"] is not None:
+        headers["X-Next-Cursor"] = page["next_cursor"]
+
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    if use_gzip:
+        headers["Content-Encoding"] = "gzip"
+        return Response(catalog.gzip_page(page), media_type="application/json", headers=headers)
+    return Response(page["body"], media_type="application/json", headers=headers)
 
 @app.post("/api/recommendations")
 async def get_recommendations(request: RecommendationRequest):
@@ -47,15 +170,15 @@ async def get_recommendations(request: RecommendationRequest):
     Generate personalized product recommendations based on user preferences
     and browsing history
     """
-    #print(request)
     try:
         # Extract user preferences and browsing history from request
         user_preferences = request.preferences.dict()
         browsing_history = request.browsing_history
-        print(user_preferences,browsing_history)
+        log.debug("recommendations.request", preferences=user_preferences, browsing_history=browsing_history)
+        llm_service.record_browsing_history(browsing_history)
         
         # Use the LLM service to generate recommendations
-        recommendations = llm_service.generate_recommendations(
+        recommendations = await llm_service.agenerate_recommendations(
             user_preferences,
             browsing_history,
             product_service.get_all_products()
@@ -66,6 +189,130 @@ async def get_recommendations(request: RecommendationRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def _sse_event(event, data):
+    """Format one Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data, default=json_default)}\n\n"
+
+@app.post("/api/recommendations/stream")
+async def stream_recommendations(request: RecommendationRequest):
+    """
+    Stream personalized recommendations as Server-Sent Events
+
+    Sends a `recommendation` event for each recommendation as soon as the LLM
+    has produced it, then a `done` event with the remaining result fields
+    (count, usage, cached/fallback flags), or an `error` event.
+    """
+    user_preferences = request.preferences.dict()
+    browsing_history = request.browsing_history
+    llm_service.record_browsing_history(browsing_history)
+
+    async def events():
+        try:
+            async for event, data in llm_service.astream_recommendations(
+                user_preferences,
+                browsing_history,
+                product_service.get_all_products()
+            ):
+                yield _sse_event(event, data)
+        except Exception as e:
+            yield _sse_event("error", {"error": str(e)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/api/recommendations/batch")
+async def batch_recommendations(request: BatchRecommendationRequest):
+    """
+    Generate recommendations for many preference/history pairs
+
+    Streams NDJSON: one line per input item as its result is ready, either
+    {"index": i, "result": {...}} or {"index": i, "error": "..."}. Identical
+    items are computed once and cache hits are answered first.
+    """
+    if len(request.requests) > config['BATCH_MAX_ITEMS']:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {config['BATCH_MAX_ITEMS']} requests per batch"
+        )
+
+    valid = []
+    invalid = []
+    for index, item in enumerate(request.requests):
+        try:
+            parsed = RecommendationRequest.parse_obj(item)
+            valid.append((index, parsed.preferences.dict(), parsed.browsing_history))
+            llm_service.record_browsing_history(parsed.browsing_history)
+        except Exception as e:
+            invalid.append({"index": index, "error": str(e)})
+
+    def line(data):
+        return json.dumps(data, default=json_default) + "\n"
+
+    async def results():
+        for error in invalid:
+            yield line(error)
+        batch = llm_service.agenerate_batch(
+            [(prefs, history) for _, prefs, history in valid],
+            product_service.get_all_products(),
+            min(request.concurrency or config['BATCH_MAX_CONCURRENCY'], config['BATCH_MAX_CONCURRENCY'])
+        )
+        async for positions, result, error in batch:
+            for position in positions:
+                if error is not None:
+                    yield line({"index": valid[position][0], "error": str(error) or type(error).__name__})
+                else:
+                    yield line({"index": valid[position][0], "result": result})
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+@app.get("/api/recommendations/stats")
+async def get_recommendation_stats():
+    """
+    Return catalog version, cache, co-view model and request coalescing counters
+    """
+    return {
+        "catalog": {"version": product_service.version, "products": len(product_service.get_all_products()),
+                    "mapped": product_service.snapshot is not None},
+        "requests": llm_service.get_request_stats(),
+        "coview": llm_service.coview_model.get_stats() if llm_service.coview_model is not None else None,
+        "warmup": cache_warmer.last_run,
+        "cache": llm_service.cache_service.get_cache_stats()
+    }
+
+@app.get("/metrics")
+async def get_metrics():
+    """
+    Stage latencies, request and cache counters in the Prometheus text format
+    """
+    return Response(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.on_event("startup")
+async def start_background_jobs():
+    product_service.start_watcher(config['CATALOG_RELOAD_INTERVAL_SECONDS'])
+    if llm_service.coview_model is not None:
+        llm_service.coview_model.start(
+            config['COVIEW_SNAPSHOT_INTERVAL_SECONDS'], save=primary_worker, spool_path=coview_spool_path
+        )
+    # keep cold-start (no history) cache entries fresh ahead of TTL expiry
+    if (primary_worker and config['CACHE_WARMUP_INTERVAL_SECONDS'] > 0
+            and llm_service.recommendation_mode != 'fast'):
+        background_tasks.append(asyncio.create_task(
+            cache_warmer.run_forever(config['CACHE_WARMUP_INTERVAL_SECONDS'])
+        ))
+
+@app.on_event("shutdown")
+async def close_llm_client():
+    for task in background_tasks:
+        task.cancel()
+    product_service.stop_watcher()
+    if llm_service.coview_model is not None:
+        llm_service.coview_model.stop()
+    await llm_service.aclose()
+    shutdown_logging()
+
 # Custom exception handler for more user-friendly error messages
 @app.exception_handler(Exception)
 async def generic_exception_handler(request: Request, exc: Exception):
@@ -0,0 +1,7 @@
+"""
+Benchmarks for the recommendation hot path.
+
+Run from the backend directory, e.g. `python -m benchmarks.bench_prompt`, or
+`python -m benchmarks.bench_hot_path --sizes 50,10000` for every stage of a
+request on synthetic catalogs (see benchmarks.synthetic).
+"""
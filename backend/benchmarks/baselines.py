@@ -0,0 +1,87 @@
+"""
+Baselines for the benchmarks: saving a run and flagging regressions against it.
+
+Each benchmark lists the metrics it tracks as a flat {label: value} dict
+(lower is better) and uses add_arguments/finish for its command line:
+
+    --save-baseline [FILE]  write the run as the new baseline
+    --baseline [FILE]       compare against a baseline, exit 1 on regressions
+    --tolerance X           allowed relative growth (default 0.25)
+
+Without FILE both use the committed baseline of the benchmark,
+benchmarks/<name>.baseline.json.
+"""
+
+import json
+import os
+import sys
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def default_path(name):
+    """Committed baseline file of a benchmark"""
+    return os.path.join(BENCHMARK_DIR, f'{name}.baseline.json')
+
+
+def add_arguments(parser, name):
+    """
+    Add the baseline options to a benchmark's argument parser
+
+    Parameters:
+    - parser (argparse.ArgumentParser): The benchmark's parser
+    - name (str): Benchmark name, for the committed baseline file
+    """
+    path = default_path(name)
+    parser.add_argument('--save-baseline', metavar='FILE', nargs='?', const=path,
+                        help=f'save the run as baseline (default {os.path.relpath(path)})')
+    parser.add_argument('--baseline', metavar='FILE', nargs='?', const=path,
+                        help=f'fail on regressions against a baseline (default {os.path.relpath(path)})')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed relative regression against the baseline (default 0.25)')
+
+
+def compare(result, baseline, metrics, tolerance):
+    """
+    Regressions of a run against a baseline
+
+    Parameters:
+    - result (dict): The run
+    - baseline (dict): A saved run
+    - metrics (callable): Maps a run to {label: value} of the tracked
+      metrics; labels missing from either run are not compared
+    - tolerance (float): Allowed relative growth
+
+    Returns:
+    - list: One message per metric over the tolerance
+    """
+    expected = metrics(baseline)
+    regressions = []
+    for label, value in metrics(result).items():
+        reference = expected.get(label)
+        if value is None or reference is None:
+            continue
+        limit = reference * (1 + tolerance)
+        if value > limit:
+            regressions.append(f"{label} {value} > {limit:.2f} (baseline {reference})")
+    return regressions
+
+
+def finish(result, args, metrics):
+    """
+    Save and check a run as the baseline options ask
+
+    Exits with status 1 if --baseline found regressions.
+    """
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(result, f, indent=2)
+            f.write('\n')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(result, json.load(f), metrics, args.tolerance)
+        for message in regressions:
+            print(f"REGRESSION: {message}")
+        if regressions:
+            sys.exit(1)
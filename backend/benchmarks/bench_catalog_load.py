@@ -0,0 +1,150 @@
+"""
+Benchmark catalog loading: plain JSON against the mapped catalog snapshot.
+
+For each catalog size, writes a synthetic products.json and measures
+ProductService start-up in a fresh process per mode, so memory is counted
+from a clean interpreter:
+
+    json           load products.json and build the indexes
+    snapshot_cold  build the snapshot (indexes included), then map it
+    snapshot       map the snapshot built by snapshot_cold
+
+Reports the load time, the peak RSS, and the anonymous memory left after
+loading, which is what every worker pays on its own: mapped snapshot pages
+are file-backed and shared by all workers through the page cache. Each mode
+also reports the catalog version, which must be the same in all of them.
+With --baseline, exits non-zero when the snapshot load time or anonymous
+memory grew by more than --tolerance compared to a saved run; without FILE,
+against the committed benchmarks/bench_catalog_load.baseline.json.
+
+Usage:
+    python -m benchmarks.bench_catalog_load [--sizes 1000,100000]
+        [--save-baseline [FILE]] [--baseline [FILE]]
+"""
+
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks import baselines
+from benchmarks.synthetic import generate_catalog
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = ('json', 'snapshot_cold', 'snapshot')
+
+
+def _anonymous_kb():
+    """Anonymous memory of this process in kB, None where /proc is missing"""
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                if line.startswith('Anonymous:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def measure_load():
+    """
+    Load the catalog configured in the environment and measure it; run in
+    the child process
+
+    Returns:
+    - dict: load_ms, max_rss_kb, anon_kb, products and version
+    """
+    from services.product_service import ProductService
+
+    started = time.perf_counter()
+    service = ProductService()
+    load_seconds = time.perf_counter() - started
+    return {
+        'load_ms': round(load_seconds * 1000, 1),
+        'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'anon_kb': _anonymous_kb(),
+        'products': len(service.products),
+        'version': service.version,
+    }
+
+
+def _run_mode(data_path, snapshot_path):
+    env = dict(os.environ, DATA_PATH=data_path, CATALOG_SNAPSHOT_PATH=snapshot_path)
+    output = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.bench_catalog_load', '--measure'],
+        cwd=BACKEND_DIR, env=env, check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run_size(size, seed=0):
+    """
+    Measure every mode on a catalog of the given size
+
+    Returns:
+    - dict: Results per mode, plus the snapshot file size
+    """
+    directory = tempfile.mkdtemp(prefix='bench-catalog-')
+    try:
+        data_path = os.path.join(directory, 'products.json')
+        snapshot_path = os.path.join(directory, 'products.snapshot')
+        with open(data_path, 'w') as f:
+            json.dump(generate_catalog(size, seed), f)
+
+        result = {'json': _run_mode(data_path, '')}
+        result['snapshot_cold'] = _run_mode(data_path, snapshot_path)
+        result['snapshot'] = _run_mode(data_path, snapshot_path)
+        result['snapshot_bytes'] = os.path.getsize(snapshot_path)
+        return result
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def tracked_metrics(result):
+    """Snapshot load time and anonymous memory per size, for the baseline"""
+    return {
+        f"{size} products, snapshot: {metric}": modes.get('snapshot', {}).get(metric)
+        for size, modes in result.get('sizes', {}).items()
+        for metric in ('load_ms', 'anon_kb')
+    }
+
+
+def compare(result, baseline, tolerance):
+    """
+    Regressions of the snapshot load against a baseline
+
+    Returns:
+    - list: One message per metric over the tolerance
+    """
+    return baselines.compare(result, baseline, tracked_metrics, tolerance)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='1000,10000,100000',
+                        help='comma-separated catalog sizes (default 1000,10000,100000)')
+    parser.add_argument('--seed', type=int, default=0)
+    baselines.add_arguments(parser, 'bench_catalog_load')
+    parser.add_argument('--measure', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure_load()))
+        return
+
+    result = {'sizes': {}}
+    for size in (int(size) for size in args.sizes.split(',')):
+        result['sizes'][str(size)] = run_size(size, args.seed)
+        print(f"{size} products done", file=sys.stderr)
+    print(json.dumps(result, indent=2))
+
+    baselines.finish(result, args, tracked_metrics)
+
+
+if __name__ == '__main__':
+    main()
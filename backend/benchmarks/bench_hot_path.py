@@ -0,0 +1,229 @@
+"""
+Benchmark the recommendation hot path on synthetic catalogs.
+
+For each catalog size, builds the product service over a generated catalog
+and times each stage of a request:
+
+    catalog        load the catalog and build its indexes (once per size)
+    select         LLMService._select_relevant_products
+    prompt         LLMService._create_recommendation_prompt
+    parse          LLMService._parse_recommendation_response
+    cache_write    LLMCacheService.cache_recommendations
+    cache_read     LLMCacheService.get_cached_recommendations, memory hit
+    cache_read_disk  the same, from the backend with the memory tier disabled
+
+Reports mean/p50/p95 time per call, the peak memory allocated during a call
+and the memory still held after it (leaks, caches), plus the peak RSS of the
+process. With --baseline, exits non-zero when a stage's mean time or peak
+memory grew by more than --tolerance compared to a saved run; without FILE,
+against the committed benchmarks/bench_hot_path.baseline.json (default sizes).
+
+Usage:
+    python -m benchmarks.bench_hot_path [--sizes 50,10000,100000] [--requests N]
+        [--stages select,prompt] [--save-baseline [FILE]] [--baseline [FILE]]
+"""
+
+import argparse
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# keep benchmark runs away from the real cache directory
+os.environ.setdefault('CACHE_DIR', tempfile.mkdtemp(prefix='bench-cache-'))
+
+from benchmarks import baselines
+from benchmarks.synthetic import generate_catalog, generate_requests
+from config import config
+from services.cache_service import LLMCacheService
+from services.llm_service import LLMService
+from services.product_service import ProductService
+
+STAGES = ('select', 'prompt', 'parse', 'cache_write', 'cache_read', 'cache_read_disk')
+
+# calls per stage traced with tracemalloc (tracing slows calls down, so the
+# timed calls run untraced)
+TRACED_CALLS = 20
+
+
+def _llm_response(service, preferences, history, products, rng):
+    """A response like the model's, picking five of the prompt candidates"""
+    candidates = service._select_relevant_products(preferences, history, products, max_products=15)
+    picks = rng.sample(candidates, min(5, len(candidates)))
+    return json.dumps([
+        {'product_id': product['id'], 'explanation': f"Matches your interest in {product['category']}.",
+         'score': rng.randint(5, 9)}
+        for product in picks
+    ])
+
+
+def build_stages(service, products, requests, seed=0):
+    """
+    Callables for each stage, one per request
+
+    Returns:
+    - dict: stage name -> list of zero-argument callables
+    """
+    rng = random.Random(seed)
+    max_candidates = service.prompt_max_candidates
+    responses = [_llm_response(service, prefs, history, products, rng) for prefs, history in requests]
+    results = [service._parse_recommendation_response(text, products) for text in responses]
+    id_requests = [(prefs, [p['id'] for p in history]) for prefs, history in requests]
+
+    cache = service.cache_service
+    disk_cache = LLMCacheService(
+        backend=cache.backend, ttl_hours=cache.ttl_hours, memory_max_entries=0,
+        product_service=service.product_service, compression=cache.compression,
+        compression_level=cache.compression_level, canonicalizer=cache.canonicalizer
+    )
+
+    return {
+        'select': [lambda p=prefs, h=history: service._select_relevant_products(p, h, products, max_candidates)
+                   for prefs, history in requests],
+        'prompt': [lambda p=prefs, h=history: service._create_recommendation_prompt(p, h, products)
+                   for prefs, history in requests],
+        'parse': [lambda text=text: service._parse_recommendation_response(text, products)
+                  for text in responses],
+        'cache_write': [lambda p=prefs, h=ids, r=result: cache.cache_recommendations(p, h, r)
+                        for (prefs, ids), result in zip(id_requests, results)],
+        'cache_read': [lambda p=prefs, h=ids: cache.get_cached_recommendations(p, h)
+                       for prefs, ids in id_requests],
+        'cache_read_disk': [lambda p=prefs, h=ids: disk_cache.get_cached_recommendations(p, h)
+                            for prefs, ids in id_requests],
+    }
+
+
+def measure(calls, iterations):
+    """
+    Time and trace a stage
+
+    Parameters:
+    - calls (list): Zero-argument callables, run round robin
+    - iterations (int): Timed calls
+
+    Returns:
+    - dict: mean_us, p50_us, p95_us, peak_bytes (mean per traced call) and
+      retained_bytes (mean per traced call)
+    """
+    for call in calls:
+        call()
+
+    timings = []
+    for i in range(iterations):
+        call = calls[i % len(calls)]
+        started = time.perf_counter()
+        call()
+        timings.append(time.perf_counter() - started)
+
+    traced = calls[:TRACED_CALLS]
+    tracemalloc.start()
+    start_bytes = tracemalloc.get_traced_memory()[0]
+    peak_total = 0
+    for call in traced:
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        call()
+        peak_total += tracemalloc.get_traced_memory()[1] - current
+    retained = tracemalloc.get_traced_memory()[0] - start_bytes
+    tracemalloc.stop()
+
+    timings.sort()
+    return {
+        'mean_us': round(sum(timings) / len(timings) * 1e6, 2),
+        'p50_us': round(timings[len(timings) // 2] * 1e6, 2),
+        'p95_us': round(timings[int(len(timings) * 0.95)] * 1e6, 2),
+        'peak_bytes': peak_total // len(traced),
+        'retained_bytes': retained // len(traced),
+    }
+
+
+def run_size(size, request_count, iterations, stages, seed=0):
+    """
+    Benchmark every stage on a catalog of the given size
+
+    Returns:
+    - dict: catalog build stats and per-stage results
+    """
+    products = generate_catalog(size, seed)
+    directory = tempfile.mkdtemp(prefix='bench-catalog-')
+    data_path = os.path.join(directory, 'products.json')
+    with open(data_path, 'w') as f:
+        json.dump(products, f)
+    del products
+
+    previous_data_path = config['DATA_PATH']
+    config['DATA_PATH'] = data_path
+    try:
+        started = time.perf_counter()
+        product_service = ProductService()
+        build_seconds = time.perf_counter() - started
+        service = LLMService(product_service)
+    finally:
+        config['DATA_PATH'] = previous_data_path
+
+    products = product_service.get_all_products()
+    requests = generate_requests(products, request_count, seed)
+    stage_calls = build_stages(service, products, requests, seed)
+
+    result = {
+        'catalog': {'products': len(products), 'build_ms': round(build_seconds * 1000, 1)},
+        'stages': {},
+    }
+    for stage in stages:
+        result['stages'][stage] = measure(stage_calls[stage], iterations)
+    service.cache_service.stop_background_expiry()
+    return result
+
+
+def tracked_metrics(result):
+    """Mean time and peak memory of every stage per size, for the baseline"""
+    return {
+        f"{size} products, {stage}: {metric}": metrics.get(metric)
+        for size, run in result.get('sizes', {}).items()
+        for stage, metrics in run.get('stages', {}).items()
+        for metric in ('mean_us', 'peak_bytes')
+    }
+
+
+def compare(result, baseline, tolerance):
+    """
+    Regressions of a run against a baseline
+
+    Returns:
+    - list: One message per stage metric over the tolerance
+    """
+    return baselines.compare(result, baseline, tracked_metrics, tolerance)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='50,1000,10000',
+                        help='comma-separated catalog sizes (default 50,1000,10000; up to 1000000)')
+    parser.add_argument('--requests', type=int, default=100, help='distinct requests per size')
+    parser.add_argument('--iterations', type=int, default=500, help='timed calls per stage')
+    parser.add_argument('--stages', default=','.join(STAGES))
+    parser.add_argument('--seed', type=int, default=0)
+    baselines.add_arguments(parser, 'bench_hot_path')
+    args = parser.parse_args()
+
+    stages = [stage.strip() for stage in args.stages.split(',') if stage.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+
+    result = {'sizes': {}}
+    for size in (int(size) for size in args.sizes.split(',')):
+        result['sizes'][str(size)] = run_size(size, args.requests, args.iterations, stages, args.seed)
+        print(f"{size} products done", file=sys.stderr)
+    result['max_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps(result, indent=2))
+
+    baselines.finish(result, args, tracked_metrics)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Benchmark prompt construction (_create_recommendation_prompt).
+
+Reports mean and p95 time per prompt plus the peak memory allocated while
+building one.
+With --baseline, exits non-zero when the mean time or the peak memory grew by
+more than --tolerance compared to a saved run; without FILE, against the
+committed benchmarks/bench_prompt.baseline.json.
+
+Usage:
+    python -m benchmarks.bench_prompt [--iterations N] [--save-baseline [FILE]] [--baseline [FILE]]
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+# keep benchmark runs away from the real cache directory
+os.environ.setdefault('CACHE_DIR', tempfile.mkdtemp(prefix='bench-cache-'))
+
+from benchmarks import baselines
+from services.llm_service import LLMService
+
+
+def make_requests(products, count, seed=1):
+    rng = random.Random(seed)
+    categories = sorted({p['category'] for p in products})
+    brands = sorted({p['brand'] for p in products})
+    requests = []
+    for _ in range(count):
+        preferences = {
+            'priceRange': rng.choice(['all', '0-50', '50-100', '100-500']),
+            'categories': rng.sample(categories, rng.randint(0, 2)),
+            'brands': rng.sample(brands, rng.randint(0, 2)),
+        }
+        history = rng.sample(products, rng.randint(0, 5))
+        requests.append((preferences, history))
+    return requests
+
+
+def run(iterations):
+    service = LLMService()
+    products = service.product_service.get_all_products()
+    requests = make_requests(products, 50)
+
+    # warm up
+    for preferences, history in requests:
+        service._create_recommendation_prompt(preferences, history, products)
+
+    timings = []
+    for i in range(iterations):
+        preferences, history = requests[i % len(requests)]
+        started = time.perf_counter()
+        service._create_recommendation_prompt(preferences, history, products)
+        timings.append(time.perf_counter() - started)
+
+    # peak traced memory while building each prompt, above what was live before
+    tracemalloc.start()
+    peak_total = 0
+    for preferences, history in requests:
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        service._create_recommendation_prompt(preferences, history, products)
+        peak_total += tracemalloc.get_traced_memory()[1] - current
+    tracemalloc.stop()
+
+    timings.sort()
+    return {
+        'catalog_size': len(products),
+        'iterations': iterations,
+        'mean_us': round(sum(timings) / len(timings) * 1e6, 2),
+        'p95_us': round(timings[int(len(timings) * 0.95)] * 1e6, 2),
+        'peak_bytes_per_prompt': peak_total // len(requests),
+    }
+
+
+def tracked_metrics(result):
+    """Mean time and peak memory per prompt, for the baseline"""
+    return {metric: result.get(metric) for metric in ('mean_us', 'peak_bytes_per_prompt')}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=2000)
+    baselines.add_arguments(parser, 'bench_prompt')
+    args = parser.parse_args()
+
+    result = run(args.iterations)
+    print(json.dumps(result, indent=2))
+
+    baselines.finish(result, args, tracked_metrics)
+
+
+if __name__ == '__main__':
+    main()
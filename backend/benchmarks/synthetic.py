@@ -0,0 +1,187 @@
+"""
+Synthetic catalogs and request streams for benchmarks.
+
+Catalogs keep the products.json schema and are grown from the bundled
+catalog: categories, subcategories, names, features and tags are varied from
+its products, category and brand sizes are skewed, and prices and ratings
+are spread around realistic values. Requests mimic real traffic: some users
+arrive cold, popular products are browsed far more often than the long tail,
+and a session mostly stays within one category.
+
+Write a catalog to disk with:
+
+    python -m benchmarks.synthetic --size 100000 --output /tmp/products-100k.json
+"""
+
+import argparse
+import bisect
+import itertools
+import json
+import os
+import random
+
+BUNDLED_CATALOG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'products.json')
+
+ADJECTIVES = ['Classic', 'Premium', 'Compact', 'Deluxe', 'Eco', 'Pro', 'Ultra', 'Smart', 'Essential',
+              'Portable', 'Modern', 'Vintage', 'Advanced', 'Everyday', 'Signature', 'Lightweight']
+
+
+def load_bundled_catalog(path=BUNDLED_CATALOG):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def _zipf_cum_weights(count, exponent=1.1):
+    return list(itertools.accumulate(1.0 / (rank + 1) ** exponent for rank in range(count)))
+
+
+def _zipf_choice(rng, values, cum_weights):
+    """Pick from values, the first ones far more often than the last ones"""
+    return values[bisect.bisect_left(cum_weights, rng.random() * cum_weights[-1])]
+
+
+def generate_catalog(size, seed=0, source=None):
+    """
+    Generate a product catalog with the products.json schema
+
+    The number of categories and brands grows with the size (about size^0.4
+    categories and size^0.5 brands), and both are Zipf distributed.
+
+    Parameters:
+    - size (int): Number of products
+    - seed (int): Random seed; the same seed gives the same catalog
+    - source (list): Products to vary, the bundled catalog if not given
+
+    Returns:
+    - list: Product dicts
+    """
+    rng = random.Random(seed)
+    source = source or load_bundled_catalog()
+
+    templates = {}
+    for product in source:
+        templates.setdefault(product['category'], []).append(product)
+    base_categories = sorted(templates, key=lambda c: (-len(templates[c]), c))
+    tag_pool = sorted({tag for product in source for tag in product.get('tags', ())})
+    feature_pool = sorted({feature for product in source for feature in product.get('features', ())})
+
+    category_count = max(len(base_categories), int(size ** 0.4))
+    categories = []
+    for index in range(category_count):
+        base = base_categories[index % len(base_categories)]
+        name = base if index < len(base_categories) else f"{base} {index // len(base_categories) + 1}"
+        subcategories = sorted({p['subcategory'] for p in templates[base]})
+        subcategories += [f"{rng.choice(ADJECTIVES)} {rng.choice(subcategories)}" for _ in range(rng.randint(1, 4))]
+        categories.append((name, base, subcategories))
+    category_weights = _zipf_cum_weights(category_count)
+
+    brand_names = sorted({p['brand'] for p in source})
+    brand_count = max(len(brand_names), int(size ** 0.5))
+    brands = [brand_names[i % len(brand_names)] + (str(i // len(brand_names) + 1) if i >= len(brand_names) else '')
+              for i in range(brand_count)]
+    brands_by_category = [rng.sample(brands, min(len(brands), rng.randint(4, 30))) for _ in categories]
+
+    products = []
+    for position in range(size):
+        category_index = bisect.bisect_left(category_weights, rng.random() * category_weights[-1])
+        category, base, subcategories = categories[category_index]
+        template = rng.choice(templates[base])
+        category_brands = brands_by_category[category_index]
+        features = rng.sample(template['features'], min(len(template['features']), rng.randint(1, 3)))
+        features += rng.sample(feature_pool, rng.randint(0, 2))
+        tags = rng.sample(template['tags'], min(len(template['tags']), rng.randint(2, 4)))
+        tags += [tag for tag in rng.sample(tag_pool, rng.randint(0, 2)) if tag not in tags]
+
+        products.append({
+            'id': f"prod{position + 1:07d}",
+            'name': f"{rng.choice(ADJECTIVES)} {template['name']}",
+            'category': category,
+            'subcategory': rng.choice(subcategories),
+            'price': round(max(1.0, template['price'] * rng.lognormvariate(0, 0.35)), 2),
+            'brand': category_brands[(int(rng.paretovariate(1.2)) - 1) % len(category_brands)],
+            'description': template['description'],
+            'features': features,
+            'rating': round(min(5.0, max(1.0, rng.gauss(4.3, 0.35))), 1),
+            'inventory': rng.randint(0, 500),
+            'tags': tags
+        })
+    return products
+
+
+def generate_requests(products, count, seed=0, max_history=12):
+    """
+    Generate recommendation requests against a catalog
+
+    About a quarter of the users are cold starts without a history. Browsing
+    follows a Zipf popularity over the catalog and stays in the category of
+    the first product most of the time; preferences often repeat a browsed
+    category and a price range around what was browsed.
+
+    Parameters:
+    - products (list): Catalog to browse
+    - count (int): Number of requests
+    - seed (int): Random seed
+    - max_history (int): Longest browsing history
+
+    Returns:
+    - list: (user_preferences, browsed products) pairs
+    """
+    rng = random.Random(seed)
+    popularity = list(range(len(products)))
+    rng.shuffle(popularity)
+    cum_weights = _zipf_cum_weights(len(products))
+    by_category = {}
+    for product in products:
+        by_category.setdefault(product['category'], []).append(product)
+    categories = sorted(by_category)
+    brands = sorted({product['brand'] for product in products})
+
+    requests = []
+    for _ in range(count):
+        history = []
+        if rng.random() >= 0.25:
+            first = products[_zipf_choice(rng, popularity, cum_weights)]
+            history.append(first)
+            for _ in range(min(max_history, int(rng.expovariate(1 / 3)))):
+                if rng.random() < 0.7:
+                    history.append(rng.choice(by_category[first['category']]))
+                else:
+                    history.append(products[_zipf_choice(rng, popularity, cum_weights)])
+
+        price_range = 'all'
+        if rng.random() < 0.5:
+            if history:
+                average = sum(p['price'] for p in history) / len(history)
+                price_range = f"{int(average * 0.7)}-{int(average * 1.3) + 1}"
+            else:
+                price_range = rng.choice(['0-50', '50-100', '100-200', '200-500'])
+
+        preferred_categories = []
+        if rng.random() < 0.4:
+            pool = sorted({p['category'] for p in history}) or categories
+            preferred_categories = rng.sample(pool, min(len(pool), rng.randint(1, 2)))
+        preferred_brands = rng.sample(brands, rng.randint(1, 2)) if rng.random() < 0.25 else []
+
+        requests.append((
+            {'priceRange': price_range, 'categories': preferred_categories, 'brands': preferred_brands},
+            history
+        ))
+    return requests
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--size', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', required=True, help='JSON file to write the catalog to')
+    args = parser.parse_args(argv)
+
+    products = generate_catalog(args.size, args.seed)
+    with open(args.output, 'w') as f:
+        json.dump(products, f)
+    print(f"Wrote {len(products)} products to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
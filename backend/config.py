@@ -9,9 +9,79 @@ config = {
     'OPENAI_API_KEY': os.getenv('OPENAI_API_KEY'),
     'MODEL_NAME': os.getenv('MODEL_NAME', 'gpt-3.5-turbo'),
     'MAX_TOKENS': int(os.getenv('MAX_TOKENS', 1000)),
+    'PROMPT_TOKEN_BUDGET': int(os.getenv('PROMPT_TOKEN_BUDGET', 1200)),
+    'PROMPT_MAX_CANDIDATES': int(os.getenv('PROMPT_MAX_CANDIDATES', 15)),
+    'PROMPT_MIN_CANDIDATES': int(os.getenv('PROMPT_MIN_CANDIDATES', 5)),
     'TEMPERATURE': float(os.getenv('TEMPERATURE', 0.7)),
     'DATA_PATH': os.getenv('DATA_PATH', 'data/products.json'),
+    # 'tfidf' text similarity or the legacy 'features' word matching
+    'CONTENT_SIMILARITY': os.getenv('CONTENT_SIMILARITY', 'tfidf'),
+    # score only products matching a signal of the request (facets, content, price), plus the best
+    # rated; ranks like scoring the whole catalog, and is faster only when requests match few products
+    'CANDIDATE_RETRIEVAL': os.getenv('CANDIDATE_RETRIEVAL', 'false').lower() in ('1', 'true', 'yes'),
+    'CATALOG_SNAPSHOT_PATH': os.getenv('CATALOG_SNAPSHOT_PATH', ''),
+    'CATALOG_RELOAD_INTERVAL_SECONDS': float(os.getenv('CATALOG_RELOAD_INTERVAL_SECONDS', 5)),
+    # item-to-item co-view signal learned from request browsing histories
+    'COVIEW_ENABLED': os.getenv('COVIEW_ENABLED', 'true').lower() in ('1', 'true', 'yes'),
+    'COVIEW_SNAPSHOT_PATH': os.getenv('COVIEW_SNAPSHOT_PATH', ''),
+    'COVIEW_SNAPSHOT_INTERVAL_SECONDS': float(os.getenv('COVIEW_SNAPSHOT_INTERVAL_SECONDS', 60)),
+    'COVIEW_TOP_N': int(os.getenv('COVIEW_TOP_N', 20)),
+    'COVIEW_MIN_COUNT': int(os.getenv('COVIEW_MIN_COUNT', 2)),
+    'COVIEW_MAX_HISTORY': int(os.getenv('COVIEW_MAX_HISTORY', 20)),
     'USE_CACHE': os.getenv('USE_CACHE',True),
+    # 'file' (CACHE_DIR, per host) or 'redis' (CACHE_REDIS_URL, shared by all nodes)
+    'CACHE_BACKEND': os.getenv('CACHE_BACKEND', 'file'),
     'CACHE_DIR': os.getenv('CACHE_DIR', 'cache'),
-    'CACHE_TTL_HOURS': os.getenv('CACHE_TTL_HOURS',24)
+    'CACHE_REDIS_URL': os.getenv('CACHE_REDIS_URL', 'redis://localhost:6379/0'),
+    'CACHE_REDIS_KEY_PREFIX': os.getenv('CACHE_REDIS_KEY_PREFIX', 'reco:'),
+    'CACHE_REDIS_MAX_CONNECTIONS': int(os.getenv('CACHE_REDIS_MAX_CONNECTIONS', 16)),
+    'CACHE_REDIS_TIMEOUT_SECONDS': float(os.getenv('CACHE_REDIS_TIMEOUT_SECONDS', 2)),
+    'CACHE_TTL_HOURS': os.getenv('CACHE_TTL_HOURS',24),
+    'CACHE_SWEEP_INTERVAL_SECONDS': float(os.getenv('CACHE_SWEEP_INTERVAL_SECONDS', 300)),
+    'CACHE_COMPRESSION': os.getenv('CACHE_COMPRESSION', 'none'),
+    'CACHE_COMPRESSION_LEVEL': int(os.getenv('CACHE_COMPRESSION_LEVEL', 6)),
+    'CACHE_MEMORY_MAX_ENTRIES': int(os.getenv('CACHE_MEMORY_MAX_ENTRIES', 1024)),
+    'CACHE_MEMORY_MAX_MB': float(os.getenv('CACHE_MEMORY_MAX_MB', 64)),
+    'CACHE_KEY_SORT_FACETS': os.getenv('CACHE_KEY_SORT_FACETS', 'true').lower() in ('1', 'true', 'yes'),
+    'CACHE_KEY_DROP_UNKNOWN_IDS': os.getenv('CACHE_KEY_DROP_UNKNOWN_IDS', 'true').lower() in ('1', 'true', 'yes'),
+    'CACHE_KEY_HISTORY_DEDUPE': os.getenv('CACHE_KEY_HISTORY_DEDUPE', 'true').lower() in ('1', 'true', 'yes'),
+    'CACHE_KEY_HISTORY_LIMIT': int(os.getenv('CACHE_KEY_HISTORY_LIMIT', 20)),
+    'CACHE_KEY_HISTORY_ORDER_INSENSITIVE': os.getenv('CACHE_KEY_HISTORY_ORDER_INSENSITIVE', 'false').lower() in ('1', 'true', 'yes'),
+    'CACHE_KEY_PRICE_BUCKETS': [float(edge) for edge in os.getenv('CACHE_KEY_PRICE_BUCKETS', '').split(',') if edge.strip()],
+    'CACHE_WARMUP_INTERVAL_SECONDS': float(os.getenv('CACHE_WARMUP_INTERVAL_SECONDS', 0)),
+    'CACHE_WARMUP_PRICE_RANGES': os.getenv('CACHE_WARMUP_PRICE_RANGES', 'all'),
+    'CACHE_WARMUP_MAX_CATEGORIES': int(os.getenv('CACHE_WARMUP_MAX_CATEGORIES', 1)),
+    'CACHE_WARMUP_MAX_BRANDS': int(os.getenv('CACHE_WARMUP_MAX_BRANDS', 1)),
+    'CACHE_WARMUP_RATE': float(os.getenv('CACHE_WARMUP_RATE', 2)),
+    'CACHE_WARMUP_REFRESH_MARGIN_HOURS': float(os.getenv('CACHE_WARMUP_REFRESH_MARGIN_HOURS', 1)),
+    'OPENAI_API_BASE': os.getenv('OPENAI_API_BASE'),
+    'LLM_TIMEOUT_SECONDS': float(os.getenv('LLM_TIMEOUT_SECONDS', 30)),
+    'LLM_MAX_CONCURRENCY': int(os.getenv('LLM_MAX_CONCURRENCY', 8)),
+    'BATCH_MAX_CONCURRENCY': int(os.getenv('BATCH_MAX_CONCURRENCY', 4)),
+    'BATCH_MAX_ITEMS': int(os.getenv('BATCH_MAX_ITEMS', 1000)),
+    'RECOMMENDATION_MODE': os.getenv('RECOMMENDATION_MODE', 'llm'),
+    'LATENCY_SLO_MS': float(os.getenv('LATENCY_SLO_MS', 0)),
+    'LLM_FALLBACK': os.getenv('LLM_FALLBACK', 'true').lower() in ('1', 'true', 'yes'),
+    'FAST_RECOMMENDATION_COUNT': int(os.getenv('FAST_RECOMMENDATION_COUNT', 5)),
+    # logs are queued and written by a background thread; 'json' lines or 'text'
+    'LOG_LEVEL': os.getenv('LOG_LEVEL', 'info'),
+    'LOG_FORMAT': os.getenv('LOG_FORMAT', 'json'),
+    # per-logger levels, e.g. 'services.cache_service=debug'
+    'LOG_LEVELS': os.getenv('LOG_LEVELS', ''),
+    # fraction of records kept per event, e.g. 'cache.hit=0.01,recommendations.request=0.1'
+    'LOG_SAMPLE_RATES': os.getenv('LOG_SAMPLE_RATES', ''),
+    'LOG_QUEUE_SIZE': int(os.getenv('LOG_QUEUE_SIZE', 10000)),
+    # production server (server.py): worker processes forked after the catalog
+    # is loaded; 0 starts one per available CPU
+    'HOST': os.getenv('HOST', '0.0.0.0'),
+    'PORT': int(os.getenv('PORT', 8080)),
+    'WORKERS': int(os.getenv('WORKERS', 0)),
+    'WORKER_BACKLOG': int(os.getenv('WORKER_BACKLOG', 2048)),
+    # open connections per worker before new ones get 503; 0 means no limit
+    'WORKER_LIMIT_CONCURRENCY': int(os.getenv('WORKER_LIMIT_CONCURRENCY', 0)),
+    # requests after which a worker is replaced by a fresh fork; 0 means never
+    'WORKER_MAX_REQUESTS': int(os.getenv('WORKER_MAX_REQUESTS', 0)),
+    'WORKER_KEEP_ALIVE_SECONDS': float(os.getenv('WORKER_KEEP_ALIVE_SECONDS', 5)),
+    'WORKER_GRACEFUL_TIMEOUT_SECONDS': float(os.getenv('WORKER_GRACEFUL_TIMEOUT_SECONDS', 30)),
+    'ACCESS_LOG': os.getenv('ACCESS_LOG', 'false').lower() in ('1', 'true', 'yes')
 }
\ No newline at end of file
@@ -0,0 +1,238 @@
+"""
+Production entry point: a pre-forking server running the API on every core.
+
+The master process loads the application once (catalog, indexes, co-view
+model), binds the listening socket and forks WORKERS uvicorn workers from
+it. The catalog is mapped from a snapshot file (CATALOG_SNAPSHOT_PATH, a
+temporary directory if unset) that the master builds before forking, so the
+workers share its pages through the page cache, also after a reload: the
+first worker to find the snapshot stale rebuilds it under a file lock and the
+others map the result. The workers accept connections from the same socket. They share the recommendation cache
+through the cache directory and its SQLite (WAL) index; each keeps its own
+in-memory cache tier. Jobs that must run once per host (cache expiry, cache
+warm-up, co-view snapshots) run in the first worker only. The other workers
+forward the browsing histories they see to the co-view model of the first
+one through a spool file next to its snapshot, and load its snapshots.
+
+The master restarts workers that exit (crashes, or WORKER_MAX_REQUESTS
+reached) and on SIGTERM or SIGINT stops them gracefully, killing those still
+running after WORKER_GRACEFUL_TIMEOUT_SECONDS.
+
+Usage:
+    python server.py [--workers N] [--host HOST] [--port PORT]
+"""
+
+import argparse
+import gc
+import os
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import time
+
+import uvicorn
+
+from config import config
+from services.structured_logging import get_logger
+
+log = get_logger("server")
+
+# a worker exiting sooner than this after its start is restarted with a delay,
+# so that a broken deployment does not fork in a tight loop
+MIN_WORKER_LIFETIME_SECONDS = 1.0
+
+
+def available_cpus():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def bind_socket(host, port, backlog):
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+class Master:
+    """
+    Forks the workers from the loaded application and keeps them running
+    """
+
+    def __init__(self, application, sock, workers):
+        """
+        Parameters:
+        - application (module): The loaded app module
+        - sock (socket.socket): Bound listening socket shared by the workers
+        - workers (int): Number of worker processes
+        """
+        self.application = application
+        self.sock = sock
+        self.workers = workers
+        # pid -> (worker index, start time)
+        self.children = {}
+        self.stopping = False
+
+    def spawn(self, index):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                self.run_worker(index)
+            except BaseException:
+                log.exception("server.worker_failed", worker=index)
+                code = 1
+            finally:
+                os._exit(code)
+        self.children[pid] = (index, time.monotonic())
+        log.info("server.worker_started", worker=index, pid=pid)
+
+    def run_worker(self, index):
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        application = self.application
+        application.setup_logging()
+        application.primary_worker = index == 0
+        cache_service = application.llm_service.cache_service
+        cache_service.after_fork()
+        # a restarted worker is forked from the state the master loaded at
+        # boot; catch up before accepting connections
+        application.product_service.reload_if_changed()
+        if application.llm_service.coview_model is not None:
+            application.llm_service.coview_model.reload_if_changed()
+        if index == 0 and application.llm_service.use_cache:
+            cache_service.start_background_expiry(interval_seconds=config['CACHE_SWEEP_INTERVAL_SECONDS'])
+
+        server = uvicorn.Server(uvicorn.Config(
+            application.app,
+            lifespan="on",
+            log_config=None,
+            access_log=config['ACCESS_LOG'],
+            backlog=config['WORKER_BACKLOG'],
+            limit_concurrency=config['WORKER_LIMIT_CONCURRENCY'] or None,
+            limit_max_requests=config['WORKER_MAX_REQUESTS'] or None,
+            timeout_keep_alive=config['WORKER_KEEP_ALIVE_SECONDS'],
+        ))
+        server.run(sockets=[self.sock])
+
+    def stop(self, signum, frame):
+        if not self.stopping:
+            self.stopping = True
+            log.info("server.stopping", signal=signal.Signals(signum).name, workers=len(self.children))
+            signal.signal(signal.SIGALRM, self.kill)
+            signal.setitimer(signal.ITIMER_REAL, config['WORKER_GRACEFUL_TIMEOUT_SECONDS'])
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def kill(self, signum, frame):
+        for pid in list(self.children):
+            log.warning("server.worker_killed", worker=self.children[pid][0], pid=pid)
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+    def run(self):
+        """
+        Fork the workers and restart them as they exit, until stopped
+
+        Returns:
+        - int: Exit status for the master process
+        """
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for index in range(self.workers):
+            self.spawn(index)
+
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            index, started = self.children.pop(pid, (None, 0))
+            if index is None:
+                continue
+            code = os.waitstatus_to_exitcode(status)
+            log.info("server.worker_exited", worker=index, pid=pid, code=code)
+            if self.stopping:
+                continue
+            if time.monotonic() - started < MIN_WORKER_LIFETIME_SECONDS:
+                time.sleep(MIN_WORKER_LIFETIME_SECONDS)
+            if not self.stopping:
+                self.spawn(index)
+
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        log.info("server.stopped")
+        return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--host', default=config['HOST'])
+    parser.add_argument('--port', type=int, default=config['PORT'])
+    parser.add_argument('--workers', type=int, default=config['WORKERS'],
+                        help='worker processes (default: WORKERS, 0 for one per CPU)')
+    args = parser.parse_args(argv)
+    workers = args.workers or available_cpus()
+
+    # bind first: a busy port fails before the catalog is loaded
+    sock = bind_socket(args.host, args.port, config['WORKER_BACKLOG'])
+
+    catalog_dir = None
+    if workers > 1 and not config['CATALOG_SNAPSHOT_PATH']:
+        # the workers map one shared catalog snapshot, even when it is not
+        # kept across restarts; importing the app builds it here, once
+        catalog_dir = tempfile.mkdtemp(prefix='catalog-')
+        config['CATALOG_SNAPSHOT_PATH'] = os.path.join(catalog_dir, 'products.snapshot')
+    try:
+        return serve(args, sock, workers)
+    finally:
+        if catalog_dir is not None:
+            shutil.rmtree(catalog_dir, ignore_errors=True)
+
+
+def serve(args, sock, workers):
+    """Load the application in the master and run the workers over it"""
+    import app as application
+
+    # the master only supervises; it must not hold threads, locks or SQLite
+    # connections across fork()
+    application.llm_service.cache_service.before_fork()
+    application.setup_logging(queued=False)
+
+    coview_model = application.llm_service.coview_model
+    coview_dir = None
+    if coview_model is not None and workers > 1:
+        if not coview_model.snapshot_path:
+            # the workers share the model through a snapshot, even when it is
+            # not kept across restarts
+            coview_dir = tempfile.mkdtemp(prefix='coview-')
+            coview_model.snapshot_path = os.path.join(coview_dir, 'coview.npz')
+        application.coview_spool_path = coview_model.snapshot_path + '.spool.jsonl'
+    log.info("server.starting", host=args.host, port=args.port, workers=workers,
+             products=len(application.product_service.get_all_products()),
+             snapshot=config['CATALOG_SNAPSHOT_PATH'] or None)
+
+    # keep the garbage collector from touching (and so copying) the pages of
+    # objects loaded so far in every worker
+    gc.collect()
+    gc.freeze()
+    try:
+        return Master(application, sock, workers).run()
+    finally:
+        if coview_dir is not None:
+            shutil.rmtree(coview_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,442 @@
+"""
+Storage backends for the recommendation cache.
+
+LLMCacheService encodes entries (and keeps the in-memory tier); a backend
+stores the encoded bytes under the cache key:
+
+    file   cache files in a local directory with a SQLite index (one host)
+    redis  a Redis-protocol server shared by every node of the fleet
+
+Select one with config['CACHE_BACKEND'], see make_cache_backend.
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+
+from .cache_index import CacheIndex
+from .resp_client import RespError, RespPool
+from .structured_logging import get_logger
+
+log = get_logger(__name__)
+
+
+class CacheBackend(ABC):
+    """
+    Byte values under string keys, each with a time-to-live
+
+    Backends expire entries on their own schedule (Redis as soon as the TTL
+    is over, the file cache in sweeps), so get() may still return an entry
+    whose TTL just ran out; readers check the timestamp stored in the entry.
+    Methods raise on backend failures (I/O errors, lost connections).
+    """
+
+    name = None
+
+    @abstractmethod
+    def get(self, key):
+        """
+        Returns:
+        - bytes or None: The stored value, None if there is none
+        """
+
+    def get_many(self, keys):
+        """
+        Returns:
+        - list: The value or None for each key, in order
+        """
+        return [self.get(key) for key in keys]
+
+    @abstractmethod
+    def set(self, key, value, ttl_seconds):
+        """
+        Store a value, replacing any previous one
+
+        Parameters:
+        - key (str): Cache key
+        - value (bytes): Encoded entry
+        - ttl_seconds (float): Time until the entry expires
+        """
+
+    @abstractmethod
+    def delete(self, key):
+        """
+        Returns:
+        - bool: True if an entry was removed
+        """
+
+    def delete_many(self, keys):
+        """
+        Returns:
+        - int: Number of entries removed
+        """
+        return sum(1 for key in keys if self.delete(key))
+
+    @abstractmethod
+    def ttl(self, key):
+        """
+        Returns:
+        - float or None: Seconds until the entry expires (negative once it has
+          expired but was not removed yet), None if there is no entry
+        """
+
+    def ttl_many(self, keys):
+        """
+        Returns:
+        - list: The ttl() of each key, in order
+        """
+        return [self.ttl(key) for key in keys]
+
+    def clear_expired(self, max_entries=None, batch_size=1000):
+        """
+        Remove expired entries, for backends that do not expire them by themselves
+
+        Returns:
+        - int: Number of entries removed
+        """
+        return 0
+
+    @abstractmethod
+    def clear(self, batch_size=1000):
+        """
+        Remove all entries
+
+        Returns:
+        - int: Number of entries removed
+        """
+
+    @abstractmethod
+    def stats(self):
+        """
+        Returns:
+        - dict: backend name, entries, expired_entries and size_bytes, plus
+          backend-specific details
+        """
+
+    def before_fork(self):
+        """Release threads and connections before worker processes are forked"""
+
+    def after_fork(self):
+        """Reacquire what before_fork released, in a forked worker"""
+
+    def close(self):
+        """Release connections and files"""
+
+
+class FileCacheBackend(CacheBackend):
+    """
+    Cache files in a local directory.
+
+    Files are sharded into subdirectories by the first two hex digits of the
+    key, and a SQLite index (key, timestamp, size) next to them answers
+    statistics and expiry queries without opening any cache file. Files are
+    written atomically (temp file + os.replace), so worker processes on the
+    same host can share the directory.
+    """
+
+    name = 'file'
+    INDEX_FILENAME = 'index.sqlite3'
+
+    def __init__(self, cache_dir="cache", ttl_seconds=24 * 3600):
+        """
+        Parameters:
+        - cache_dir (str): Directory to store cache files
+        - ttl_seconds (float): Default lifetime of an entry; the index sweeps by
+          write time against it
+        """
+        self.cache_dir = cache_dir
+        self.ttl_seconds = float(ttl_seconds)
+
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+        self.index = CacheIndex(os.path.join(cache_dir, self.INDEX_FILENAME))
+        self._known_shards = set()
+
+        # move flat-layout files into shards (and index existing shards when the
+        # index is new) without holding up startup
+        self._reconcile_thread = threading.Thread(target=self._reconcile, name='cache-reconcile', daemon=True)
+        self._reconcile_thread.start()
+
+    def path(self, key):
+        """Get the file path for a cache key"""
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _ensure_shard(self, key):
+        """Create the shard directory for a key once per process"""
+        shard = key[:2]
+        if shard not in self._known_shards:
+            os.makedirs(os.path.join(self.cache_dir, shard), exist_ok=True)
+            self._known_shards.add(shard)
+
+    def _reconcile(self):
+        """
+        Bring the directory and the index in line
+
+        Cache files from the old flat layout are moved into their shard and
+        indexed with the timestamp stored in them. If the index was just created,
+        files already in shards are indexed by modification time.
+        """
+        try:
+            rows = []
+            # entries written since startup are newer than anything found here
+            # by modification time, so discovered shard files never replace them
+            discovered = []
+            for entry in os.scandir(self.cache_dir):
+                if entry.is_file() and entry.name.endswith('.json'):
+                    key = entry.name[:-len('.json')]
+                    try:
+                        with open(entry.path, 'r') as f:
+                            timestamp = json.load(f).get('timestamp', 0)
+                        self._ensure_shard(key)
+                        target = self.path(key)
+                        os.replace(entry.path, target)
+                        rows.append((key, timestamp, os.path.getsize(target)))
+                    except Exception as e:
+                        log.warning('cache.migrate_failed', file=entry.name, error=str(e))
+                elif self.index.created and entry.is_dir() and len(entry.name) == 2:
+                    for shard_entry in os.scandir(entry.path):
+                        if shard_entry.name.endswith('.json'):
+                            stat = shard_entry.stat()
+                            discovered.append((shard_entry.name[:-len('.json')], stat.st_mtime, stat.st_size))
+                if len(rows) >= 1000:
+                    self.index.put_many(rows)
+                    rows = []
+                if len(discovered) >= 1000:
+                    self.index.put_many(discovered, replace=False)
+                    discovered = []
+            if rows:
+                self.index.put_many(rows)
+            if discovered:
+                self.index.put_many(discovered, replace=False)
+        except Exception as e:
+            log.warning('cache.reconcile_failed', error=str(e))
+
+    def _write_atomic(self, cache_file, data):
+        """
+        Write a file so readers see either the old or the new content, never a
+        partial one: write a temp file in the same directory, then rename it
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(cache_file), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, cache_file)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def get(self, key):
+        try:
+            with open(self.path(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def set(self, key, value, ttl_seconds):
+        self._ensure_shard(key)
+        self._write_atomic(self.path(key), value)
+        # the index sweeps by write time against the default TTL; shift the
+        # recorded time so that an entry with another TTL expires on time
+        self.index.put(key, time.time() - (self.ttl_seconds - ttl_seconds), len(value))
+
+    def delete(self, key):
+        return self.delete_many([key]) == 1
+
+    def delete_many(self, keys):
+        removed = 0
+        for key in keys:
+            try:
+                os.remove(self.path(key))
+                removed += 1
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                log.warning('cache.delete_failed', key=key, error=str(e))
+        self.index.delete_many(keys)
+        return removed
+
+    def ttl(self, key):
+        timestamp = self.index.timestamp(key)
+        return None if timestamp is None else timestamp + self.ttl_seconds - time.time()
+
+    def ttl_many(self, keys):
+        timestamps = self.index.timestamps(list(keys))
+        now = time.time()
+        return [None if key not in timestamps else timestamps[key] + self.ttl_seconds - now for key in keys]
+
+    def clear_expired(self, max_entries=None, batch_size=1000):
+        cleared_count = 0
+        cutoff = time.time() - self.ttl_seconds
+
+        while max_entries is None or cleared_count < max_entries:
+            limit = batch_size if max_entries is None else min(batch_size, max_entries - cleared_count)
+            keys = self.index.expired_keys(cutoff, limit)
+            if not keys:
+                break
+            self.delete_many(keys)
+            cleared_count += len(keys)
+
+        return cleared_count
+
+    def clear(self, batch_size=1000):
+        cleared_count = 0
+        while True:
+            keys = self.index.keys(batch_size)
+            if not keys:
+                break
+            self.delete_many(keys)
+            cleared_count += len(keys)
+        return cleared_count
+
+    def stats(self):
+        entries, size, expired = self.index.stats(time.time() - self.ttl_seconds)
+        return {
+            'backend': self.name,
+            'entries': entries,
+            'expired_entries': expired,
+            'size_bytes': size,
+            'cache_dir': self.cache_dir
+        }
+
+    def before_fork(self):
+        # SQLite connections must not be carried across fork()
+        self._reconcile_thread.join()
+        self.index.close()
+
+    def after_fork(self):
+        self.index.reopen()
+
+    def close(self):
+        self.index.close()
+
+
+class RedisCacheBackend(CacheBackend):
+    """
+    Entries on a Redis-protocol server, shared by every node.
+
+    Keys are namespaced with key_prefix and expire on the server (SET ... PX).
+    Bulk reads and deletes go out as one pipeline of MGET/DEL commands over a
+    pooled connection. stats() reports the whole database, so the cache is
+    best given a database of its own.
+    """
+
+    name = 'redis'
+    # keys per MGET/DEL command within a pipeline
+    CHUNK_SIZE = 256
+
+    def __init__(self, url='redis://localhost:6379/0', key_prefix='reco:', max_connections=16, timeout=2.0):
+        """
+        Parameters:
+        - url (str): redis://[:password@]host[:port][/db]
+        - key_prefix (str): Prepended to every cache key
+        - max_connections (int): Pool size per process
+        - timeout (float): Seconds for connecting and for each reply
+        """
+        self.url = url
+        self.key_prefix = key_prefix
+        self.pool = RespPool.from_url(url, max_connections=max_connections, timeout=timeout)
+
+    def _chunks(self, keys):
+        return [keys[i:i + self.CHUNK_SIZE] for i in range(0, len(keys), self.CHUNK_SIZE)]
+
+    def _pipeline(self, commands):
+        replies = self.pool.pipeline(commands)
+        for reply in replies:
+            if isinstance(reply, RespError):
+                raise reply
+        return replies
+
+    def get(self, key):
+        return self.pool.execute('GET', self.key_prefix + key)
+
+    def get_many(self, keys):
+        if not keys:
+            return []
+        chunks = self._chunks([self.key_prefix + key for key in keys])
+        replies = self._pipeline([('MGET', *chunk) for chunk in chunks])
+        return [value for reply in replies for value in reply]
+
+    def set(self, key, value, ttl_seconds):
+        self.pool.execute('SET', self.key_prefix + key, value, 'PX', max(1, int(ttl_seconds * 1000)))
+
+    def delete(self, key):
+        return self.pool.execute('DEL', self.key_prefix + key) > 0
+
+    def delete_many(self, keys):
+        if not keys:
+            return 0
+        chunks = self._chunks([self.key_prefix + key for key in keys])
+        return sum(self._pipeline([('DEL', *chunk) for chunk in chunks]))
+
+    def ttl(self, key):
+        remaining = self.pool.execute('PTTL', self.key_prefix + key)
+        if remaining == -2:
+            return None
+        # -1: stored without a TTL by someone else
+        return float('inf') if remaining < 0 else remaining / 1000
+
+    def ttl_many(self, keys):
+        if not keys:
+            return []
+        # PTTL takes a single key; send them all as one pipeline
+        replies = self._pipeline([('PTTL', self.key_prefix + key) for key in keys])
+        return [None if remaining == -2 else float('inf') if remaining < 0 else remaining / 1000
+                for remaining in replies]
+
+    def clear(self, batch_size=1000):
+        # escape glob characters: the prefix must match literally
+        pattern = ''.join('\\' + c if c in '*?[]\\' else c for c in self.key_prefix) + '*'
+        cleared_count = 0
+        cursor = b'0'
+        while True:
+            cursor, keys = self.pool.execute('SCAN', cursor, 'MATCH', pattern, 'COUNT', batch_size)
+            if keys:
+                cleared_count += self.pool.execute('DEL', *keys)
+            if cursor == b'0':
+                return cleared_count
+
+    def stats(self):
+        entries, info = self._pipeline([('DBSIZE',), ('INFO', 'memory')])
+        memory = dict(
+            line.split(':', 1) for line in info.decode().splitlines() if ':' in line and not line.startswith('#')
+        )
+        return {
+            'backend': self.name,
+            'entries': entries,
+            'expired_entries': 0,
+            'size_bytes': int(memory.get('used_memory', 0)),
+            'url': self.pool.host + ':' + str(self.pool.port) + '/' + str(self.pool.db)
+        }
+
+    def before_fork(self):
+        self.pool.close()
+
+    def close(self):
+        self.pool.close()
+
+
+def make_cache_backend(kind, cache_dir='cache', ttl_seconds=24 * 3600, url='redis://localhost:6379/0',
+                       key_prefix='reco:', max_connections=16, timeout=2.0):
+    """
+    Create the backend named by config['CACHE_BACKEND']
+
+    Parameters:
+    - kind (str): 'file' or 'redis'
+    - cache_dir (str), ttl_seconds (float): For the file backend
+    - url, key_prefix, max_connections, timeout: For the redis backend
+
+    Returns:
+    - CacheBackend: The backend
+    """
+    if kind == 'file':
+        return FileCacheBackend(cache_dir=cache_dir, ttl_seconds=ttl_seconds)
+    if kind == 'redis':
+        return RedisCacheBackend(url=url, key_prefix=key_prefix, max_connections=max_connections, timeout=timeout)
+    raise ValueError(f"Unsupported cache backend: {kind}")
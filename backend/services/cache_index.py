@@ -0,0 +1,164 @@
+import os
+import sqlite3
+import threading
+
+
+class CacheIndex:
+    """
+    Compact on-disk index of the cache entries, stored in SQLite.
+
+    Keeps one row per entry (key, timestamp, size) plus running totals that
+    triggers maintain, so statistics and expiry never have to open the cache
+    files themselves.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS entries (
+            key TEXT PRIMARY KEY,
+            timestamp REAL NOT NULL,
+            size INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS entries_timestamp ON entries (timestamp);
+        CREATE TABLE IF NOT EXISTS totals (
+            id INTEGER PRIMARY KEY CHECK (id = 0),
+            entries INTEGER NOT NULL,
+            size INTEGER NOT NULL
+        );
+        INSERT OR IGNORE INTO totals (id, entries, size) VALUES (0, 0, 0);
+        CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries BEGIN
+            UPDATE totals SET entries = entries + 1, size = size + NEW.size WHERE id = 0;
+        END;
+        CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries BEGIN
+            UPDATE totals SET entries = entries - 1, size = size - OLD.size WHERE id = 0;
+        END;
+        CREATE TRIGGER IF NOT EXISTS entries_update AFTER UPDATE ON entries BEGIN
+            UPDATE totals SET size = size - OLD.size + NEW.size WHERE id = 0;
+        END;
+    """
+
+    def __init__(self, path):
+        """
+        Open (or create) the index database
+
+        Parameters:
+        - path (str): Location of the SQLite file
+        """
+        self.path = path
+        self.created = not os.path.exists(path)
+        self._lock = threading.Lock()
+        self._connect()
+        with self._lock:
+            self._conn.executescript(self.SCHEMA)
+
+    def _connect(self):
+        # WAL lets every worker process read while one of them writes; writers
+        # wait up to the timeout for each other
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+
+    def reopen(self):
+        """
+        Open a new connection after close(), e.g. in a forked worker process;
+        SQLite connections must not be carried across fork()
+        """
+        with self._lock:
+            self._connect()
+
+    def put(self, key, timestamp, size):
+        """Record or refresh an entry"""
+        with self._lock:
+            # an upsert keeps the update trigger in charge of the size delta
+            self._conn.execute(
+                "INSERT INTO entries (key, timestamp, size) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET timestamp = excluded.timestamp, size = excluded.size",
+                (key, timestamp, size)
+            )
+
+    def put_many(self, rows, replace=True):
+        """
+        Record (key, timestamp, size) rows in one transaction
+
+        With replace=False, keys that are already indexed keep their row.
+        """
+        conflict = "DO UPDATE SET timestamp = excluded.timestamp, size = excluded.size" if replace else "DO NOTHING"
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT INTO entries (key, timestamp, size) VALUES (?, ?, ?) "
+                    f"ON CONFLICT(key) {conflict}",
+                    rows
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def delete_many(self, keys):
+        """Remove entries by key"""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany("DELETE FROM entries WHERE key = ?", [(k,) for k in keys])
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def timestamp(self, key):
+        """Write time of an entry, None if it is not indexed"""
+        with self._lock:
+            row = self._conn.execute("SELECT timestamp FROM entries WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def timestamps(self, keys, chunk_size=500):
+        """
+        Write times of several entries, queried in chunks of keys
+
+        Returns:
+        - dict: key -> timestamp, for the keys that are indexed
+        """
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), chunk_size):
+                chunk = keys[i:i + chunk_size]
+                found.update(self._conn.execute(
+                    f"SELECT key, timestamp FROM entries WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall())
+        return found
+
+    def expired_keys(self, cutoff, limit):
+        """Keys of up to `limit` entries written before cutoff, oldest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key FROM entries WHERE timestamp < ? ORDER BY timestamp LIMIT ?",
+                (cutoff, limit)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def keys(self, limit, after=''):
+        """Up to `limit` keys greater than `after`, in key order"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key FROM entries WHERE key > ? ORDER BY key LIMIT ?", (after, limit)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def stats(self, cutoff):
+        """
+        Running totals and the number of entries written before cutoff
+
+        Returns:
+        - tuple: (entries, total size in bytes, expired entries)
+        """
+        with self._lock:
+            entries, size = self._conn.execute("SELECT entries, size FROM totals WHERE id = 0").fetchone()
+            expired = self._conn.execute(
+                "SELECT COUNT(*) FROM entries WHERE timestamp < ?", (cutoff,)
+            ).fetchone()[0]
+        return entries, size, expired
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
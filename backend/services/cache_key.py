@@ -0,0 +1,147 @@
+import threading
+
+
+class CacheKeyCanonicalizer:
+    """
+    Reduce a recommendation request to a canonical form before it is hashed.
+
+    Requests that only differ in ways that do not matter (or that we choose
+    to ignore) then share one cache entry. Each rule can be switched off:
+
+    - facets: categories and brands sorted and deduplicated
+    - unknown_ids: history IDs that are not in the catalog dropped
+    - history_dedupe: repeated views collapsed to the most recent one
+    - history_limit: only the last N distinct products kept
+    - history_order: history sorted, so the viewing order does not matter
+    - price_bucket: priceRange widened to the enclosing configured bucket edges
+
+    The canonical request is also what gets sent to the LLM, so a cached
+    answer is always the answer for its key.
+    """
+
+    RULES = ('facets', 'unknown_ids', 'history_dedupe', 'history_limit', 'history_order', 'price_bucket')
+
+    def __init__(self, product_service=None, sort_facets=True, drop_unknown_ids=True, history_dedupe=True,
+                 history_limit=20, history_order_insensitive=False, price_buckets=None):
+        """
+        Initialize the canonicalizer
+
+        Parameters:
+        - product_service (ProductService): Catalog used to drop unknown IDs
+        - sort_facets (bool): Sort and deduplicate categories and brands
+        - drop_unknown_ids (bool): Drop history IDs missing from the catalog
+        - history_dedupe (bool): Collapse repeated views of a product to the
+          most recent one
+        - history_limit (int): Keep the last N viewed products (distinct ones
+          with history_dedupe), 0 keeps all of them
+        - history_order_insensitive (bool): Ignore the order of the history
+        - price_buckets (list): Ascending price edges to snap ranges to, e.g.
+          [0, 50, 100, 200]; empty or None leaves ranges alone
+        """
+        self.product_service = product_service
+        self.sort_facets = sort_facets
+        self.drop_unknown_ids = drop_unknown_ids and product_service is not None
+        self.history_dedupe = history_dedupe
+        self.history_limit = int(history_limit or 0)
+        self.history_order_insensitive = history_order_insensitive
+        self.price_buckets = sorted(float(edge) for edge in price_buckets or [])
+        self._lock = threading.Lock()
+        self._stats = {rule: {'applied': 0, 'hits': 0} for rule in self.RULES}
+
+    def canonicalize(self, user_preferences, browsing_history):
+        """
+        Canonical form of a request
+
+        Returns:
+        - tuple: (user_preferences, browsing_history, names of the rules that
+          changed something)
+        """
+        applied = []
+        preferences = dict(user_preferences)
+
+        if self.sort_facets:
+            for facet in ('categories', 'brands'):
+                values = preferences.get(facet)
+                if isinstance(values, list):
+                    canonical = sorted(set(values))
+                    if canonical != values:
+                        preferences[facet] = canonical
+                        if 'facets' not in applied:
+                            applied.append('facets')
+
+        if self.price_buckets:
+            snapped = self._snap_price_range(preferences.get('priceRange'))
+            if snapped is not None and snapped != preferences.get('priceRange'):
+                preferences['priceRange'] = snapped
+                applied.append('price_bucket')
+
+        history = list(browsing_history)
+        if self.drop_unknown_ids:
+            known = self.product_service.products_by_id
+            kept = [pid for pid in history if pid in known]
+            if len(kept) != len(history):
+                history = kept
+                applied.append('unknown_ids')
+
+        if self.history_dedupe:
+            # most recent view of each product, oldest first
+            seen = set()
+            distinct = []
+            for pid in reversed(history):
+                if pid not in seen:
+                    seen.add(pid)
+                    distinct.append(pid)
+            distinct.reverse()
+            if len(distinct) != len(history):
+                history = distinct
+                applied.append('history_dedupe')
+
+        if self.history_limit and len(history) > self.history_limit:
+            history = history[-self.history_limit:]
+            applied.append('history_limit')
+
+        if self.history_order_insensitive:
+            ordered = sorted(history)
+            if ordered != history:
+                history = ordered
+                applied.append('history_order')
+
+        return preferences, history, applied
+
+    def _snap_price_range(self, price_range):
+        """Widen 'min-max' to the bucket edges around it; None if not a range"""
+        if not isinstance(price_range, str) or price_range == 'all':
+            return None
+        try:
+            low, high = map(float, price_range.split('-'))
+        except ValueError:
+            return None
+
+        edges = self.price_buckets
+        low_edge = max((edge for edge in edges if edge <= low), default=low)
+        high_edge = min((edge for edge in edges if edge >= high), default=high)
+        return f"{low_edge:g}-{high_edge:g}"
+
+    def record(self, applied, hit):
+        """Count one cache lookup for each rule that changed its request"""
+        if not applied:
+            return
+        with self._lock:
+            for rule in applied:
+                self._stats[rule]['applied'] += 1
+                if hit:
+                    self._stats[rule]['hits'] += 1
+
+    def get_stats(self):
+        """
+        Per-rule lookup counters
+
+        Returns:
+        - dict: For each rule, how many lookups it changed, how many of those
+          were hits, and that hit rate
+        """
+        with self._lock:
+            return {
+                rule: dict(counts, hit_rate=round(counts['hits'] / counts['applied'], 3) if counts['applied'] else 0.0)
+                for rule, counts in self._stats.items()
+            }
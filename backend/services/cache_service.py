@@ -1,51 +1,260 @@
-import datetime
+import asyncio
 import hashlib
 import json
-import os
+import threading
 import time
+import zlib
+from collections import OrderedDict
+
+from .cache_backends import FileCacheBackend
+from .cache_key import CacheKeyCanonicalizer
+from .catalog_snapshot import json_default
+from .metrics import span
+from .structured_logging import get_logger
+
+log = get_logger(__name__)
 
 
 class LLMCacheService:
     """
     Service to cache LLM responses to improve performance and reduce API costs.
-    Implements a simple file-based caching system with TTL (time-to-live).
+    Entries have a TTL (time-to-live) and are stored by a backend: local cache
+    files by default, or a shared server (see cache_backends).
+
+    A bounded in-memory LRU (L1) sits in front of the backend (L2), so hot
+    keys are answered without any I/O.
+
+    When a product service is available, entries store product IDs only and
+    are rehydrated from the catalog on read; they can also be zlib-compressed.
     """
+
+    ENTRY_FORMAT = 2
     
-    def __init__(self, cache_dir="cache", ttl_hours=24):
+    def __init__(self, cache_dir="cache", ttl_hours=24, memory_max_entries=1024,
+                 memory_max_bytes=64 * 1024 * 1024, product_service=None,
+                 compression='none', compression_level=6, canonicalizer=None, backend=None):
         """
         Initialize the cache service
         
         Parameters:
         - cache_dir (str): Directory to store cache files
         - ttl_hours (int): Time-to-live for cache entries in hours
+        - memory_max_entries (int): Entry limit of the in-memory LRU, 0 disables it
+        - memory_max_bytes (int): Size limit of the in-memory LRU, counted in
+          serialized JSON bytes
+        - product_service (ProductService): Catalog used to rehydrate compact
+          entries; without it entries keep full product payloads
+        - compression (str): 'zlib' to compress entries, 'none' to store plain JSON
+        - compression_level (int): zlib level, 1 (fast) to 9 (small)
+        - canonicalizer (CacheKeyCanonicalizer): Request canonicalization applied
+          before hashing; defaults to the standard rules
+        - backend (CacheBackend): Where entries are stored; defaults to cache
+          files in cache_dir
         """
-        self.cache_dir = cache_dir
+        if compression not in ('none', 'zlib'):
+            raise ValueError(f"Unsupported cache compression: {compression}")
+
         self.ttl_hours = float(ttl_hours)
-        
-        if not os.path.exists(cache_dir):
-            os.makedirs(cache_dir)
+        self.backend = backend or FileCacheBackend(cache_dir, ttl_seconds=self.ttl_hours * 3600)
+        self.product_service = product_service
+        self.canonicalizer = canonicalizer or CacheKeyCanonicalizer(product_service)
+        self.compression = compression
+        self.compression_level = int(compression_level)
+
+        # L1: cache_key -> (timestamp, recommendations, size in bytes)
+        self.memory_max_entries = int(memory_max_entries)
+        self.memory_max_bytes = int(memory_max_bytes)
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._memory_lock = threading.Lock()
+        self._lookup_stats = {'l1_hits': 0, 'l2_hits': 0, 'misses': 0, 'expired': 0}
+        self._sweeper = None
+        self._sweeper_stop = threading.Event()
     
-    def _generate_cache_key(self, user_preferences, browsing_history):
+    def _lookup_key(self, user_preferences, browsing_history):
         """
-        Generate a unique cache key based on user preferences and browsing history
-        
+        Cache key of a request and the canonicalization rules that changed it
+
         Returns:
-        - str: A hash that uniquely identifies this recommendation request
+        - tuple: (cache key, list of rule names)
         """
+        user_preferences, browsing_history, applied = self.canonicalizer.canonicalize(
+            user_preferences, browsing_history
+        )
 
         key_data = {
             "preferences": user_preferences,
             "browsing_history": browsing_history,
-            "version": "1.0"
+            # entries from an older catalog are never served for a newer one
+            "version": self.product_service.version if self.product_service is not None else "1.0"
         }
         
         key_str = json.dumps(key_data, sort_keys=True)
-        return hashlib.md5(key_str.encode()).hexdigest()
+        return hashlib.md5(key_str.encode()).hexdigest(), applied
+
+    def _generate_cache_key(self, user_preferences, browsing_history):
+        """
+        Generate a unique cache key based on user preferences and browsing history
+
+        The request is canonicalized first, so equivalent requests share a key.
+
+        Returns:
+        - str: A hash that uniquely identifies this recommendation request
+        """
+        return self._lookup_key(user_preferences, browsing_history)[0]
+
+    def canonicalize(self, user_preferences, browsing_history):
+        """
+        Canonical form of a request, the one its cache key is computed from
+
+        Returns:
+        - tuple: (user_preferences, browsing_history)
+        """
+        user_preferences, browsing_history, _ = self.canonicalizer.canonicalize(
+            user_preferences, browsing_history
+        )
+        return user_preferences, browsing_history
     
-    def _get_cache_file_path(self, cache_key):
-        """Get the file path for a cache key"""
-        return os.path.join(self.cache_dir, f"{cache_key}.json")
+    def get_cache_key(self, user_preferences, browsing_history):
+        """
+        Public access to the cache key, for callers that deduplicate work on it
+        """
+        return self._generate_cache_key(user_preferences, browsing_history)
     
+    def _encode_entry(self, timestamp, recommendations):
+        """
+        Serialize a cache entry
+
+        With a product service, each recommendation keeps only its product ID
+        next to the explanation and score.
+
+        Returns:
+        - tuple: (bytes to write, length of the uncompressed JSON)
+        """
+        if self.product_service is not None:
+            compact = dict(recommendations)
+            compact['recommendations'] = [
+                {
+                    'product_id': rec['product']['id'],
+                    'explanation': rec.get('explanation', ''),
+                    'confidence_score': rec.get('confidence_score')
+                }
+                for rec in recommendations.get('recommendations', [])
+            ]
+            cache_data = {'format': self.ENTRY_FORMAT, 'timestamp': timestamp, 'recommendations': compact}
+        else:
+            cache_data = {'timestamp': timestamp, 'recommendations': recommendations}
+
+        raw = json.dumps(cache_data, separators=(',', ':'), default=json_default).encode()
+        if self.compression == 'zlib':
+            return zlib.compress(raw, self.compression_level), len(raw)
+        return raw, len(raw)
+
+    def _decode_entry(self, raw):
+        """
+        Parse a cache entry written in any supported format
+
+        Compressed entries are told apart by their first byte: plain JSON
+        entries always start with '{'.
+
+        Returns:
+        - tuple: (timestamp, recommendations dict, length of the uncompressed JSON)
+        """
+        if raw[:1] != b'{':
+            raw = zlib.decompress(raw)
+        cache_data = json.loads(raw)
+        recommendations = cache_data.get('recommendations')
+
+        if cache_data.get('format') == self.ENTRY_FORMAT and recommendations:
+            recommendations = self._rehydrate(recommendations)
+        return cache_data.get('timestamp', 0), recommendations, len(raw)
+
+    def _rehydrate(self, compact):
+        """
+        Replace product IDs in a compact entry with the current catalog records,
+        dropping products that no longer exist
+        """
+        if self.product_service is None:
+            raise ValueError("Compact cache entry needs a product service to rehydrate")
+
+        recommendations = []
+        for rec in compact.get('recommendations', []):
+            product = self.product_service.get_product_by_id(rec['product_id'])
+            if product is not None:
+                recommendations.append({
+                    'product': product,
+                    'explanation': rec.get('explanation', ''),
+                    'confidence_score': rec.get('confidence_score')
+                })
+
+        result = dict(compact)
+        result['recommendations'] = recommendations
+        if 'count' in result:
+            result['count'] = len(recommendations)
+        return result
+
+    def _memory_get(self, cache_key):
+        """
+        Look a key up in the in-memory LRU
+
+        Returns:
+        - dict or None: A shallow copy of the cached recommendations, None on a
+          miss or if the entry has expired (it is dropped then)
+        """
+        with self._memory_lock:
+            entry = self._memory.get(cache_key)
+            if entry is None:
+                return None
+
+            timestamp, recommendations, size = entry
+            if time.time() - timestamp > self.ttl_hours * 3600:
+                del self._memory[cache_key]
+                self._memory_bytes -= size
+                return None
+
+            self._memory.move_to_end(cache_key)
+            self._lookup_stats['l1_hits'] += 1
+            # callers tag the result (e.g. 'cached'), keep the stored dict clean
+            return dict(recommendations)
+
+    def _memory_put(self, cache_key, timestamp, recommendations, size):
+        """
+        Store an entry in the in-memory LRU and evict the least recently used
+        entries until it is back within its entry and byte limits
+        """
+        if self.memory_max_entries <= 0 or size > self.memory_max_bytes:
+            return
+
+        with self._memory_lock:
+            old = self._memory.pop(cache_key, None)
+            if old is not None:
+                self._memory_bytes -= old[2]
+
+            self._memory[cache_key] = (timestamp, recommendations, size)
+            self._memory_bytes += size
+
+            while len(self._memory) > self.memory_max_entries or self._memory_bytes > self.memory_max_bytes:
+                _, (_, _, evicted_size) = self._memory.popitem(last=False)
+                self._memory_bytes -= evicted_size
+
+    def _memory_clear(self, expired_only=False):
+        """
+        Drop all entries, or only the expired ones, from the in-memory LRU
+        """
+        with self._memory_lock:
+            if not expired_only:
+                self._memory.clear()
+                self._memory_bytes = 0
+                return
+
+            cutoff = time.time() - self.ttl_hours * 3600
+            for cache_key in [k for k, entry in self._memory.items() if entry[0] < cutoff]:
+                self._memory_bytes -= self._memory.pop(cache_key)[2]
+
+    def _count(self, stat):
+        with self._memory_lock:
+            self._lookup_stats[stat] += 1
+
     def get_cached_recommendations(self, user_preferences, browsing_history):
         """
         Try to get cached recommendations for the given parameters
@@ -53,33 +262,67 @@ class LLMCacheService:
         Returns:
         - dict or None: Cached recommendations if found and valid, None otherwise
         """
-        cache_key = self._generate_cache_key(user_preferences, browsing_history)
-        cache_file = self._get_cache_file_path(cache_key)
-        
-        # checking for cache file
-        if not os.path.exists(cache_file):
+        cache_key, applied = self._lookup_key(user_preferences, browsing_history)
+        cached = self._read_entry(cache_key)
+        self.canonicalizer.record(applied, cached is not None)
+        return cached
+
+    def _read_entry(self, cache_key):
+        """
+        Cached recommendations for a key, from L1 or the backend
+
+        Returns:
+        - dict or None: Cached recommendations if found and valid, None otherwise
+        """
+        # L1 hits do no I/O at all, not even logging
+        cached = self._memory_get(cache_key)
+        if cached is not None:
+            return cached
+
+        try:
+            raw = self.backend.get(cache_key)
+        except Exception as e:
+            self._count('misses')
+            log.warning('cache.read_failed', backend=self.backend.name, error=str(e))
             return None
-        
+        return self._load_entry(cache_key, raw)
+
+    def _load_entry(self, cache_key, raw):
+        """
+        Decode an entry read from the backend and promote it to L1
+
+        Returns:
+        - dict or None: Cached recommendations, None if raw is None, expired
+          or unreadable
+        """
+        if raw is None:
+            self._count('misses')
+            return None
+
         try:
-            # reading cache file
-            with open(cache_file, 'r') as f:
-                cache_data = json.load(f)
+            timestamp, recommendations, size = self._decode_entry(raw)
             
-            # checking expiry of cache file
-            timestamp = cache_data.get('timestamp', 0)
+            # checking expiry of the entry
             current_time = time.time()
             ttl_seconds = self.ttl_hours * 3600
             
             if current_time - timestamp > ttl_seconds:
-                print(f"Cache expired for key: {cache_key}")
+                self._count('expired')
+                log.debug('cache.expired', key=cache_key)
                 return None
             
-            # return cached recommendations
-            print(f"Cache hit for key: {cache_key}")
-            return cache_data.get('recommendations')
+            # return cached recommendations, promoting them to L1
+            log.debug('cache.hit', key=cache_key)
+            self._count('l2_hits')
+            if recommendations:
+                self._memory_put(cache_key, timestamp, recommendations, size)
+                return dict(recommendations)
+            return recommendations
         
         except Exception as e:
-            print(f"Error reading cache: {str(e)}")
+            # an unreadable entry is a miss; the next write replaces it
+            self._count('misses')
+            log.warning('cache.read_failed', error=str(e))
             return None
     
     def cache_recommendations(self, user_preferences, browsing_history, recommendations):
@@ -95,134 +338,226 @@ class LLMCacheService:
         - bool: True if successfully cached, False otherwise
         """
         cache_key = self._generate_cache_key(user_preferences, browsing_history)
-        cache_file = self._get_cache_file_path(cache_key)
         
-        try:
-            #  cache data structure
-            cache_data = {
-                'timestamp': time.time(),
-                'recommendations': recommendations,
-                'metadata': {
-                    'cache_date': datetime.datetime.now().isoformat(),
-                    'expires_at': (datetime.datetime.now() + datetime.timedelta(hours=self.ttl_hours)).isoformat(),
-                    'preferences': user_preferences,
-                    'browsing_history_count': len(browsing_history)
-                }
-            }
-            
-            # write to cache file
-            with open(cache_file, 'w') as f:
-                json.dump(cache_data, f)
-            
-            print(f"Cached recommendations for key: {cache_key}")
-            return True
-        
-        except Exception as e:
-            print(f"Error writing cache: {str(e)}")
-            return False
+        with span('cache_write'):
+            try:
+                timestamp = time.time()
+                data, size = self._encode_entry(timestamp, recommendations)
+
+                # write to the backend and through to L1
+                self.backend.set(cache_key, data, self.ttl_hours * 3600)
+                self._memory_put(cache_key, timestamp, recommendations, size)
+
+                log.debug('cache.write', key=cache_key)
+                return True
+
+            except Exception as e:
+                log.error('cache.write_failed', backend=self.backend.name, error=str(e))
+                return False
     
-    def clear_expired_cache(self):
+    async def aget_cached_recommendations(self, user_preferences, browsing_history):
         """
-        Clear all expired cache entries
-        
+        Non-blocking get_cached_recommendations; L1 hits are answered inline,
+        the backend read runs in a worker thread
+        """
+        cache_key, applied = self._lookup_key(user_preferences, browsing_history)
+        cached = self._memory_get(cache_key)
+        if cached is not None:
+            self.canonicalizer.record(applied, True)
+            return cached
+        return await asyncio.to_thread(self.get_cached_recommendations, user_preferences, browsing_history)
+
+    def get_entry_age(self, user_preferences, browsing_history):
+        """
+        Seconds since the entry for a request was written, from the TTL the
+        backend has left on it
+
         Returns:
-        - int: Number of cache entries cleared
+        - float or None: Age of the entry, None if there is none
+        """
+        return self.get_entry_ages([(user_preferences, browsing_history)])[0]
+
+    def get_entry_ages(self, requests):
         """
-        cleared_count = 0
-        current_time = time.time()
+        get_entry_age for several requests, with one bulk TTL lookup
+
+        Parameters:
+        - requests (list): (user_preferences, browsing_history) pairs
+
+        Returns:
+        - list: Age in seconds or None, in the order of requests
+        """
+        keys = [self._generate_cache_key(prefs, history) for prefs, history in requests]
         ttl_seconds = self.ttl_hours * 3600
-        
-        for filename in os.listdir(self.cache_dir):
-            if not filename.endswith('.json'):
-                continue
-                
-            cache_file = os.path.join(self.cache_dir, filename)
-            
+        return [None if remaining is None else ttl_seconds - remaining for remaining in self.backend.ttl_many(keys)]
+
+    def get_many_cached_recommendations(self, requests):
+        """
+        Look up several requests at once; L1 misses are read from the backend
+        in one bulk read
+
+        Parameters:
+        - requests (list): (user_preferences, browsing_history) pairs
+
+        Returns:
+        - list: Cached recommendations or None, in the order of requests
+        """
+        lookups = [self._lookup_key(prefs, history) for prefs, history in requests]
+        results = [self._memory_get(cache_key) for cache_key, _ in lookups]
+        missing = [i for i, cached in enumerate(results) if cached is None]
+        if missing:
             try:
-                with open(cache_file, 'r') as f:
-                    cache_data = json.load(f)
-                
-                timestamp = cache_data.get('timestamp', 0)
-                
-                if current_time - timestamp > ttl_seconds:
-                    # delete expired cache file
-                    os.remove(cache_file)
-                    cleared_count += 1
-            
+                raws = self.backend.get_many([lookups[i][0] for i in missing])
             except Exception as e:
-                print(f"Error clearing cache file {filename}: {str(e)}")
-                # delete invalid cache file
-                try:
-                    os.remove(cache_file)
-                    cleared_count += 1
-                except:
-                    pass
+                log.warning('cache.read_failed', backend=self.backend.name, error=str(e))
+                raws = [None] * len(missing)
+            for i, raw in zip(missing, raws):
+                results[i] = self._load_entry(lookups[i][0], raw)
+        for (_, applied), cached in zip(lookups, results):
+            self.canonicalizer.record(applied, cached is not None)
+        return results
+
+    async def aget_many_cached_recommendations(self, requests):
+        """
+        Non-blocking get_many_cached_recommendations; L1 hits are answered
+        inline and the bulk backend read of the rest runs in a worker thread
+        """
+        results = []
+        for prefs, history in requests:
+            cache_key, applied = self._lookup_key(prefs, history)
+            cached = self._memory_get(cache_key)
+            if cached is not None:
+                self.canonicalizer.record(applied, True)
+            results.append(cached)
+        missing = [i for i, cached in enumerate(results) if cached is None]
+        if missing:
+            found = await asyncio.to_thread(
+                self.get_many_cached_recommendations, [requests[i] for i in missing]
+            )
+            for i, cached in zip(missing, found):
+                results[i] = cached
+        return results
+
+    async def acache_recommendations(self, user_preferences, browsing_history, recommendations):
+        """
+        Non-blocking cache_recommendations; the backend write runs in a worker thread
+        """
+        return await asyncio.to_thread(
+            self.cache_recommendations, user_preferences, browsing_history, recommendations
+        )
+    
+    def clear_expired_cache(self, max_entries=None, batch_size=1000):
+        """
+        Clear expired cache entries, for backends that do not expire them by
+        themselves (the file backend finds them through its index)
+
+        Parameters:
+        - max_entries (int): Stop after this many entries, None for no limit
+        - batch_size (int): Entries removed per index transaction
         
-        return cleared_count
+        Returns:
+        - int: Number of cache entries cleared
+        """
+        self._memory_clear(expired_only=True)
+        return self.backend.clear_expired(max_entries=max_entries, batch_size=batch_size)
     
-    def clear_all_cache(self):
+    def clear_all_cache(self, batch_size=1000):
         """
         Clear all cache entries regardless of expiration
         
         Returns:
         - int: Number of cache entries cleared
         """
-        cleared_count = 0
-        
-        for filename in os.listdir(self.cache_dir):
-            if not filename.endswith('.json'):
-                continue
-                
-            cache_file = os.path.join(self.cache_dir, filename)
-            
-            try:
-                os.remove(cache_file)
-                cleared_count += 1
-            except Exception as e:
-                print(f"Error deleting cache file {filename}: {str(e)}")
-        
-        return cleared_count
+        self._memory_clear()
+        return self.backend.clear(batch_size=batch_size)
+
+    def start_background_expiry(self, interval_seconds=300, batch_size=1000):
+        """
+        Sweep expired entries from a background thread
+
+        Each pass removes expired entries in batches of batch_size, yielding
+        between batches, then waits interval_seconds before the next pass.
+
+        Parameters:
+        - interval_seconds (float): Pause between sweeps
+        - batch_size (int): Entries removed per batch
+        """
+        if self._sweeper is not None and self._sweeper.is_alive():
+            return
+
+        def sweep():
+            while not self._sweeper_stop.is_set():
+                try:
+                    while not self._sweeper_stop.is_set():
+                        if self.clear_expired_cache(max_entries=batch_size, batch_size=batch_size) < batch_size:
+                            break
+                        time.sleep(0.01)
+                except Exception as e:
+                    log.error('cache.sweep_failed', error=str(e))
+                self._sweeper_stop.wait(interval_seconds)
+
+        self._sweeper_stop.clear()
+        self._sweeper = threading.Thread(target=sweep, name='cache-expiry', daemon=True)
+        self._sweeper.start()
+
+    def stop_background_expiry(self):
+        """Stop the background sweeper started by start_background_expiry"""
+        self._sweeper_stop.set()
+        if self._sweeper is not None:
+            self._sweeper.join()
+            self._sweeper = None
+
+    def before_fork(self):
+        """
+        Stop the background threads and release the backend's connections so
+        that worker processes can be forked from this one (see after_fork)
+        """
+        self.stop_background_expiry()
+        self.backend.before_fork()
+
+    def after_fork(self):
+        """
+        Reconnect the backend in a forked worker
+
+        Workers share the backend; each keeps its own in-memory tier.
+        """
+        self.backend.after_fork()
     
     def get_cache_stats(self):
         """
-        Get statistics about the current cache
+        Get statistics about the current cache, from the backend
         
         Returns:
         - dict: Cache statistics
         """
-        total_entries = 0
-        total_size = 0
-        expired_entries = 0
-        current_time = time.time()
-        ttl_seconds = self.ttl_hours * 3600
-        
-        for filename in os.listdir(self.cache_dir):
-            if not filename.endswith('.json'):
-                continue
-                
-            cache_file = os.path.join(self.cache_dir, filename)
-            
-            try:
-                size = os.path.getsize(cache_file)
-                total_size += size
-                total_entries += 1
-                
-                with open(cache_file, 'r') as f:
-                    cache_data = json.load(f)
-                
-                timestamp = cache_data.get('timestamp', 0)
-                
-                if current_time - timestamp > ttl_seconds:
-                    expired_entries += 1
-            
-            except Exception:
-                pass
+        backend = self.backend.stats()
         
         return {
-            'total_entries': total_entries,
-            'active_entries': total_entries - expired_entries,
-            'expired_entries': expired_entries,
-            'total_size_kb': round(total_size / 1024, 2),
+            'total_entries': backend['entries'],
+            'active_entries': backend['entries'] - backend['expired_entries'],
+            'expired_entries': backend['expired_entries'],
+            'total_size_kb': round(backend['size_bytes'] / 1024, 2),
             'ttl_hours': self.ttl_hours,
-            'cache_dir': self.cache_dir
-        }
\ No newline at end of file
+            'backend': {k: v for k, v in backend.items() if k not in ('entries', 'expired_entries', 'size_bytes')},
+            'memory': self.get_memory_stats(),
+            'canonicalization': self.canonicalizer.get_stats()
+        }
+
+    def get_memory_stats(self):
+        """
+        Statistics for the in-memory LRU and the L1/L2 hit rates
+
+        Returns:
+        - dict: L1 size and limits, lookup counters and hit rates
+        """
+        with self._memory_lock:
+            stats = dict(self._lookup_stats)
+            stats['entries'] = len(self._memory)
+            stats['size_kb'] = round(self._memory_bytes / 1024, 2)
+
+        lookups = stats['l1_hits'] + stats['l2_hits'] + stats['misses'] + stats['expired']
+        stats['l1_hit_rate'] = round(stats['l1_hits'] / lookups, 4) if lookups else 0.0
+        stats['l2_hit_rate'] = round(stats['l2_hits'] / lookups, 4) if lookups else 0.0
+        stats['max_entries'] = self.memory_max_entries
+        stats['max_size_kb'] = round(self.memory_max_bytes / 1024, 2)
+        return stats
\ No newline at end of file
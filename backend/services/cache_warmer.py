@@ -0,0 +1,260 @@
+"""
+Precompute recommendations for cold-start users.
+
+Users without a browsing history only differ by their stated preferences: a
+price range plus some categories and brands from the catalog. The warmer
+enumerates those combinations and keeps a cache entry for each of them fresh,
+recomputing entries before their TTL runs out, so cold-start requests are
+cache hits.
+
+Entries that are still fresh are skipped, which makes a run resumable: an
+interrupted run picks up where it stopped. Run it once with:
+
+    python -m services.cache_warmer --price-ranges all,0-50,50-100 --rate 2
+
+or let the API run it periodically with CACHE_WARMUP_INTERVAL_SECONDS.
+"""
+
+import argparse
+import asyncio
+import time
+from collections import Counter
+from itertools import combinations
+
+from .structured_logging import get_logger
+
+log = get_logger(__name__)
+
+
+def enumerate_preferences(products, price_ranges=('all',), max_categories=1, max_brands=1, popular=None):
+    """
+    List the preference combinations to warm
+
+    Categories and brands are ordered by how many products they have. With
+    categories selected, only brands that sell in those categories are
+    combined with them.
+
+    Parameters:
+    - products (list): Product catalog
+    - price_ranges (iterable): priceRange values to cover
+    - max_categories (int): Most categories selected at once
+    - max_brands (int): Most brands selected at once
+    - popular (int): Only use the N largest categories and brands
+
+    Returns:
+    - list: UserPreferences dicts, most general first
+    """
+    category_counts = Counter(p['category'] for p in products if p.get('category'))
+    brand_counts = Counter(p['brand'] for p in products if p.get('brand'))
+    categories = [c for c, _ in sorted(category_counts.items(), key=lambda item: (-item[1], item[0]))][:popular]
+    brands = [b for b, _ in sorted(brand_counts.items(), key=lambda item: (-item[1], item[0]))][:popular]
+    brands_by_category = {}
+    for product in products:
+        if product.get('category') and product.get('brand'):
+            brands_by_category.setdefault(product['category'], set()).add(product['brand'])
+
+    combos = []
+    for size in range(max_categories + 1):
+        for selected in combinations(categories, size):
+            if selected:
+                allowed = set().union(*(brands_by_category.get(c, ()) for c in selected))
+                candidates = [b for b in brands if b in allowed]
+            else:
+                candidates = brands
+            for brand_size in range(max_brands + 1):
+                for selected_brands in combinations(candidates, brand_size):
+                    combos.append((sorted(selected), sorted(selected_brands)))
+
+    return [
+        {'priceRange': price_range, 'categories': categories_, 'brands': brands_}
+        for price_range in price_ranges
+        for categories_, brands_ in combos
+    ]
+
+
+class RateLimiter:
+    """
+    Space out starts to at most `rate` per second (no limit when rate <= 0)
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate and rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class CacheWarmer:
+    """
+    Keep cold-start cache entries fresh
+
+    Stale combinations are computed by a pool of `concurrency` worker tasks
+    on the event loop. The work is waiting on LLM calls, so tasks sharing the
+    service's connection pool, concurrency limit and in-flight coalescing do
+    it better than processes would, each with its own catalog and cache.
+    """
+
+    # cache keys per bulk TTL lookup
+    FRESHNESS_BATCH = 256
+
+    def __init__(self, llm_service, price_ranges=('all',), max_categories=1, max_brands=1,
+                 popular=None, rate=2.0, concurrency=4, refresh_margin_hours=1.0):
+        """
+        Initialize the warmer
+
+        Parameters:
+        - llm_service (LLMService): Service whose cache is warmed
+        - price_ranges, max_categories, max_brands, popular: see enumerate_preferences
+        - rate (float): LLM calls started per second at most
+        - concurrency (int): Worker tasks, i.e. LLM calls in flight at most
+        - refresh_margin_hours (float): Recompute entries this long before they expire
+        """
+        self.llm_service = llm_service
+        self.price_ranges = tuple(price_ranges)
+        self.max_categories = max_categories
+        self.max_brands = max_brands
+        self.popular = popular
+        self.rate = rate
+        self.concurrency = max(1, concurrency)
+        self.refresh_margin_hours = refresh_margin_hours
+        self.last_run = None
+
+    def preferences(self):
+        """Preference combinations for the current catalog"""
+        return enumerate_preferences(
+            self.llm_service.product_service.get_all_products(),
+            self.price_ranges, self.max_categories, self.max_brands, self.popular
+        )
+
+    def _stale(self, combos):
+        """
+        The combinations whose entry is missing or due for a refresh, with
+        one bulk TTL lookup per batch of keys (blocking, see run)
+        """
+        cache_service = self.llm_service.cache_service
+        fresh_for = (float(cache_service.ttl_hours) - self.refresh_margin_hours) * 3600
+        stale = []
+        for i in range(0, len(combos), self.FRESHNESS_BATCH):
+            batch = combos[i:i + self.FRESHNESS_BATCH]
+            ages = cache_service.get_entry_ages([(prefs, []) for prefs in batch])
+            stale.extend(prefs for prefs, age in zip(batch, ages) if age is None or age >= fresh_for)
+        return stale
+
+    async def run(self, progress_every=10, dry_run=False):
+        """
+        Warm every combination that has no fresh entry
+
+        Parameters:
+        - progress_every (int): Print progress after this many completions
+        - dry_run (bool): Only count what would be computed
+
+        Returns:
+        - dict: total, fresh (skipped), warmed, failed (errors and empty
+          answers, neither of which is cached), seconds
+        """
+        started = time.monotonic()
+        combos = self.preferences()
+        # SQLite queries or Redis round trips: keep them off the event loop
+        todo = await asyncio.to_thread(self._stale, combos)
+        stats = {'total': len(combos), 'fresh': len(combos) - len(todo), 'warmed': 0, 'failed': 0}
+        log.info('warmup.started', todo=len(todo), total=len(combos))
+
+        if not dry_run and todo:
+            products = self.llm_service.product_service.get_all_products()
+            limiter = RateLimiter(self.rate)
+            pending = iter(todo)
+
+            async def worker():
+                # the workers share one iterator, so each combination is taken once
+                for user_preferences in pending:
+                    await limiter.acquire()
+                    try:
+                        recommendations = await self.llm_service.arefresh_recommendations(
+                            user_preferences, [], products)
+                        if recommendations.get('recommendations'):
+                            stats['warmed'] += 1
+                        else:
+                            # empty answers are not cached, so the next run retries them
+                            stats['failed'] += 1
+                            log.warning('warmup.empty', preferences=user_preferences)
+                    except Exception as e:
+                        stats['failed'] += 1
+                        log.warning('warmup.failed', preferences=user_preferences, error=str(e))
+                    done = stats['warmed'] + stats['failed']
+                    if done % progress_every == 0 or done == len(todo):
+                        elapsed = time.monotonic() - started
+                        remaining = (len(todo) - done) * elapsed / done
+                        log.info('warmup.progress', done=done, todo=len(todo), failed=stats['failed'],
+                                 remaining_seconds=round(remaining))
+
+            await asyncio.gather(*(worker() for _ in range(min(self.concurrency, len(todo)))))
+
+        stats['seconds'] = round(time.monotonic() - started, 2)
+        self.last_run = stats
+        return stats
+
+    async def run_forever(self, interval_seconds):
+        """
+        Re-run the warm-up every interval_seconds (until cancelled)
+        """
+        while True:
+            try:
+                await self.run()
+            except Exception as e:
+                log.exception('warmup.run_failed', error=str(e))
+            await asyncio.sleep(interval_seconds)
+
+
+def main(argv=None):
+    from config import config
+    from services.llm_service import LLMService
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--price-ranges', default=config['CACHE_WARMUP_PRICE_RANGES'],
+                        help='comma-separated priceRange values')
+    parser.add_argument('--max-categories', type=int, default=config['CACHE_WARMUP_MAX_CATEGORIES'])
+    parser.add_argument('--max-brands', type=int, default=config['CACHE_WARMUP_MAX_BRANDS'])
+    parser.add_argument('--popular', type=int, default=None,
+                        help='only the N largest categories and brands')
+    parser.add_argument('--rate', type=float, default=config['CACHE_WARMUP_RATE'],
+                        help='LLM calls started per second (0 = unlimited)')
+    parser.add_argument('--concurrency', type=int, default=config['LLM_MAX_CONCURRENCY'])
+    parser.add_argument('--refresh-margin-hours', type=float,
+                        default=config['CACHE_WARMUP_REFRESH_MARGIN_HOURS'])
+    parser.add_argument('--dry-run', action='store_true', help='only report what would be computed')
+    args = parser.parse_args(argv)
+
+    llm_service = LLMService()
+    warmer = CacheWarmer(
+        llm_service,
+        price_ranges=[r.strip() for r in args.price_ranges.split(',') if r.strip()],
+        max_categories=args.max_categories,
+        max_brands=args.max_brands,
+        popular=args.popular,
+        rate=args.rate,
+        concurrency=args.concurrency,
+        refresh_margin_hours=args.refresh_margin_hours
+    )
+
+    async def run():
+        try:
+            return await warmer.run(dry_run=args.dry_run)
+        finally:
+            await llm_service.aclose()
+
+    stats = asyncio.run(run())
+    print(f"Cache warm-up finished: {stats}")
+    return 1 if stats['failed'] else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
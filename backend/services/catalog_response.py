@@ -0,0 +1,218 @@
+import gzip
+import hashlib
+import json
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from .catalog_snapshot import json_default
+
+
+# one entity tag of an If-None-Match list: optional weak prefix, quoted tag
+_ENTITY_TAG = re.compile(r'\s*(?:W/)?("[^"]*")\s*(?:,|$)')
+
+
+def etag_matches(if_none_match, etag):
+    """
+    Whether an If-None-Match header matches an entity tag
+
+    Uses the weak comparison of RFC 9110: `W/` prefixes are ignored, so a tag
+    a proxy weakened still matches. The header may list several tags or be
+    `*`, which matches any current representation.
+
+    Parameters:
+    - if_none_match (str or None): Header value
+    - etag (str): Strong tag of the representation, quoted
+
+    Returns:
+    - bool: True if the client's copy is current
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in (match.group(1) for match in _ENTITY_TAG.finditer(if_none_match))
+
+
+def _dumps(value):
+    # same encoding FastAPI's JSONResponse uses
+    return json.dumps(
+        value, ensure_ascii=False, allow_nan=False, separators=(",", ":"), default=json_default
+    ).encode("utf-8")
+
+
+class CatalogResponse:
+    """
+    Ready-to-send bodies for the product list endpoint.
+
+    The catalog only changes when it is reloaded, so each product is encoded
+    to JSON once and pages are sliced from the encoded catalog instead of
+    running the whole list through the JSON encoder per request. The full
+    list and its gzip variant are built up front; projected (`fields=`) and
+    paginated bodies are built on first use and kept in a small LRU.
+    """
+
+    GZIP_LEVEL = 6
+    MAX_CACHED_BODIES = 256
+    MAX_CACHED_PROJECTIONS = 16
+
+    def __init__(self, products):
+        """
+        Encode the catalog
+
+        Parameters:
+        - products (list): Product catalog, in the order it is served
+        """
+        records = [_dumps(product) for product in products]
+        body = b"[" + b",".join(records) + b"]"
+        # record i sits between the separators at record_offsets[i] and [i + 1]
+        record_offsets = np.zeros(len(records) + 1, dtype=np.int64)
+        np.cumsum([len(record) + 1 for record in records], out=record_offsets[1:])
+        positions = {}
+        for position, product in enumerate(products):
+            positions.setdefault(product['id'], position)
+        self._init(products, positions, body, gzip.compress(body, self.GZIP_LEVEL, mtime=0),
+                   record_offsets, hashlib.sha1(body).hexdigest()[:16])
+
+    def _init(self, products, positions, body, gzip_body, record_offsets, version):
+        self.products = products
+        self.body = body
+        self.gzip_body = gzip_body
+        self.version = version
+        self._record_offsets = record_offsets
+        self._positions = positions
+        self._records = OrderedDict()
+        self._bodies = OrderedDict()
+        self._lock = threading.Lock()
+
+    def state(self):
+        """
+        The encoded catalog, to store it with the catalog
+
+        Returns:
+        - dict: body, gzip_body, record_offsets and version
+        """
+        return {
+            'body': self.body,
+            'gzip_body': self.gzip_body,
+            'record_offsets': self._record_offsets,
+            'version': self.version.encode('ascii'),
+        }
+
+    @classmethod
+    def from_state(cls, products, positions, state):
+        """
+        Bodies returned by state(), without encoding anything
+
+        Parameters:
+        - products (list): Product catalog the state was built from
+        - positions (dict): Position of the first product with each id
+        - state (Mapping): Output of state(); the bodies may be memoryviews
+          of a mapped snapshot, they are only copied into bytes when served
+
+        Returns:
+        - CatalogResponse: The bodies
+        """
+        response = cls.__new__(cls)
+        response._init(products, positions, state['body'], state['gzip_body'], state['record_offsets'],
+                       bytes(state['version']).decode('ascii'))
+        return response
+
+    def __len__(self):
+        return len(self.products)
+
+    @staticmethod
+    def parse_fields(fields):
+        """
+        Normalize a `fields=` query value
+
+        Parameters:
+        - fields (str or None): Comma-separated field names
+
+        Returns:
+        - tuple or None: Field names in request order without duplicates,
+          None for the full records
+        """
+        if not fields:
+            return None
+        names = tuple(dict.fromkeys(name.strip() for name in fields.split(',') if name.strip()))
+        return names or None
+
+    def cursor_offset(self, cursor):
+        """
+        Position a cursor points at
+
+        A cursor is the id of the first product of the page, so it stays
+        meaningful when the catalog is reloaded.
+
+        Returns:
+        - int or None: Offset, None for an unknown cursor
+        """
+        if not cursor:
+            return 0
+        return self._positions.get(cursor)
+
+    def _projected_records(self, fields):
+        records = self._records.get(fields)
+        if records is None:
+            records = [
+                _dumps({name: product[name] for name in fields if name in product})
+                for product in self.products
+            ]
+            if len(self._records) >= self.MAX_CACHED_PROJECTIONS:
+                self._records.popitem(last=False)
+            self._records[fields] = records
+        return records
+
+    def page(self, fields=None, offset=0, limit=None):
+        """
+        Body for one page of the catalog
+
+        Parameters:
+        - fields (tuple or None): Output of parse_fields
+        - offset (int): Position of the first product
+        - limit (int or None): Page size, None for everything from offset
+
+        Returns:
+        - dict: body, gzip_body (built lazily, call gzip_page), etag, and
+          next_cursor (None on the last page)
+        """
+        end = len(self.products) if limit is None else min(offset + limit, len(self.products))
+        next_cursor = self.products[end]['id'] if end < len(self.products) else None
+        key = (fields, offset, end)
+
+        with self._lock:
+            cached = self._bodies.get(key)
+            if cached is not None:
+                self._bodies.move_to_end(key)
+                return cached
+
+            if key == (None, 0, len(self.products)):
+                body, gzip_body = bytes(self.body), bytes(self.gzip_body)
+            elif fields is None:
+                # full records are contiguous in the catalog body
+                start = int(self._record_offsets[min(offset, end)]) + 1
+                body, gzip_body = b"[" + self.body[start:int(self._record_offsets[end])] + b"]", None
+            else:
+                records = self._projected_records(fields)
+                body, gzip_body = b"[" + b",".join(records[offset:end]) + b"]", None
+
+            page_hash = hashlib.sha1(repr(key).encode()).hexdigest()[:8]
+            cached = {
+                "body": body,
+                "gzip_body": gzip_body,
+                "etag": f'"{self.version}-{page_hash}"',
+                "next_cursor": next_cursor
+            }
+            self._bodies[key] = cached
+            if len(self._bodies) > self.MAX_CACHED_BODIES:
+                self._bodies.popitem(last=False)
+            return cached
+
+    def gzip_page(self, page):
+        """Return the gzip variant of a page, compressing it on first use"""
+        if page["gzip_body"] is None:
+            page["gzip_body"] = gzip.compress(page["body"], self.GZIP_LEVEL, mtime=0)
+        return page["gzip_body"]
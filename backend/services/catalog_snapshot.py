@@ -0,0 +1,472 @@
+"""
+Compact, memory-mapped representation of the product catalog.
+
+A snapshot is a single binary file built from products.json. Strings are
+stored once in a shared string table (so categories, brands and tags are
+interned), each field is a typed column, and the whole file is mapped
+read-only. Worker processes that map the same file share one physical copy
+through the page cache, and opening it does not parse any JSON.
+
+The snapshot can also carry derived sections: the arrays, string tables and
+encoded bodies the product service builds over the catalog (see
+CatalogVersion.snapshot_sections). They are computed once when the snapshot
+is written and mapped as they are when it is opened, so a worker never
+decodes the products one by one to rebuild them.
+
+Products are exposed as ProductRecord objects: read-only mappings with
+__slots__ that decode their fields from the columns on access, so code that
+treats products as dicts keeps working.
+
+Build a snapshot ahead of time with:
+
+    python -m services.catalog_snapshot data/products.json data/products.snapshot
+"""
+
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from collections.abc import Mapping, Sequence
+
+import numpy as np
+
+from .structured_logging import get_logger
+
+log = get_logger(__name__)
+
+MAGIC = b'PRODCAT1'
+_HEADER_LENGTH = struct.Struct('<Q')
+
+# column kinds
+_STR = 'str'
+_FLOAT = 'float'
+_INT = 'int'
+_STR_LIST = 'str_list'
+_JSON = 'json'
+
+_DTYPES = {_STR: np.uint32, _FLOAT: np.float64, _INT: np.int64, _STR_LIST: np.uint32, _JSON: np.uint32}
+
+
+def json_default(value):
+    """
+    `default` hook for json.dumps so product records serialize like dicts
+    """
+    if isinstance(value, Mapping):
+        return dict(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _column_kind(values):
+    """Pick the narrowest column kind that holds every value of a field"""
+    kinds = set()
+    for value in values:
+        if isinstance(value, bool):
+            return _JSON
+        if isinstance(value, str):
+            kinds.add(_STR)
+        elif isinstance(value, float):
+            kinds.add(_FLOAT)
+        elif isinstance(value, int) and -2 ** 63 <= value < 2 ** 63:
+            kinds.add(_INT)
+        elif isinstance(value, list) and all(isinstance(item, str) for item in value):
+            kinds.add(_STR_LIST)
+        else:
+            return _JSON
+    return kinds.pop() if len(kinds) == 1 else _JSON
+
+
+def _source_stamp(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _encode_strings(texts):
+    """UTF-8 offsets and blob of a string table"""
+    encoded = [text.encode('utf-8') for text in texts]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.uint64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return offsets.tobytes(), b''.join(encoded)
+
+
+def _derived_sections(derived):
+    """
+    Header entries and sections of the derived values
+
+    Arrays keep their dtype and shape, bytes are stored as they are, lists of
+    strings become string tables and any other list is stored as JSON.
+    """
+    entries, sections = {}, []
+    for name, value in derived.items():
+        section = f'derived:{name}'
+        if isinstance(value, np.ndarray):
+            value = np.ascontiguousarray(value)
+            entries[name] = {'kind': 'array', 'dtype': value.dtype.str, 'shape': list(value.shape)}
+            sections.append((section, value.tobytes()))
+        elif isinstance(value, (bytes, bytearray, memoryview)):
+            entries[name] = {'kind': 'bytes'}
+            sections.append((section, bytes(value)))
+        elif all(isinstance(item, str) for item in value):
+            offsets, blob = _encode_strings(value)
+            entries[name] = {'kind': 'strings', 'count': len(value)}
+            sections += [(f'{section}:offsets', offsets), (section, blob)]
+        else:
+            entries[name] = {'kind': 'json'}
+            sections.append((section, json.dumps(list(value)).encode('utf-8')))
+    return entries, sections
+
+
+def write_snapshot(products, path, source_path=None, derived=None, derived_format=None):
+    """
+    Write a catalog snapshot
+
+    The file is written to a temporary name and moved into place, so workers
+    mapping the old file are not affected.
+
+    Parameters:
+    - products (list): Product dicts, in catalog order
+    - path (str): Snapshot file to write
+    - source_path (str): JSON file the products came from; its size and
+      modification time are recorded so stale snapshots can be detected
+    - derived (dict): Values derived from the products, by name: numpy
+      arrays, bytes, or lists
+    - derived_format (str): Version of the derived values, so readers can
+      tell whether they can use them
+    """
+    strings = {}
+
+    def string_id(text):
+        sid = strings.get(text)
+        if sid is None:
+            sid = strings[text] = len(strings)
+        return sid
+
+    field_names = list(dict.fromkeys(key for product in products for key in product))
+    kinds = [_column_kind([p[name] for p in products if name in p]) for name in field_names]
+    field_ids = {name: i for i, name in enumerate(field_names)}
+
+    layouts = {}
+    layout_column = np.zeros(len(products), dtype=np.uint16)
+    list_items = []
+    columns = []
+    for name, kind in zip(field_names, kinds):
+        shape = (len(products), 2) if kind == _STR_LIST else len(products)
+        columns.append(np.zeros(shape, dtype=_DTYPES[kind]))
+
+    for position, product in enumerate(products):
+        layout = tuple(field_ids[key] for key in product)
+        layout_column[position] = layouts.setdefault(layout, len(layouts))
+        for key, value in product.items():
+            field = field_ids[key]
+            kind = kinds[field]
+            if kind == _STR:
+                columns[field][position] = string_id(value)
+            elif kind in (_FLOAT, _INT):
+                columns[field][position] = value
+            elif kind == _STR_LIST:
+                columns[field][position] = (len(list_items), len(value))
+                list_items.extend(string_id(item) for item in value)
+            else:
+                columns[field][position] = string_id(json.dumps(value))
+
+    string_offsets, string_blob = _encode_strings(strings)
+    derived_entries, derived_sections = _derived_sections(derived or {})
+
+    sections = [
+        ('layouts', layout_column.tobytes()),
+        ('string_offsets', string_offsets),
+        ('string_blob', string_blob),
+        ('list_items', np.asarray(list_items, dtype=np.uint32).tobytes()),
+    ] + [(f'field:{name}', column.tobytes()) for name, column in zip(field_names, columns)] + derived_sections
+
+    header = {
+        'count': len(products),
+        'fields': [{'name': name, 'kind': kind} for name, kind in zip(field_names, kinds)],
+        'layouts': [list(layout) for layout in layouts],
+        'strings': len(strings),
+        'list_items': len(list_items),
+        'source': _source_stamp(source_path) if source_path else None,
+        'derived': derived_entries,
+        'derived_format': derived_format if derived else None,
+        'sections': {},
+    }
+    # section offsets are relative to the 8-byte aligned end of the header
+    offset = 0
+    for name, data in sections:
+        header['sections'][name] = [offset, len(data)]
+        offset += (len(data) + 7) // 8 * 8
+    header_bytes = json.dumps(header, separators=(',', ':')).encode()
+    header_bytes += b' ' * (-(len(MAGIC) + _HEADER_LENGTH.size + len(header_bytes)) % 8)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.snapshot-', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(MAGIC)
+            f.write(_HEADER_LENGTH.pack(len(header_bytes)))
+            f.write(header_bytes)
+            for name, data in sections:
+                f.write(data)
+                f.write(b'\0' * (-len(data) % 8))
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class StringTable(Sequence):
+    """
+    Read-only list of strings stored in a snapshot, decoded on access
+    """
+
+    __slots__ = ('_buffer', '_offsets', '_start')
+
+    def __init__(self, buffer, offsets, start):
+        """
+        Parameters:
+        - buffer (mmap.mmap): Mapped snapshot
+        - offsets (numpy.ndarray): Byte offsets of the strings, plus the end
+        - start (int): Position of the blob in the buffer
+        """
+        self._buffer = buffer
+        self._offsets = offsets
+        self._start = start
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        start = self._start + int(self._offsets[index])
+        return self._buffer[start:self._start + int(self._offsets[index + 1])].decode('utf-8')
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+    def tolist(self):
+        """All strings, decoded in one go"""
+        offsets = self._offsets.tolist()
+        blob = self._buffer[self._start:self._start + offsets[-1]]
+        text = blob.decode('utf-8')
+        if len(text) == len(blob):
+            # plain ASCII: byte offsets are character offsets
+            return [text[start:end] for start, end in zip(offsets, offsets[1:])]
+        return [blob[start:end].decode('utf-8') for start, end in zip(offsets, offsets[1:])]
+
+
+class ProductRecord(Mapping):
+    """
+    Read-only, dict-like view of one product in a MappedCatalog
+    """
+
+    __slots__ = ('_catalog', '_position')
+
+    def __init__(self, catalog, position):
+        self._catalog = catalog
+        self._position = position
+
+    def __getitem__(self, key):
+        return self._catalog._value(self._position, key)
+
+    def __contains__(self, key):
+        return self._catalog._has_field(self._position, key)
+
+    def __iter__(self):
+        return iter(self._catalog._keys(self._position))
+
+    def __len__(self):
+        return len(self._catalog._keys(self._position))
+
+    def copy(self):
+        """Plain dict copy of the product"""
+        return dict(self)
+
+    def __repr__(self):
+        return f"ProductRecord({dict(self)!r})"
+
+
+class MappedCatalog:
+    """
+    A catalog snapshot mapped into memory
+
+    Low-cardinality strings (categories, brands, tags...) are decoded once per
+    process; everything else is decoded from the mapping when it is read.
+    """
+
+    # string fields with at most this many distinct values are always interned
+    INTERN_MAX_DISTINCT = 64
+
+    def __init__(self, path):
+        """
+        Map a snapshot file
+
+        Parameters:
+        - path (str): Snapshot written by write_snapshot
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"Not a catalog snapshot: {path}")
+        (header_length,) = _HEADER_LENGTH.unpack_from(self._mmap, len(MAGIC))
+        start = len(MAGIC) + _HEADER_LENGTH.size
+        self.header = json.loads(self._mmap[start:start + header_length])
+        self._base = start + header_length
+
+        self.count = self.header['count']
+        self.source = self.header['source']
+        self.derived_format = self.header.get('derived_format')
+        self._layout_ids = self._section('layouts', np.uint16)
+        self._string_offsets = self._section('string_offsets', np.uint64)
+        self._string_start = self._base + self.header['sections']['string_blob'][0]
+        self._list_items = self._section('list_items', np.uint32)
+
+        self._fields = {}
+        for field in self.header['fields']:
+            column = self._section(f"field:{field['name']}", _DTYPES[field['kind']])
+            if field['kind'] == _STR_LIST:
+                column = column.reshape(-1, 2)
+            self._fields[field['name']] = (field['kind'], column)
+
+        names = [field['name'] for field in self.header['fields']]
+        self._layouts = [tuple(names[i] for i in layout) for layout in self.header['layouts']]
+        self._layout_sets = [frozenset(layout) for layout in self._layouts]
+
+        # intern the values of low-cardinality string fields
+        self._interned = {}
+        for name, (kind, column) in self._fields.items():
+            if kind != _STR:
+                continue
+            distinct = np.unique(column)
+            if len(distinct) <= self.INTERN_MAX_DISTINCT or 2 * len(distinct) <= self.count:
+                for sid in distinct.tolist():
+                    self._interned[sid] = sys.intern(self._string(sid))
+        for sid in np.unique(self._list_items).tolist():
+            self._interned.setdefault(sid, sys.intern(self._string(sid)))
+
+        self.products = [ProductRecord(self, position) for position in range(self.count)]
+        self.derived = {name: self._derived(name, entry) for name, entry in self.header.get('derived', {}).items()}
+
+    def _derived(self, name, entry):
+        section = f'derived:{name}'
+        if entry['kind'] == 'array':
+            return self._section(section, np.dtype(entry['dtype'])).reshape(entry['shape'])
+        if entry['kind'] == 'strings':
+            offsets = self._section(f'{section}:offsets', np.uint64)
+            return StringTable(self._mmap, offsets, self._base + self.header['sections'][section][0])
+        offset, length = self.header['sections'][section]
+        data = memoryview(self._mmap)[self._base + offset:self._base + offset + length]
+        return data if entry['kind'] == 'bytes' else json.loads(bytes(data))
+
+    def _section(self, name, dtype):
+        offset, length = self.header['sections'][name]
+        return np.frombuffer(self._mmap, dtype=dtype, count=length // np.dtype(dtype).itemsize,
+                             offset=self._base + offset)
+
+    def _string(self, sid):
+        start = int(self._string_offsets[sid])
+        end = int(self._string_offsets[sid + 1])
+        return self._mmap[self._string_start + start:self._string_start + end].decode('utf-8')
+
+    def _text(self, sid):
+        text = self._interned.get(sid)
+        return text if text is not None else self._string(sid)
+
+    def _keys(self, position):
+        return self._layouts[self._layout_ids[position]]
+
+    def _has_field(self, position, key):
+        return key in self._layout_sets[self._layout_ids[position]]
+
+    def _value(self, position, key):
+        if not self._has_field(position, key):
+            raise KeyError(key)
+        kind, column = self._fields[key]
+        if kind == _STR:
+            return self._text(int(column[position]))
+        if kind == _FLOAT:
+            return float(column[position])
+        if kind == _INT:
+            return int(column[position])
+        if kind == _STR_LIST:
+            start, length = column[position].tolist()
+            return [self._text(sid) for sid in self._list_items[start:start + length].tolist()]
+        return json.loads(self._string(int(column[position])))
+
+    def is_current(self, source_path):
+        """True if the snapshot was built from source_path as it is now"""
+        try:
+            return self.source == _source_stamp(source_path)
+        except OSError:
+            return False
+
+
+def _current_snapshot(snapshot_path, source_path, derived_format):
+    """The mapped snapshot if it is up to date, None if it must be rebuilt"""
+    if os.path.exists(snapshot_path):
+        try:
+            catalog = MappedCatalog(snapshot_path)
+            if catalog.is_current(source_path) and catalog.derived_format == derived_format:
+                return catalog
+        except (ValueError, KeyError, OSError) as e:
+            log.warning('catalog.snapshot_unreadable', path=snapshot_path, error=str(e))
+    return None
+
+
+def load_snapshot(snapshot_path, source_path, derive=None, derived_format=None):
+    """
+    Map the snapshot for source_path, rebuilding it first if it is missing,
+    older than the source file, or carries derived values of another format
+
+    The rebuild holds an exclusive lock on snapshot_path + '.lock', so when
+    several processes find the snapshot stale at once (workers reloading a
+    changed catalog), one of them rebuilds it and the others wait and map
+    the result.
+
+    Parameters:
+    - snapshot_path (str): Snapshot file
+    - source_path (str): products.json the snapshot is built from
+    - derive (callable): Computes the derived values (see write_snapshot)
+      from the product dicts when the snapshot is rebuilt
+    - derived_format (str): Format the derived values must have
+
+    Returns:
+    - MappedCatalog: The mapped catalog
+    """
+    catalog = _current_snapshot(snapshot_path, source_path, derived_format)
+    if catalog is not None:
+        return catalog
+
+    import fcntl
+
+    with open(snapshot_path + '.lock', 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        # another process may have rebuilt it while this one waited
+        catalog = _current_snapshot(snapshot_path, source_path, derived_format)
+        if catalog is not None:
+            return catalog
+        with open(source_path, 'r') as file:
+            products = json.load(file)
+        derived = derive(products) if derive else None
+        write_snapshot(products, snapshot_path, source_path, derived, derived_format)
+        log.info('catalog.snapshot_built', path=snapshot_path, products=len(products))
+        return MappedCatalog(snapshot_path)
+
+if __name__ == '__main__':
+    from .product_service import snapshot_sections, snapshot_sections_format
+
+    if len(sys.argv) != 3:
+        print("usage: python -m services.catalog_snapshot PRODUCTS_JSON SNAPSHOT")
+        sys.exit(2)
+    with open(sys.argv[1], 'r') as source:
+        catalog_products = json.load(source)
+    write_snapshot(catalog_products, sys.argv[2], sys.argv[1],
+                   snapshot_sections(catalog_products), snapshot_sections_format())
+    print(f"Wrote {len(catalog_products)} products to {sys.argv[2]}")
@@ -0,0 +1,563 @@
+"""
+Item-to-item co-view model built from browsing histories.
+
+Every recommendation request carries the products its user has viewed. Two
+products viewed in the same history are co-viewed; counting those pairs over
+many histories gives a "people who viewed this also viewed" signal that needs
+no product text at all.
+
+Histories are queued by the request handlers (an O(1) append) and folded
+into the counts by a background thread, which also refreshes the per-item
+top-N neighbor lists and snapshots everything to disk. Request scoring only
+looks neighbors up.
+
+With several worker processes, one of them owns the model: the others append
+their histories to a shared JSONL spool file, which the owner ingests before
+each snapshot, and load every new snapshot it writes. All workers then serve
+the same neighbors, one snapshot interval behind at most.
+
+Histories can also be loaded in bulk from JSONL:
+
+    python -m services.coview_model requests.jsonl --snapshot data/coview.npz
+"""
+
+import argparse
+import io
+import json
+import os
+import tempfile
+import threading
+from collections import deque
+
+import numpy as np
+
+from .structured_logging import get_logger
+from .text_index import _ranges
+
+log = get_logger(__name__)
+
+SNAPSHOT_FORMAT = 1
+
+
+class CoViewModel:
+    """
+    Incremental co-occurrence counts with per-item top-N neighbor lists
+
+    Product IDs are interned to integer rows. The pair counts are a CSR
+    matrix: per row, the other rows it was viewed with (sorted int32 ids) and
+    the sessions they were viewed together (int32 counts), stored in both
+    directions. New pairs go to a delta buffer of packed (row, other row)
+    keys, which is merged into the matrix before neighbors are rebuilt or the
+    model is saved, and whenever it grows past MAX_DELTA. Each item also
+    keeps the number of sessions it appeared in.
+
+    Neighbors are ranked by cosine similarity,
+    together / sqrt(sessions(a) * sessions(b)), and only rebuilt for items
+    whose counts changed since the last rebuild.
+    """
+
+    # pair observations buffered before they are merged into the matrix
+    MAX_DELTA = 1 << 20
+
+    def __init__(self, top_n=20, min_count=2, max_history=20, snapshot_path=None, max_pending=10000):
+        """
+        Initialize an empty model
+
+        Parameters:
+        - top_n (int): Neighbors kept per item
+        - min_count (int): Sessions a pair needs before it counts as neighbors
+        - max_history (int): Only the last N distinct products of a history are
+          paired, which bounds the work per history
+        - snapshot_path (str): File the model is saved to and loaded from
+        - max_pending (int): Histories queued for ingestion at most; the
+          oldest are dropped when the ingester falls behind
+        """
+        self.top_n = top_n
+        self.min_count = min_count
+        self.max_history = max_history
+        self.snapshot_path = snapshot_path or None
+        self.sessions = 0
+        self._ids = []
+        self._index = {}
+        # CSR pair counts over the rows, and the pairs not merged into them yet
+        self._row_ptr = np.zeros(1, dtype=np.int64)
+        self._cols = np.zeros(0, dtype=np.int32)
+        self._counts = np.zeros(0, dtype=np.int32)
+        self._delta = []
+        self._delta_size = 0
+        # sessions per row, with spare capacity past len(self._ids)
+        self._item_counts = np.zeros(1024, dtype=np.int64)
+        self._dirty = set()
+        self._neighbors = {}
+        self._pending = deque(maxlen=max_pending)
+        self._lock = threading.Lock()
+        self._worker = None
+        self._worker_stop = threading.Event()
+        self._save = True
+        self._spool_path = None
+        # (size, mtime_ns) of the snapshot this model last loaded or saved
+        self._snapshot_stamp = None
+
+    def __len__(self):
+        return len(self._ids)
+
+    def _row(self, product_id):
+        row = self._index.get(product_id)
+        if row is None:
+            row = self._index[product_id] = len(self._ids)
+            self._ids.append(product_id)
+            if row == len(self._item_counts):
+                self._item_counts = np.concatenate([self._item_counts, np.zeros_like(self._item_counts)])
+        return row
+
+    def _session_items(self, history):
+        """Distinct products of a history, most recent max_history of them"""
+        items = list(dict.fromkeys(reversed(history)))
+        if self.max_history:
+            items = items[:self.max_history]
+        return items
+
+    def observe(self, history):
+        """
+        Queue a browsing history for the background ingester
+
+        Parameters:
+        - history (list): Product IDs the user viewed, oldest first
+        """
+        if len(history) > 1:
+            self._pending.append(tuple(history))
+
+    def ingest(self, history):
+        """
+        Add one browsing history to the counts
+
+        Parameters:
+        - history (list): Product IDs the user viewed, oldest first
+
+        Returns:
+        - bool: Whether the history had at least two distinct products
+        """
+        items = self._session_items(history)
+        if len(items) < 2:
+            return False
+
+        with self._lock:
+            rows = [self._row(product_id) for product_id in items]
+            packed = np.array(rows, dtype=np.int64)
+            self._item_counts[packed] += 1
+            # every ordered pair of distinct rows, as (a << 32) | b
+            keys = (packed[:, None] << 32) | packed[None, :]
+            self._delta.append(keys[~np.eye(len(rows), dtype=bool)])
+            self._delta_size += len(rows) * (len(rows) - 1)
+            if self._delta_size >= self.MAX_DELTA:
+                self._merge()
+            self._dirty.update(rows)
+            self.sessions += 1
+        return True
+
+    def _merge(self):
+        """Fold the delta buffer into the CSR counts; the caller holds the lock"""
+        size = len(self._ids)
+        lengths = np.zeros(size, dtype=np.int64)
+        lengths[:len(self._row_ptr) - 1] = np.diff(self._row_ptr)
+        if not self._delta:
+            self._row_ptr = np.concatenate([[0], np.cumsum(lengths)])
+            return
+        keys, added = np.unique(np.concatenate(self._delta), return_counts=True)
+        self._delta, self._delta_size = [], 0
+
+        # existing pairs get their counts raised in place, new ones inserted
+        # at their sorted position
+        rows = np.repeat(np.arange(len(self._row_ptr) - 1, dtype=np.int64), np.diff(self._row_ptr))
+        existing = (rows << 32) | self._cols
+        at = np.searchsorted(existing, keys)
+        found = at < len(existing)
+        found[found] = existing[at[found]] == keys[found]
+        self._counts[at[found]] += added[found].astype(np.int32)
+
+        new = ~found
+        self._cols = np.insert(self._cols, at[new], (keys[new] & 0xFFFFFFFF).astype(np.int32))
+        self._counts = np.insert(self._counts, at[new], added[new].astype(np.int32))
+        lengths += np.bincount(keys[new] >> 32, minlength=size)
+        self._row_ptr = np.concatenate([[0], np.cumsum(lengths)])
+
+    def flush(self):
+        """
+        Ingest the queued histories and refresh the changed neighbor lists
+
+        Returns:
+        - int: Histories ingested
+        """
+        ingested = 0
+        while self._pending:
+            try:
+                history = self._pending.popleft()
+            except IndexError:
+                break
+            ingested += self.ingest(history)
+        self.rebuild_neighbors()
+        return ingested
+
+    def rebuild_neighbors(self):
+        """
+        Recompute the top-N neighbors of the items whose counts changed
+
+        The similarity of an untouched item to a changed one drifts a little
+        until that item changes too; the lists are a ranking signal, not exact
+        statistics.
+        """
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            if not dirty:
+                return
+            self._merge()
+            # pairs of the dirty rows that count, by row and then best first
+            rows = np.fromiter(dirty, dtype=np.int64, count=len(dirty))
+            starts = self._row_ptr[rows]
+            lengths = self._row_ptr[rows + 1] - starts
+            offsets = _ranges(starts, lengths)
+            together = self._counts[offsets]
+            keep = together >= self.min_count
+            owners = np.repeat(rows, lengths)[keep]
+            others = self._cols[offsets][keep]
+            scores = together[keep] / np.sqrt(self._item_counts[owners] * self._item_counts[others])
+            order = np.lexsort((-scores, owners))
+            owners, others, scores = owners[order], others[order].tolist(), scores[order].tolist()
+
+            updated = dict.fromkeys((self._ids[a] for a in dirty), ())
+            groups, firsts = np.unique(owners, return_index=True)
+            ends = np.append(firsts[1:], len(owners)).tolist()
+            for a, first, end in zip(groups.tolist(), firsts.tolist(), ends):
+                # every product tied with the last one kept, for the id tie-break
+                last = scores[min(first + self.top_n, end) - 1]
+                while end > first + self.top_n and scores[end - 1] < last:
+                    end -= 1
+                scored = sorted(zip(scores[first:end], others[first:end]),
+                                key=lambda item: (-item[0], self._ids[item[1]]))
+                updated[self._ids[a]] = tuple((self._ids[b], round(score, 6)) for score, b in scored[:self.top_n])
+
+        # swap in a new table so lookups never see a half-built one
+        neighbors = dict(self._neighbors)
+        for product_id, items in updated.items():
+            if items:
+                neighbors[product_id] = items
+            else:
+                neighbors.pop(product_id, None)
+        self._neighbors = neighbors
+
+    def neighbors(self, product_id):
+        """
+        Products most often viewed together with a product
+
+        Returns:
+        - tuple: (product id, similarity in (0, 1]) pairs, most similar first
+        """
+        return self._neighbors.get(product_id, ())
+
+    def related(self, history):
+        """
+        Co-view score of products related to a browsing history
+
+        Looks up the neighbors of each viewed product; the cost is
+        O(len(history) * top_n), independent of the catalog size.
+
+        Parameters:
+        - history (list): Product IDs the user viewed
+
+        Returns:
+        - dict: Product ID to mean similarity over the viewed products, in
+          (0, 1]; the viewed products themselves are left out
+        """
+        items = self._session_items(history)
+        table = self._neighbors
+        scores = {}
+        for product_id in items:
+            for neighbor, similarity in table.get(product_id, ()):
+                scores[neighbor] = scores.get(neighbor, 0.0) + similarity
+        for product_id in items:
+            scores.pop(product_id, None)
+        return {product_id: score / len(items) for product_id, score in scores.items()}
+
+    def ingest_jsonl(self, path):
+        """
+        Load browsing histories from a JSONL file
+
+        Each line is a request body ({"browsing_history": [...]}), a logged
+        request wrapping one ({"request": {...}}), or a bare list of IDs.
+        Malformed lines are skipped.
+
+        Parameters:
+        - path (str): JSONL file
+
+        Returns:
+        - tuple: (histories ingested, lines skipped)
+        """
+        with open(path, 'r', encoding='utf-8') as f:
+            ingested, skipped = self._ingest_lines(f)
+        self.rebuild_neighbors()
+        return ingested, skipped
+
+    def _ingest_lines(self, lines):
+        ingested = skipped = 0
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                history = self._history_from_record(json.loads(line))
+            except ValueError:
+                skipped += 1
+                continue
+            ingested += self.ingest(history)
+        return ingested, skipped
+
+    def forward(self, spool_path):
+        """
+        Append the queued histories to a spool file shared with the process
+        that owns the model, instead of ingesting them
+
+        Returns:
+        - int: Histories forwarded
+        """
+        histories = []
+        while self._pending:
+            try:
+                histories.append(self._pending.popleft())
+            except IndexError:
+                break
+        if histories:
+            import fcntl
+
+            data = ''.join(json.dumps(list(history)) + '\n' for history in histories)
+            with open(spool_path, 'a', encoding='utf-8') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                f.write(data)
+                f.flush()
+        return len(histories)
+
+    def ingest_spool(self, spool_path):
+        """
+        Ingest and empty the spool file other processes forward histories to
+
+        Returns:
+        - int: Histories ingested
+        """
+        import fcntl
+
+        try:
+            f = open(spool_path, 'r+', encoding='utf-8')
+        except FileNotFoundError:
+            return 0
+        with f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            lines = f.read().splitlines()
+            f.seek(0)
+            f.truncate()
+        return self._ingest_lines(lines)[0]
+
+    @staticmethod
+    def _history_from_record(record):
+        if isinstance(record, dict):
+            record = record.get('request', record)
+            record = record.get('browsing_history') if isinstance(record, dict) else None
+        if not isinstance(record, list) or not all(isinstance(pid, str) for pid in record):
+            raise ValueError('no browsing history')
+        return record
+
+    def save(self, path=None):
+        """
+        Snapshot the counts to disk, atomically
+
+        The pair counts are stored once per pair as a CSR matrix over the upper
+        triangle, in a compressed .npz file.
+
+        Parameters:
+        - path (str): Target file, snapshot_path if not given
+        """
+        path = path or self.snapshot_path
+        with self._lock:
+            self._merge()
+            rows = np.repeat(np.arange(len(self._ids), dtype=np.int64), np.diff(self._row_ptr))
+            upper = self._cols > rows
+            row_ptr = np.concatenate([[0], np.cumsum(np.bincount(rows[upper], minlength=len(self._ids)))])
+            cols, counts = self._cols[upper], self._counts[upper]
+            meta = {'format': SNAPSHOT_FORMAT, 'ids': list(self._ids), 'sessions': self.sessions}
+            item_counts = self._item_counts[:len(self._ids)].copy()
+
+        buffer = io.BytesIO()
+        np.savez_compressed(
+            buffer,
+            meta=np.frombuffer(json.dumps(meta).encode('utf-8'), dtype=np.uint8),
+            item_counts=item_counts,
+            row_ptr=row_ptr,
+            cols=cols,
+            counts=counts
+        )
+
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.coview-', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(buffer.getvalue())
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        if path == self.snapshot_path:
+            self._snapshot_stamp = self._stamp()
+
+    def load(self, path=None):
+        """
+        Replace the model with a snapshot written by save()
+
+        Parameters:
+        - path (str): Snapshot file, snapshot_path if not given
+        """
+        path = path or self.snapshot_path
+        # taken before reading, so a snapshot replaced meanwhile is loaded again
+        stamp = self._stamp() if path == self.snapshot_path else None
+        with np.load(path) as data:
+            meta = json.loads(data['meta'].tobytes().decode('utf-8'))
+            if meta.get('format') != SNAPSHOT_FORMAT:
+                raise ValueError(f"Unsupported co-view snapshot format: {meta.get('format')}")
+            item_counts = data['item_counts'].astype(np.int64)
+            row_ptr = data['row_ptr']
+            upper_cols = data['cols'].astype(np.int64)
+            upper_counts = data['counts'].astype(np.int32)
+
+        # mirror the upper triangle and sort by (row, other row)
+        ids = meta['ids']
+        upper_rows = np.repeat(np.arange(len(ids), dtype=np.int64), np.diff(row_ptr))
+        keys = np.concatenate([(upper_rows << 32) | upper_cols, (upper_cols << 32) | upper_rows])
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+
+        with self._lock:
+            self._ids = ids
+            self._index = {product_id: row for row, product_id in enumerate(ids)}
+            self._row_ptr = np.concatenate([[0], np.cumsum(np.bincount(keys >> 32, minlength=len(ids)))])
+            self._cols = (keys & 0xFFFFFFFF).astype(np.int32)
+            self._counts = np.concatenate([upper_counts, upper_counts])[order]
+            self._delta, self._delta_size = [], 0
+            self._item_counts = np.concatenate([item_counts, np.zeros(max(len(ids), 1024), dtype=np.int64)])
+            self.sessions = meta['sessions']
+            self._dirty = set(range(len(ids)))
+            self._neighbors = {}
+        self.rebuild_neighbors()
+        if stamp is not None:
+            self._snapshot_stamp = stamp
+
+    def _stamp(self):
+        try:
+            stat = os.stat(self.snapshot_path)
+            return (stat.st_size, stat.st_mtime_ns)
+        except (OSError, TypeError):
+            return None
+
+    def reload_if_changed(self):
+        """
+        Load the snapshot if another process wrote a new one since this model
+        last loaded or saved it
+
+        Returns:
+        - bool: True if the snapshot was loaded
+        """
+        stamp = self._stamp()
+        if stamp is None or stamp == self._snapshot_stamp:
+            return False
+        self.load()
+        return True
+
+    def start(self, interval_seconds, save=True, spool_path=None):
+        """
+        Ingest queued histories and snapshot the model in a background thread
+
+        Parameters:
+        - interval_seconds (float): Time between runs; 0 disables the thread
+        - save (bool): Write the snapshot; with several worker processes only
+          the one owning the model should
+        - spool_path (str): Spool file shared by the worker processes. The
+          owner (save=True) ingests it before saving; the others forward
+          their histories to it and load the owner's snapshots
+        """
+        if interval_seconds <= 0 or self._worker is not None:
+            return
+        self._save = save
+        self._spool_path = spool_path
+
+        def work():
+            while not self._worker_stop.wait(interval_seconds):
+                self._run_once()
+
+        self._worker_stop.clear()
+        self._worker = threading.Thread(target=work, name='coview-ingester', daemon=True)
+        self._worker.start()
+
+    def stop(self):
+        """Stop the background thread, ingesting and saving what is left"""
+        if self._worker is not None:
+            self._worker_stop.set()
+            self._worker.join()
+            self._worker = None
+            self._run_once()
+
+    def _run_once(self):
+        try:
+            if self._spool_path and not self._save:
+                self.forward(self._spool_path)
+                self.reload_if_changed()
+                return
+            ingested = self.ingest_spool(self._spool_path) if self._spool_path else 0
+            ingested += self.flush()
+            if ingested and self.snapshot_path and self._save:
+                self.save()
+        except Exception as e:
+            log.exception('coview.update_failed', error=str(e))
+
+    def get_stats(self):
+        """
+        Model size counters
+
+        Returns:
+        - dict: Sessions ingested, items, stored pairs, pair observations
+          waiting in the delta buffer, items with neighbors and histories
+          waiting to be ingested
+        """
+        return {
+            'sessions': self.sessions,
+            'items': len(self._ids),
+            'pairs': len(self._cols) // 2,
+            'delta_pairs': self._delta_size // 2,
+            'items_with_neighbors': len(self._neighbors),
+            'pending': len(self._pending)
+        }
+
+
+def main(argv=None):
+    from config import config
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('inputs', nargs='+', help='JSONL files of browsing histories')
+    parser.add_argument('--snapshot', default=config['COVIEW_SNAPSHOT_PATH'],
+                        help='snapshot to update (created if missing)')
+    parser.add_argument('--top-n', type=int, default=config['COVIEW_TOP_N'])
+    parser.add_argument('--min-count', type=int, default=config['COVIEW_MIN_COUNT'])
+    args = parser.parse_args(argv)
+    if not args.snapshot:
+        parser.error('--snapshot (or COVIEW_SNAPSHOT_PATH) is required')
+
+    model = CoViewModel(top_n=args.top_n, min_count=args.min_count,
+                        max_history=config['COVIEW_MAX_HISTORY'], snapshot_path=args.snapshot)
+    if os.path.exists(args.snapshot):
+        model.load()
+    for path in args.inputs:
+        ingested, skipped = model.ingest_jsonl(path)
+        print(f"{path}: {ingested} histories ingested, {skipped} lines skipped")
+    model.save()
+    print(f"Co-view model saved to {args.snapshot}: {model.get_stats()}")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,111 @@
+class FallbackRanker:
+    """
+    Deterministic recommendations served straight from the scoring engine.
+
+    Used when the LLM should not (or could not) answer: as the only path in
+    'fast' mode, when the LLM misses the latency SLO, and when the LLM call
+    fails. Explanations are filled in from templates based on the signals each
+    product matched, so the response has the same shape as an LLM response.
+    """
+
+    def __init__(self, product_service, count=5):
+        """
+        Initialize the ranker
+
+        Parameters:
+        - product_service (ProductService): Catalog with the scoring engine
+        - count (int): Number of recommendations to return
+        """
+        self.product_service = product_service
+        self.count = count
+
+    def recommend(self, user_preferences, browsed_products, catalog, related=None):
+        """
+        Rank products and explain the picks
+
+        Parameters:
+        - user_preferences (dict): User's stated preferences
+        - browsed_products (list): Products the user has viewed
+        - catalog (ScoringCatalog): Columnar catalog to rank
+        - related (dict): Co-view scores per product ID, optional
+
+        Returns:
+        - dict: Recommendations in the same shape as the LLM path, with
+          "source": "fast"
+        """
+        context = catalog.request_context(user_preferences, browsed_products, related)
+        ranked = catalog.rank(user_preferences, browsed_products, self.count, context)
+
+        recommendations = []
+        for position, score in ranked:
+            product = catalog.products[position]
+            signals = catalog.match_signals(product, context)
+            recommendations.append({
+                "product": product,
+                "explanation": self.explain(product, signals, user_preferences),
+                "confidence_score": self._confidence(score)
+            })
+
+        return {
+            "recommendations": recommendations,
+            "count": len(recommendations),
+            "source": "fast"
+        }
+
+    @staticmethod
+    def _confidence(score):
+        """
+        Map a heuristic score onto the LLM's 1-10 confidence scale
+
+        A product that matches category, brand, price and rating scores about
+        13; half of that is a 5.
+        """
+        return max(1, min(10, int(round(score * 10 / 13))))
+
+    @staticmethod
+    def explain(product, signals, user_preferences):
+        """
+        Build an explanation from the strongest matched signals
+
+        Parameters:
+        - product (dict): Recommended product
+        - signals (dict): Output of ScoringCatalog.match_signals
+        - user_preferences (dict): User's stated preferences
+
+        Returns:
+        - str: Up to three reasons, most important first
+        """
+        reasons = []
+
+        if signals['category'] == 'preferred':
+            reasons.append(f"It's in {product['category']}, one of the categories you picked.")
+        elif signals['category'] == 'browsed':
+            reasons.append(f"You've been browsing {product['category']} products.")
+
+        if signals['brand'] == 'preferred':
+            reasons.append(f"It's made by {product['brand']}, a brand you said you like.")
+        elif signals['brand'] == 'browsed':
+            reasons.append(f"You've looked at other {product['brand']} products.")
+
+        if signals['coview']:
+            reasons.append("Shoppers who viewed the same products often look at this one too.")
+
+        if signals['tags']:
+            reasons.append(f"It shares what you've been looking at: {', '.join(signals['tags'][:3])}.")
+        elif signals['features']:
+            reasons.append(f"Features like {signals['features'][0].lower()} echo products you viewed.")
+
+        if signals['price'] == 'in_range':
+            reasons.append(f"At ${product['price']} it fits your ${user_preferences['priceRange']} budget.")
+        elif signals['price'] == 'near_range':
+            reasons.append(f"At ${product['price']} it's just outside your ${user_preferences['priceRange']} budget.")
+        elif signals['price'] == 'similar':
+            reasons.append(f"At ${product['price']} it's priced like the items you've viewed.")
+
+        rating = signals['rating']
+        if rating is not None and rating >= 4.5:
+            reasons.append(f"Customers rate it {rating}/5.")
+
+        if not reasons:
+            return f"A well-reviewed {product.get('category', 'catalog')} pick worth exploring."
+        return ' '.join(reasons[:3])
@@ -1,32 +1,248 @@
+import asyncio
+import os
+
+import aiohttp
 import openai
+from .cache_backends import make_cache_backend
+from .cache_key import CacheKeyCanonicalizer
 from .cache_service import LLMCacheService
+from .coview_model import CoViewModel
+from .fallback_ranker import FallbackRanker
+from .metrics import LLM_ERRORS, LLM_TOKENS, span
+from .product_service import ProductService
+from .scoring_engine import ScoringCatalog
+from .single_flight import SingleFlight
+from .stream_parser import IncrementalJSONArrayParser
+from .structured_logging import get_logger
+from .token_estimator import estimate_tokens
 from config import config
 
+log = get_logger(__name__)
+
+PROMPT_HEADER = "You are an expert e-commerce recommendation system. Your task is to recommend exactly 3 products that will genuinely interest this specific user.\n\n"
+
+# static tail of the recommendation prompt: requirements, strategy, examples and
+# the expected response format
+RECOMMENDATION_INSTRUCTIONS = (
+    "==== RECOMMENDATION REQUIREMENTS ====\n"
+    "Select EXACTLY 5 products that would create the most compelling and personalized recommendations for this specific user.\n\n"
+
+    # recommendation strategy
+    "Your recommendation strategy should include:\n\n"
+
+    "1. RELEVANCE & INTENT MATCHING:\n"
+    "   - Products that directly satisfy the intent signaled by their browsing behavior\n"
+    "   - Items that strongly align with their explicitly stated preferences\n\n"
+
+    "2. PSYCHOGRAPHIC MATCHING:\n"
+    "   - Consider the customer persona suggested by their browsing patterns\n"
+    "   - Match to products that appeal to similar customer segments\n\n"
+
+    "3. STRATEGIC RECOMMENDATION MIX:\n"
+    "   - Core Recommendations: 2-3 products very closely matching their demonstrated interests\n"
+    "   - Complementary Products: 1-2 items that enhance products they've browsed\n"
+    "   - Discovery Product: 1 unexpected but relevant item to expand their horizons\n\n"
+
+    "4. DETAILED PERSONALIZED REASONING:\n"
+    "   - For each product, explain specifically WHY it matches this particular user\n"
+    "   - Reference concrete aspects of their behavior or preferences\n"
+    "   - Highlight key product features that address their specific needs or interests\n"
+    "   - Use insights from similar customer purchase patterns where relevant\n\n"
+
+    # specific examples of excellent vs. poor explanations
+    "QUALITY BENCHMARK EXAMPLES:\n"
+    "✓ EXCELLENT: \"This wireless charger complements the premium smartphone you viewed earlier, addressing your interest in fast-charging technology (which appeared in 3 of your browsed items). Its compact design also aligns with the portable accessories you've been exploring.\"\n\n"
+
+    "✗ POOR: \"This is a highly-rated product that many customers enjoy and would be a good match for your preferences.\"\n\n"
+
+    # response format, many shot prompting
+    "FORMAT YOUR RESPONSE AS A JSON ARRAY EXACTLY LIKE THIS:\n"
+    """[
+      {
+        "product_id": "prod123",
+        "explanation": "Clear reasoning for this recommendation that connects to the user's specific interests",
+        "score": 8
+      },
+      {
+        "product_id": "prod456",
+        "explanation": "Explanation for second product",
+        "score": 7
+      },
+      {
+        "product_id": "prod789",
+        "explanation": "Explanation for third product",
+        "score": 6
+      }
+    ]"""
+)
+
+PROMPT_HEADER_TOKENS = estimate_tokens(PROMPT_HEADER)
+RECOMMENDATION_INSTRUCTIONS_TOKENS = estimate_tokens(RECOMMENDATION_INSTRUCTIONS)
+
 class LLMService:
     """
     Service to handle interactions with the LLM API
     """
     
-    def __init__(self):
+    def __init__(self, product_service=None):
         """
         Initialize the LLM service with configuration
+
+        Parameters:
+        - product_service (ProductService): Shared catalog service used for id
+          lookups; a new one is loaded if not given
         """
+        self.product_service = product_service or ProductService()
         openai.api_key = config['OPENAI_API_KEY']
         self.model_name = config['MODEL_NAME']
         self.max_tokens = config['MAX_TOKENS']
         self.temperature = config['TEMPERATURE']
+        self.api_base = config.get('OPENAI_API_BASE')
+        self.request_timeout = config.get('LLM_TIMEOUT_SECONDS', 30)
+        self.max_concurrency = config.get('LLM_MAX_CONCURRENCY', 8)
+        self.batch_concurrency = config.get('BATCH_MAX_CONCURRENCY', 4)
+        self.prompt_token_budget = config.get('PROMPT_TOKEN_BUDGET', 1200)
+        self.prompt_max_candidates = config.get('PROMPT_MAX_CANDIDATES', 15)
+        self.prompt_min_candidates = config.get('PROMPT_MIN_CANDIDATES', 5)
+        # 'llm' asks the model, 'fast' always serves the deterministic ranker
+        self.recommendation_mode = config.get('RECOMMENDATION_MODE', 'llm')
+        latency_slo_ms = config.get('LATENCY_SLO_MS', 0)
+        self.latency_slo = latency_slo_ms / 1000 if latency_slo_ms else None
+        self.llm_fallback = config.get('LLM_FALLBACK', True)
+        self.fallback_ranker = FallbackRanker(
+            self.product_service, count=config.get('FAST_RECOMMENDATION_COUNT', 5)
+        )
+        self.coview_model = None
+        if config.get('COVIEW_ENABLED', True):
+            self.coview_model = CoViewModel(
+                top_n=config.get('COVIEW_TOP_N', 20),
+                min_count=config.get('COVIEW_MIN_COUNT', 2),
+                max_history=config.get('COVIEW_MAX_HISTORY', 20),
+                snapshot_path=config.get('COVIEW_SNAPSHOT_PATH')
+            )
+            if self.coview_model.snapshot_path and os.path.exists(self.coview_model.snapshot_path):
+                try:
+                    self.coview_model.load()
+                except Exception as e:
+                    log.warning('coview.load_failed', error=str(e))
+        # created lazily on the running event loop by _get_async_client
+        self._session = None
+        self._llm_semaphore = None
+        # identical concurrent requests share one LLM call
+        self._single_flight = SingleFlight()
+        self.request_stats = {
+            'cache_hits': 0, 'cache_misses': 0, 'coalesced': 0,
+            'fast': 0, 'slo_misses': 0, 'fallbacks': 0
+        }
         self.cache_service = LLMCacheService(
-            cache_dir=config.get('CACHE_DIR', 'cache'),
-            ttl_hours=config.get('CACHE_TTL_HOURS', 24)
+            ttl_hours=config.get('CACHE_TTL_HOURS', 24),
+            backend=make_cache_backend(
+                config.get('CACHE_BACKEND', 'file'),
+                cache_dir=config.get('CACHE_DIR', 'cache'),
+                ttl_seconds=float(config.get('CACHE_TTL_HOURS', 24)) * 3600,
+                url=config.get('CACHE_REDIS_URL', 'redis://localhost:6379/0'),
+                key_prefix=config.get('CACHE_REDIS_KEY_PREFIX', 'reco:'),
+                max_connections=config.get('CACHE_REDIS_MAX_CONNECTIONS', 16),
+                timeout=config.get('CACHE_REDIS_TIMEOUT_SECONDS', 2.0)
+            ),
+            memory_max_entries=config.get('CACHE_MEMORY_MAX_ENTRIES', 1024),
+            memory_max_bytes=int(config.get('CACHE_MEMORY_MAX_MB', 64) * 1024 * 1024),
+            product_service=self.product_service,
+            compression=config.get('CACHE_COMPRESSION', 'none'),
+            compression_level=config.get('CACHE_COMPRESSION_LEVEL', 6),
+            canonicalizer=CacheKeyCanonicalizer(
+                self.product_service,
+                sort_facets=config.get('CACHE_KEY_SORT_FACETS', True),
+                drop_unknown_ids=config.get('CACHE_KEY_DROP_UNKNOWN_IDS', True),
+                history_dedupe=config.get('CACHE_KEY_HISTORY_DEDUPE', True),
+                history_limit=config.get('CACHE_KEY_HISTORY_LIMIT', 20),
+                history_order_insensitive=config.get('CACHE_KEY_HISTORY_ORDER_INSENSITIVE', False),
+                price_buckets=config.get('CACHE_KEY_PRICE_BUCKETS', [])
+            )
         )
 
         self.use_cache = config.get('USE_CACHE', True)
 
         if self.use_cache:
-            self.cache_service.clear_expired_cache()
+            # expiry runs incrementally off the startup path
+            self.cache_service.start_background_expiry(
+                interval_seconds=config.get('CACHE_SWEEP_INTERVAL_SECONDS', 300)
+            )
+
+    def _chat_completion_params(self, prompt):
+        """
+        Keyword arguments shared by the blocking and async chat completion calls
+        """
+        params = {
+            "model": self.model_name,
+            "messages": [
+                {"role": "system", "content": "You are a helpful eCommerce product recommendation assistant."},
+                {"role": "user", "content": prompt}
+            ],
+            "max_tokens": self.max_tokens,
+            "temperature": self.temperature,
+            "request_timeout": self.request_timeout
+        }
+        if self.api_base:
+            params["api_base"] = self.api_base
+        return params
+
+    def _get_async_client(self):
+        """
+        Return the pooled HTTP session and the in-flight semaphore, creating them
+        on first use so they belong to the running event loop
+        """
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency)
+            self._session = aiohttp.ClientSession(connector=connector)
+        if self._llm_semaphore is None:
+            self._llm_semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._session, self._llm_semaphore
+
+    async def _acall_llm(self, prompt):
+        """
+        Call the chat completion API without blocking the event loop
+
+        At most LLM_MAX_CONCURRENCY calls are in flight at once; the others wait
+        for a slot. Each call is bounded by LLM_TIMEOUT_SECONDS.
+
+        Returns:
+        - tuple: (content of the first completion choice, token usage reported by the API)
+        """
+        session, semaphore = self._get_async_client()
+        with span('llm_wait'):
+            await semaphore.acquire()
+        try:
+            # openai picks the session up from this context variable
+            openai.aiosession.set(session)
+            with span('llm'):
+                response = await openai.ChatCompletion.acreate(**self._chat_completion_params(prompt))
+        finally:
+            semaphore.release()
+        return response.choices[0].message.content, response.get('usage')
+
+    @staticmethod
+    def _attach_usage(recommendations, prompt_tokens, usage):
+        """
+        Record the estimated prompt size and the API's token usage on a result
+        """
+        if usage:
+            LLM_TOKENS.inc(usage.get('prompt_tokens') or 0, type='prompt')
+            LLM_TOKENS.inc(usage.get('completion_tokens') or 0, type='completion')
+        recommendations['usage'] = {
+            'prompt_tokens_estimated': prompt_tokens,
+            'prompt_tokens': usage.get('prompt_tokens') if usage else None,
+            'completion_tokens': usage.get('completion_tokens') if usage else None
+        }
+
+    async def aclose(self):
+        """
+        Close the pooled HTTP session used by the async LLM path
+        """
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
 
-        
-    
     def generate_recommendations(self, user_preferences, browsing_history, all_products):
         """
         Generate personalized product recommendations based on user preferences and browsing history
@@ -41,45 +257,43 @@ class LLMService:
         """
         # TODO: Implement LLM-based recommendation logic
         # This is where your prompt engineering expertise will be evaluated
+        if self.recommendation_mode == 'fast':
+            self.request_stats['fast'] += 1
+            return self._fast_recommendations(user_preferences, browsing_history, all_products)
+
         if self.use_cache:
-            cached_recommendations = self.cache_service.get_cached_recommendations(
-                user_preferences, browsing_history
-            )
+            with span('cache_lookup'):
+                cached_recommendations = self.cache_service.get_cached_recommendations(
+                    user_preferences, browsing_history
+                )
             
             if cached_recommendations:
                 # Add cache metadata to help with debugging
                 cached_recommendations['cached'] = True
                 return cached_recommendations
+        # answer the canonical request, the one the cache entry is keyed on
+        user_preferences, browsing_history = self.cache_service.canonicalize(user_preferences, browsing_history)
         # Get browsed products details
-        browsed_products = []
+        browsed_products = self._browsed_products(browsing_history)
         #print(browsing_history)
-        for product_id in browsing_history:
-            for product in all_products:
-                if product["id"] == product_id:
-                    browsed_products.append(product)
-                    break
         
         # Create a prompt for the LLM
         # IMPLEMENT YOUR PROMPT ENGINEERING HERE
         #print(user_preferences,browsing_history)
-        prompt = self._create_recommendation_prompt(user_preferences, browsed_products, all_products)
+        with span('prompt'):
+            prompt, prompt_tokens = self._build_prompt(user_preferences, browsed_products, all_products)
         
         # Call the LLM API
         try:
-            response = openai.ChatCompletion.create(
-                model=self.model_name,
-                messages=[
-                    {"role": "system", "content": "You are a helpful eCommerce product recommendation assistant."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=self.max_tokens,
-                temperature=self.temperature
-            )
+            with span('llm'):
+                response = openai.ChatCompletion.create(**self._chat_completion_params(prompt))
             #print(response)
             
             # Parse the LLM response to extract recommendations
             # IMPLEMENT YOUR RESPONSE PARSING LOGIC HERE
-            recommendations = self._parse_recommendation_response(response.choices[0].message.content, all_products)
+            with span('parse'):
+                recommendations = self._parse_recommendation_response(response.choices[0].message.content, all_products)
+            self._attach_usage(recommendations, prompt_tokens, response.get('usage'))
             #print("Items Recommended",recommendations[0])
             if self.use_cache and recommendations.get("recommendations"):
                 self.cache_service.cache_recommendations(
@@ -90,8 +304,363 @@ class LLMService:
             
         except Exception as e:
             # Handle any errors from the LLM API
-            print(f"Error calling LLM API: {str(e)}")
+            log.error('llm.error', call='sync', error=str(e))
+            LLM_ERRORS.inc(call='sync')
+            if self.llm_fallback:
+                return self._fallback_recommendations(user_preferences, browsing_history, all_products, e)
             raise Exception(f"Failed to generate recommendations: {str(e)}")
+
+    async def agenerate_recommendations(self, user_preferences, browsing_history, all_products):
+        """
+        Async version of generate_recommendations for use inside the API handlers
+
+        The LLM call goes through the pooled async client and the cache file I/O
+        runs in worker threads, so the event loop keeps serving other requests.
+
+        Parameters:
+        - user_preferences (dict): User's stated preferences
+        - browsing_history (list): List of product IDs the user has viewed
+        - all_products (list): Full product catalog
+
+        Returns:
+        - dict: Recommended products with explanations
+        """
+        if self.recommendation_mode == 'fast':
+            self.request_stats['fast'] += 1
+            return self._fast_recommendations(user_preferences, browsing_history, all_products)
+
+        if self.use_cache:
+            with span('cache_lookup'):
+                cached_recommendations = await self.cache_service.aget_cached_recommendations(
+                    user_preferences, browsing_history
+                )
+
+            if cached_recommendations:
+                self.request_stats['cache_hits'] += 1
+                cached_recommendations['cached'] = True
+                return cached_recommendations
+
+        return await self._agenerate_miss(user_preferences, browsing_history, all_products)
+
+    async def _agenerate_miss(self, user_preferences, browsing_history, all_products):
+        """
+        Answer a request the cache could not: coalesced LLM call, SLO and fallback
+        """
+        # answer the canonical request, the one the cache entry is keyed on
+        user_preferences, browsing_history = self.cache_service.canonicalize(user_preferences, browsing_history)
+        cache_key = self.cache_service.get_cache_key(user_preferences, browsing_history)
+        flight = asyncio.ensure_future(self._single_flight.do(
+            cache_key,
+            lambda: self._agenerate_uncached(user_preferences, browsing_history, all_products)
+        ))
+        try:
+            if self.latency_slo is None:
+                recommendations, coalesced = await flight
+            else:
+                recommendations, coalesced = await asyncio.wait_for(asyncio.shield(flight), self.latency_slo)
+        except asyncio.TimeoutError:
+            # answer now; the LLM call carries on and caches the upgraded result
+            flight.add_done_callback(lambda done: done.cancelled() or done.exception())
+            self.request_stats['slo_misses'] += 1
+            recommendations = self._fast_recommendations(user_preferences, browsing_history, all_products)
+            recommendations['provisional'] = True
+            return recommendations
+        except Exception as e:
+            if not self.llm_fallback:
+                raise
+            return self._fallback_recommendations(user_preferences, browsing_history, all_products, e)
+
+        if coalesced:
+            self.request_stats['coalesced'] += 1
+            # followers get their own top-level dict, the product entries are shared
+            return dict(recommendations)
+        return recommendations
+
+    async def arefresh_recommendations(self, user_preferences, browsing_history, all_products):
+        """
+        Compute recommendations with the LLM and cache them, without looking
+        at the cache first
+
+        Shares the call with any identical live request in flight. Unlike
+        agenerate_recommendations there is no SLO or fallback: a failure raises.
+
+        Returns:
+        - dict: The freshly generated recommendations
+        """
+        user_preferences, browsing_history = self.cache_service.canonicalize(user_preferences, browsing_history)
+        cache_key = self.cache_service.get_cache_key(user_preferences, browsing_history)
+        recommendations, _ = await self._single_flight.do(
+            cache_key,
+            lambda: self._agenerate_uncached(user_preferences, browsing_history, all_products)
+        )
+        return recommendations
+
+    async def agenerate_batch(self, requests, all_products, concurrency=None):
+        """
+        Generate recommendations for many requests, yielding results as they finish
+
+        Identical requests are answered once. Cache hits are looked up in bulk
+        and come first; the misses then run with at most `concurrency` at a
+        time (each still subject to the LLM concurrency limit, coalescing, the
+        SLO and the fallback). A failing request yields its error instead of
+        stopping the batch.
+
+        Parameters:
+        - requests (list): (user_preferences, browsing_history) pairs
+        - all_products (list): Full product catalog
+        - concurrency (int): Requests in progress at once, defaults to
+          BATCH_MAX_CONCURRENCY
+
+        Yields:
+        - tuple: (indices into requests, recommendations or None, exception or None)
+        """
+        groups = {}
+        for index, (user_preferences, browsing_history) in enumerate(requests):
+            cache_key = self.cache_service.get_cache_key(user_preferences, browsing_history)
+            groups.setdefault(cache_key, (user_preferences, browsing_history, []))[2].append(index)
+        pending = list(groups.values())
+
+        if self.recommendation_mode != 'fast' and self.use_cache:
+            with span('cache_lookup'):
+                cached_results = await self.cache_service.aget_many_cached_recommendations(
+                    [(prefs, history) for prefs, history, _ in pending]
+                )
+            misses = []
+            for group, cached in zip(pending, cached_results):
+                if cached:
+                    self.request_stats['cache_hits'] += 1
+                    cached['cached'] = True
+                    yield group[2], cached, None
+                else:
+                    misses.append(group)
+            pending = misses
+
+        semaphore = asyncio.Semaphore(max(1, concurrency or self.batch_concurrency))
+
+        async def run(user_preferences, browsing_history, indices):
+            async with semaphore:
+                try:
+                    if self.recommendation_mode == 'fast':
+                        self.request_stats['fast'] += 1
+                        result = self._fast_recommendations(user_preferences, browsing_history, all_products)
+                    else:
+                        result = await self._agenerate_miss(user_preferences, browsing_history, all_products)
+                    return indices, result, None
+                except Exception as e:
+                    return indices, None, e
+
+        tasks = [asyncio.ensure_future(run(*group)) for group in pending]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                yield await finished
+        finally:
+            # the consumer went away: stop what has not started yet
+            for task in tasks:
+                task.cancel()
+
+    async def _agenerate_uncached(self, user_preferences, browsing_history, all_products):
+        """
+        Build the prompt, call the LLM and cache the parsed result for one request
+        """
+        self.request_stats['cache_misses'] += 1
+        browsed_products = self._browsed_products(browsing_history)
+        with span('prompt'):
+            prompt, prompt_tokens = self._build_prompt(user_preferences, browsed_products, all_products)
+
+        try:
+            content, usage = await self._acall_llm(prompt)
+            with span('parse'):
+                recommendations = self._parse_recommendation_response(content, all_products)
+            self._attach_usage(recommendations, prompt_tokens, usage)
+            if self.use_cache and recommendations.get("recommendations"):
+                await self.cache_service.acache_recommendations(
+                    user_preferences, browsing_history, recommendations
+                )
+
+            return recommendations
+
+        except Exception as e:
+            log.error('llm.error', call='async', error=str(e))
+            LLM_ERRORS.inc(call='async')
+            raise Exception(f"Failed to generate recommendations: {str(e) or type(e).__name__}")
+
+    async def _astream_llm(self, prompt):
+        """
+        Stream a chat completion, yielding content pieces as they arrive
+
+        Holds an in-flight slot for the whole stream, like _acall_llm.
+        """
+        session, semaphore = self._get_async_client()
+        with span('llm_wait'):
+            await semaphore.acquire()
+        try:
+            openai.aiosession.set(session)
+            params = self._chat_completion_params(prompt)
+            params['stream'] = True
+            # the whole stream, parsing of the pieces included
+            with span('llm'):
+                response = await openai.ChatCompletion.acreate(**params)
+                async for chunk in response:
+                    content = chunk.choices[0].delta.get('content')
+                    if content:
+                        yield content
+        finally:
+            semaphore.release()
+
+    async def astream_recommendations(self, user_preferences, browsing_history, all_products):
+        """
+        Generate recommendations and hand each one out as soon as it is ready
+
+        The LLM answer is streamed and parsed incrementally: every recommendation
+        is enriched with its product as soon as its JSON object is complete.
+        Cache hits and fast-mode answers are streamed the same way. The assembled
+        result is cached at the end, as on the non-streaming path. Concurrent
+        identical streams are not coalesced.
+
+        Parameters:
+        - user_preferences (dict): User's stated preferences
+        - browsing_history (list): List of product IDs the user has viewed
+        - all_products (list): Full product catalog
+
+        Yields:
+        - tuple: ('recommendation', recommendation) per recommendation, then
+          ('done', result) where result is everything but the recommendations
+        """
+        def summary(result):
+            return {key: value for key, value in result.items() if key != 'recommendations'}
+
+        if self.recommendation_mode == 'fast':
+            self.request_stats['fast'] += 1
+            result = self._fast_recommendations(user_preferences, browsing_history, all_products)
+            for rec in result['recommendations']:
+                yield 'recommendation', rec
+            yield 'done', summary(result)
+            return
+
+        if self.use_cache:
+            with span('cache_lookup'):
+                cached_recommendations = await self.cache_service.aget_cached_recommendations(
+                    user_preferences, browsing_history
+                )
+            if cached_recommendations:
+                self.request_stats['cache_hits'] += 1
+                cached_recommendations['cached'] = True
+                for rec in cached_recommendations['recommendations']:
+                    yield 'recommendation', rec
+                yield 'done', summary(cached_recommendations)
+                return
+
+        user_preferences, browsing_history = self.cache_service.canonicalize(user_preferences, browsing_history)
+        self.request_stats['cache_misses'] += 1
+        browsed_products = self._browsed_products(browsing_history)
+        with span('prompt'):
+            prompt, prompt_tokens = self._build_prompt(user_preferences, browsed_products, all_products)
+
+        parser = IncrementalJSONArrayParser()
+        recommendations = []
+        try:
+            async for piece in self._astream_llm(prompt):
+                for item in parser.feed(piece):
+                    rec = self._enrich_recommendation(item)
+                    if rec:
+                        recommendations.append(rec)
+                        yield 'recommendation', rec
+        except Exception as e:
+            log.error('llm.error', call='stream', error=str(e))
+            LLM_ERRORS.inc(call='stream')
+            if not self.llm_fallback:
+                raise Exception(f"Failed to generate recommendations: {str(e) or type(e).__name__}")
+
+            # top up whatever already went out with the deterministic ranker
+            fallback = self._fallback_recommendations(user_preferences, browsing_history, all_products, e)
+            sent = {rec['product']['id'] for rec in recommendations}
+            for rec in fallback['recommendations']:
+                if len(recommendations) >= fallback['count']:
+                    break
+                if rec['product']['id'] not in sent:
+                    recommendations.append(rec)
+                    yield 'recommendation', rec
+            fallback['count'] = len(recommendations)
+            yield 'done', summary(fallback)
+            return
+
+        result = {"recommendations": recommendations, "count": len(recommendations)}
+        if not recommendations:
+            result["error"] = "Could not parse recommendations from LLM response"
+        self._attach_usage(result, prompt_tokens, None)
+        if self.use_cache and recommendations:
+            await self.cache_service.acache_recommendations(user_preferences, browsing_history, result)
+        yield 'done', summary(result)
+
+    def _fast_recommendations(self, user_preferences, browsing_history, all_products):
+        """
+        Serve recommendations from the deterministic ranker, without the LLM
+        """
+        browsed_products = self._browsed_products(browsing_history)
+        with span('select'):
+            return self.fallback_ranker.recommend(
+                user_preferences, browsed_products, self._scoring_catalog(all_products),
+                self._related_products(browsed_products)
+            )
+
+    def _browsed_products(self, browsing_history):
+        """Resolve a browsing history to its products"""
+        with span('history'):
+            return self.product_service.get_products_by_ids(browsing_history)
+
+    def record_browsing_history(self, browsing_history):
+        """
+        Queue a request's browsing history for the co-view model
+
+        Only IDs in the catalog are kept. The counts are updated in the
+        background, so this is cheap enough to call on every request.
+
+        Parameters:
+        - browsing_history (list): Product IDs the user has viewed
+        """
+        if self.coview_model is not None:
+            known = self.product_service.products_by_id
+            self.coview_model.observe([pid for pid in browsing_history if pid in known])
+
+    def _related_products(self, browsed_products):
+        """Co-view scores of products related to the browsed ones, or None"""
+        if self.coview_model is None or not browsed_products:
+            return None
+        return self.coview_model.related([product['id'] for product in browsed_products])
+
+    def _fallback_recommendations(self, user_preferences, browsing_history, all_products, error):
+        """
+        Answer a request whose LLM call failed with the deterministic ranker
+        """
+        self.request_stats['fallbacks'] += 1
+        recommendations = self._fast_recommendations(user_preferences, browsing_history, all_products)
+        recommendations['fallback'] = True
+        recommendations['error'] = str(error)
+        return recommendations
+
+    def get_request_stats(self):
+        """
+        Counters for the async recommendation path
+
+        Returns:
+        - dict: Cache hits, misses that went to the LLM, requests coalesced onto
+          an in-flight call, fast-path answers, SLO misses and LLM fallbacks,
+          and the number of calls currently in flight
+        """
+        return dict(self.request_stats, in_flight=len(self._single_flight))
+
+    def _scoring_catalog(self, all_products):
+        """
+        Columnar catalog for scoring: the product service's prebuilt one, or one
+        built on the fly when a different product list is passed in
+        """
+        # compare against the catalog's own product list, which stays right
+        # even if the catalog was reloaded since all_products was read
+        catalog = self.product_service.scoring_catalog
+        if catalog.products is all_products:
+            return catalog
+        return ScoringCatalog(all_products, config.get('CONTENT_SIMILARITY', 'tfidf'),
+                              config.get('CANDIDATE_RETRIEVAL', False))
     
     def _create_recommendation_prompt(self, user_preferences, browsed_products, all_products):
         """
@@ -107,127 +676,86 @@ class LLMService:
         Returns:
         - str: Prompt for the LLM
         """
-        # TODO: Implement your prompt engineering strategy
-        # THIS FUNCTION MUST BE IMPLEMENTED BY THE CANDIDATE
-        prompt = "You are an expert e-commerce recommendation system. Your task is to recommend exactly 3 products that will genuinely interest this specific user.\n\n"
+        return self._build_prompt(user_preferences, browsed_products, all_products)[0]
+
+    def _build_prompt(self, user_preferences, browsed_products, all_products):
+        """
+        Assemble the recommendation prompt within the input token budget
+
+        Preferences, browsing history and instructions are always included.
+        Candidates are then added in relevance order while they fit in
+        PROMPT_TOKEN_BUDGET; at least PROMPT_MIN_CANDIDATES are kept even if
+        that goes over. Token counts come from the local estimator, and the
+        product blocks and their counts are precomputed by the product service.
+        
+        Parameters:
+        - user_preferences (dict): User's stated preferences
+        - browsed_products (list): Products the user has viewed
+        - all_products (list): Full product catalog
         
-        # added user preferneces from the data received
-        prompt += "===== USER PREFERENCES =====\n"
+        Returns:
+        - tuple: (prompt string, estimated prompt tokens)
+        """
+        parts = ["===== USER PREFERENCES =====\n"]
         
         # user preference of price range
         if user_preferences['priceRange'] == 'all':
-            prompt += "Price Range: Any price\n"
+            parts.append("Price Range: Any price\n")
         else:
             try:
                 min_price, max_price = user_preferences['priceRange'].split('-')
-                prompt += f"Price Range: ${min_price} to ${max_price}\n"
+                parts.append(f"Price Range: ${min_price} to ${max_price}\n")
             except:
-                prompt += f"Price Range: {user_preferences['priceRange']}\n"
+                parts.append(f"Price Range: {user_preferences['priceRange']}\n")
         
-        # mention categories in the prompt that the user chose
+        # mention categories and brands in the prompt that the user chose
         categories = user_preferences['categories']
-        prompt += f"The user wants products specific to these categories: {', '.join(categories) if categories else 'No specific preference'}\n"
-        # mention brands that the user chose
+        parts.append(f"The user wants products specific to these categories: {', '.join(categories) if categories else 'No specific preference'}\n")
         brands = user_preferences['brands']
-        prompt += f"The user wants to products specific to these brands: {', '.join(brands) if brands else 'No specific preference'}\n"
+        parts.append(f"The user wants to products specific to these brands: {', '.join(brands) if brands else 'No specific preference'}\n")
         
         # add the browsing history of the user to the prompt
-        prompt += "\n===== BROWSING HISTORY =====\n"
+        parts.append("\n===== BROWSING HISTORY =====\n")
+        used_tokens = PROMPT_HEADER_TOKENS + RECOMMENDATION_INSTRUCTIONS_TOKENS + estimate_tokens(''.join(parts))
         if browsed_products:
             for product in browsed_products:
-                prompt += f"• {product['name']}\n"
-                prompt += f"  - ID: {product['id']}\n"
-                prompt += f"  - Category: {product['category']}\n"
-                prompt += f"  - Price: ${product['price']}\n"
-                if 'brand' in product:
-                    prompt += f"  - Brand: {product['brand']}\n"
-                if 'rating' in product:
-                    prompt += f"  - Rating: {product['rating']}/5\n"
-                
-                # include tags and features that have the most relevance, top 3
-                if 'features' in product and product['features']:
-                    prompt += f"  - Features: {', '.join(product['features'][:3])}\n"
-                if 'tags' in product and product['tags']:
-                    prompt += f"  - Tags: {', '.join(product['tags'][:3])}\n"
+                parts.append(self.product_service.get_browsed_fragment(product))
+                used_tokens += self.product_service.get_browsed_fragment_tokens(product)
         else:
             # if there is no browsing history
-            prompt += "User has not viewed any products yet.\n"
+            parts.append("User has not viewed any products yet.\n")
+            used_tokens += estimate_tokens(parts[-1])
         
-        # Select a smaller subset of relevant products to stay within token limits
-        relevant_products = self._select_relevant_products(user_preferences, browsed_products, all_products)
-        relevant_products = relevant_products[:15]  # Limit to 15 candidates to save tokens
-        
-        prompt += f"\n===== CANDIDATE PRODUCTS ({len(relevant_products)} selected) =====\n"
+        # fill the remaining budget with the most relevant candidates
+        relevant_products = self._select_relevant_products(
+            user_preferences, browsed_products, all_products, max_products=self.prompt_max_candidates
+        )
+        section_tokens = estimate_tokens(f"\n===== CANDIDATE PRODUCTS ({len(relevant_products)} selected) =====\n")
+        remaining = self.prompt_token_budget - used_tokens - section_tokens
+
+        candidate_parts = []
         for product in relevant_products:
-            prompt += f"• {product['name']}\n"
-            prompt += f"  - ID: {product['id']}\n"
-            prompt += f"  - Category: {product['category']}\n"
-            prompt += f"  - Price: ${product['price']}\n"
-            if 'brand' in product:
-                prompt += f"  - Brand: {product['brand']}\n"
-            if 'rating' in product:
-                prompt += f"  - Rating: {product['rating']}/5\n"
-            if 'features' in product and product['features']:
-                prompt += f"  - Features: {', '.join(product['features'][:2])}\n"
-        
-        prompt += "==== RECOMMENDATION REQUIREMENTS ====\n"
-        prompt += "Select EXACTLY 5 products that would create the most compelling and personalized recommendations for this specific user.\n\n"
-        
-        # recommendation strategy
-        prompt += "Your recommendation strategy should include:\n\n"
-        
-        prompt += "1. RELEVANCE & INTENT MATCHING:\n"
-        prompt += "   - Products that directly satisfy the intent signaled by their browsing behavior\n"
-        prompt += "   - Items that strongly align with their explicitly stated preferences\n\n"
-        
-        prompt += "2. PSYCHOGRAPHIC MATCHING:\n"
-        prompt += "   - Consider the customer persona suggested by their browsing patterns\n"
-        prompt += "   - Match to products that appeal to similar customer segments\n\n"
-        
-        prompt += "3. STRATEGIC RECOMMENDATION MIX:\n"
-        prompt += "   - Core Recommendations: 2-3 products very closely matching their demonstrated interests\n"
-        prompt += "   - Complementary Products: 1-2 items that enhance products they've browsed\n"
-        prompt += "   - Discovery Product: 1 unexpected but relevant item to expand their horizons\n\n"
-        
-        prompt += "4. DETAILED PERSONALIZED REASONING:\n"
-        prompt += "   - For each product, explain specifically WHY it matches this particular user\n"
-        prompt += "   - Reference concrete aspects of their behavior or preferences\n"
-        prompt += "   - Highlight key product features that address their specific needs or interests\n"
-        prompt += "   - Use insights from similar customer purchase patterns where relevant\n\n"
-        
-        # specific examples of excellent vs. poor explanations
-        prompt += "QUALITY BENCHMARK EXAMPLES:\n"
-        prompt += "✓ EXCELLENT: \"This wireless charger complements the premium smartphone you viewed earlier, addressing your interest in fast-charging technology (which appeared in 3 of your browsed items). Its compact design also aligns with the portable accessories you've been exploring.\"\n\n"
-        
-        prompt += "✗ POOR: \"This is a highly-rated product that many customers enjoy and would be a good match for your preferences.\"\n\n"
-        
-        # response format
-        prompt += "FORMAT YOUR RESPONSE AS A JSON ARRAY EXACTLY LIKE THIS:\n"
-        # many shot prompting
-        prompt += """[
-      {
-        "product_id": "prod123",
-        "explanation": "Clear reasoning for this recommendation that connects to the user's specific interests",
-        "score": 8
-      },
-      {
-        "product_id": "prod456",
-        "explanation": "Explanation for second product",
-        "score": 7
-      },
-      {
-        "product_id": "prod789",
-        "explanation": "Explanation for third product",
-        "score": 6
-      }
-    ]"""
-        
-        return prompt
+            tokens = self.product_service.get_candidate_fragment_tokens(product)
+            if len(candidate_parts) < self.prompt_min_candidates or tokens <= remaining:
+                candidate_parts.append(self.product_service.get_candidate_fragment(product))
+                remaining -= tokens
+        
+        parts.append(f"\n===== CANDIDATE PRODUCTS ({len(candidate_parts)} selected) =====\n")
+        parts.extend(candidate_parts)
+        parts.append(RECOMMENDATION_INSTRUCTIONS)
+
+        prompt_tokens = self.prompt_token_budget - remaining
+        return PROMPT_HEADER + ''.join(parts), prompt_tokens
     
     def _select_relevant_products(self, user_preferences, browsed_products, all_products, max_products=15):
         """
         Enhanced selection of relevant products from the catalog for recommendations.
         Uses a more sophisticated scoring algorithm to find the most relevant matches.
+
+        Products are scored on preferred/browsed category and brand, price fit,
+        rating, shared tags and feature word overlap with the browsing history,
+        plus how often other users viewed them together with the browsed ones.
+        Scoring runs on the columnar catalog built by the product service.
         
         Parameters:
         - user_preferences (dict): User's stated preferences
@@ -238,170 +766,18 @@ class LLMService:
         Returns:
         - list: Filtered and sorted list of products most relevant to the user
         """
-        # browsing history
-        browsed_ids = set()
-        browsed_categories = set()
-        browsed_brands = set()
-        browsed_tags = set()
-        browsed_price_points = []
-        
-        for product in browsed_products:
-            browsed_ids.add(product['id'])
-            if 'category' in product:
-                browsed_categories.add(product['category'])
-            if 'brand' in product:
-                browsed_brands.add(product['brand'])
-            if 'tags' in product and product['tags']:
-                browsed_tags.update(product['tags'])
-            if 'price' in product:
-                browsed_price_points.append(product['price'])
-        
-        # user's preferred categories and brands
-        preferred_categories = set(user_preferences['categories']) if user_preferences['categories'] else set()
-        preferred_brands = set(user_preferences['brands']) if user_preferences['brands'] else set()
-        
-        #all_categories = browsed_categories.union(preferred_categories)
-        #all_brands = browsed_brands.union(preferred_brands)
-        
-        # price range metrics 
-        avg_browsed_price = None
-        if browsed_price_points:
-            avg_browsed_price = sum(browsed_price_points) / len(browsed_price_points)
-        
-        # scores for each product
-        product_scores = []
-        
-        for product in all_products:
-            if product['id'] in browsed_ids:
-                continue
-                
-            score = 0
-            
-            #feature matching
-            if 'category' in product:
-                # Strong match for explicitly preferred categories
-                if product['category'] in preferred_categories:
-                    score += 4
-                # Good match for categories in browsing history
-                elif product['category'] in browsed_categories:
-                    score += 3
-                   
-            if 'brand' in product:
-                # Strong match for explicitly preferred brands
-                if product['brand'] in preferred_brands:
-                    score += 4
-                # Good match for brands in browsing history
-                elif product['brand'] in browsed_brands:
-                    score += 2.5
-            
-            if user_preferences['priceRange'] != 'all' and 'price' in product:
-                try:
-                    min_price, max_price = map(float, user_preferences['priceRange'].split('-'))
-                    # Full points if within range
-                    if min_price <= product['price'] <= max_price:
-                        score += 3
-                    # Partial points if close to range (within 20 percent)
-                    elif (product['price'] < min_price and product['price'] >= min_price * 0.8) or \
-                         (product['price'] > max_price and product['price'] <= max_price * 1.2):
-                        score += 1
-                except:
-                    pass
-            # browsing history without price preferneces
-            elif avg_browsed_price is not None and 'price' in product:
-                # Price similarity to browsed products
-                price_diff_ratio = abs(product['price'] - avg_browsed_price) / avg_browsed_price if avg_browsed_price > 0 else 1
-                if price_diff_ratio <= 0.2:  # within 20 percent  of average browsed price
-                    score += 2
-                elif price_diff_ratio <= 0.4:  # within 40 percent of average browsed price
-                    score += 1
-            
-
-            if 'rating' in product:
-                if product['rating'] >= 4.7:
-                    score += 2
-                elif product['rating'] >= 4.5:
-                    score += 1.5
-                elif product['rating'] >= 4.0:
-                    score += 1
-            
-
-            if 'tags' in product and product['tags'] and browsed_tags:
-                common_tags = set(product['tags']).intersection(browsed_tags)
-                # More points for more tag matches
-                score += len(common_tags) * 0.75
-
-            if browsed_products and 'features' in product and product['features']:
-                # Extract features from browsed products
-                browsed_features = set()
-                for bp in browsed_products:
-                    if 'features' in bp and bp['features']:
-                        browsed_features.update(bp['features'])
-                
-                #text matching implemented
-                feature_matches = 0
-                for feature in product['features']:
-                    feature_lower = feature.lower()
-                    for browsed_feature in browsed_features:
-                        if any(word in feature_lower for word in browsed_feature.lower().split()):
-                            feature_matches += 1
-                            break
-                
-                score += feature_matches * 0.5
-            
-
-            if preferred_categories and 'category' in product:
-                if product['category'] not in browsed_categories and product['category'] in preferred_categories:
-                    score += 1  
-            
-            
-            product_scores.append((product, score))
-        
-        # sorting products via relevance scores higher to lower
-        product_scores.sort(key=lambda x: x[1], reverse=True)
-        
-        # exploring other products if there are no enough products for recommendation
-        selected_products = []
-        selected_categories = set()
-        
-       # adding most relevant product
-        if product_scores:
-            selected_products.append(product_scores[0][0])
-            if 'category' in product_scores[0][0]:
-                selected_categories.add(product_scores[0][0]['category'])
-        
-        # adding more products, ensuring category diversity
-        remaining_scores = product_scores[1:]
-        
-        # adding some products from different categories 
-        for product, score in remaining_scores:
-            if len(selected_products) >= max_products:
-                break
-                
-            category = product.get('category', '')
-            
-            if len(selected_categories) >= 3 or not category or category in selected_categories:
-                continue
-            
-            selected_products.append(product)
-            if category:
-                selected_categories.add(category)
-        
+        with span('select'):
+            catalog = self._scoring_catalog(all_products)
+            return catalog.select(user_preferences, browsed_products, max_products,
+                                  self._related_products(browsed_products))
 
-        for product, score in remaining_scores:
-            if len(selected_products) >= max_products:
-                break
-                
-            if product not in selected_products:
-                selected_products.append(product)
-        
-        return selected_products[:max_products]
     def _parse_recommendation_response(self, llm_response, all_products):
         """
         Parse the LLM response to extract product recommendations
         
         Parameters:
         - llm_response (str): Raw response from the LLM
-        - all_products (list): Full product catalog to match IDs with full product info
+        - all_products (list): Full product catalog (IDs are resolved through the product service index)
         
         Returns:
         - dict: Structured recommendations
@@ -443,21 +819,9 @@ class LLMService:
             # Enrich recommendations with full product details
             recommendations = []
             for rec in rec_data:
-                product_id = rec.get('product_id')
-                product_details = None
-                
-                # Find the full product details
-                for product in all_products:
-                    if product['id'] == product_id:
-                        product_details = product
-                        break
-                
-                if product_details:
-                    recommendations.append({
-                        "product": product_details,
-                        "explanation": rec.get('explanation', ''),
-                        "confidence_score": rec.get('score', 5)
-                    })
+                enriched = self._enrich_recommendation(rec)
+                if enriched:
+                    recommendations.append(enriched)
             #print(recommendations)
             return {
                 "recommendations": recommendations,
@@ -465,8 +829,25 @@ class LLMService:
             }
             
         except Exception as e:
-            print(f"Error parsing LLM response: {str(e)}")
+            log.warning('llm.parse_failed', error=str(e))
             return {
                 "recommendations": [],
                 "error": f"Failed to parse recommendations: {str(e)}"
-            }
\ No newline at end of file
+            }
+
+    def _enrich_recommendation(self, rec):
+        """
+        Turn one item of the LLM's JSON answer into a recommendation with the
+        full product attached
+
+        Returns:
+        - dict or None: The recommendation, None if the product ID is unknown
+        """
+        product_details = self.product_service.get_product_by_id(rec.get('product_id'))
+        if not product_details:
+            return None
+        return {
+            "product": product_details,
+            "explanation": rec.get('explanation', ''),
+            "confidence_score": rec.get('score', 5)
+        }
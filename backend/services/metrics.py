@@ -0,0 +1,242 @@
+"""
+Stage timings and Prometheus metrics for the recommendation path.
+
+Code marks the stages of a request with `with span('llm'):`. Each span
+feeds a latency histogram, and if the request is being timed (see
+start_request_timing, called by the HTTP middleware) it is also added to
+that request's Server-Timing header. Spans nest: 'prompt' includes 'select'.
+
+Everything is kept in process memory and rendered in the Prometheus text
+exposition format by MetricsRegistry.render().
+"""
+
+import bisect
+import threading
+import time
+from contextvars import ContextVar
+
+from .structured_logging import get_logger
+
+log = get_logger(__name__)
+
+# seconds; LLM calls take seconds, everything else well under a millisecond
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{escaped}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """
+    Monotonic counter, one series per combination of label values
+    """
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels[name] for name in self.labelnames), 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """
+    Distribution of observed values over fixed buckets, one series per
+    combination of label values
+    """
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (last one is +Inf), sum, count]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, **labels):
+        series = self._series.get(tuple(labels[name] for name in self.labelnames))
+        return series[2] if series else 0
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._series.items())
+        for key, (counts, total, count) in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames + ('le',), key + (_format_value(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    The metrics of the process, plus collectors that read values owned by
+    other services at scrape time
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, help_text, labelnames=()):
+        metric = Counter(name, help_text, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help_text, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        """
+        Register a function called on every scrape
+
+        Parameters:
+        - collector (callable): Returns a list of (name, type, help, samples)
+          tuples, samples being (labels dict, value) pairs
+        """
+        self._collectors.append(collector)
+
+    def render(self):
+        """
+        All metrics in the Prometheus text exposition format
+
+        Returns:
+        - str: The exposition, ending with a newline
+        """
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            try:
+                families = collector()
+            except Exception as e:
+                log.exception('metrics.collector_failed', error=str(e))
+                continue
+            for name, kind, help_text, samples in families:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    names = tuple(sorted(labels))
+                    lines.append(f"{name}{_format_labels(names, [labels[n] for n in names])} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    'recommendation_stage_seconds', 'Time spent in each stage of a recommendation request', ('stage',))
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    'http_request_duration_seconds', 'HTTP request latency until the response starts', ('method', 'route', 'status'))
+LLM_ERRORS = REGISTRY.counter('llm_errors_total', 'LLM calls that failed', ('call',))
+LLM_TOKENS = REGISTRY.counter('llm_tokens_total', 'Tokens reported by the LLM API', ('type',))
+
+_request_timings = ContextVar('request_timings', default=None)
+
+
+def start_request_timing():
+    """
+    Collect the spans of the current request (and the tasks and threads it
+    starts from here on)
+
+    Returns:
+    - tuple: (list the spans are appended to, token for stop_request_timing)
+    """
+    timings = []
+    return timings, _request_timings.set(timings)
+
+
+def stop_request_timing(token):
+    _request_timings.reset(token)
+
+
+class span:
+    """
+    Time a stage of the current request: `with span('parse'): ...`
+    """
+
+    __slots__ = ('stage', 'started')
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.started
+        STAGE_SECONDS.observe(elapsed, stage=self.stage)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((self.stage, elapsed))
+        return False
+
+
+def server_timing(timings, total=None):
+    """
+    Server-Timing header value for the spans of a request
+
+    Repeated stages (e.g. two cache lookups) are summed.
+
+    Parameters:
+    - timings (list): (stage, seconds) pairs from start_request_timing
+    - total (float): Whole request in seconds, added as 'total'
+
+    Returns:
+    - str: e.g. 'cache_lookup;dur=0.12, llm;dur=812.5, total;dur=815.1'
+    """
+    durations = {}
+    for stage, seconds in timings:
+        durations[stage] = durations.get(stage, 0.0) + seconds
+    if total is not None:
+        durations['total'] = total
+    return ', '.join(f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in durations.items())
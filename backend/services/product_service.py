@@ -1,30 +1,340 @@
 import json
+import os
+import threading
+from collections.abc import Mapping
+import numpy as np
 from config import config
+from .catalog_response import CatalogResponse
+from .catalog_snapshot import load_snapshot
+from .prompt_fragments import build_fragments, format_browsed_product, format_candidate_product
+from .scoring_engine import ScoringCatalog
+from .structured_logging import get_logger
+from .token_estimator import estimate_tokens
+
+log = get_logger(__name__)
+
+# version of what CatalogVersion stores in catalog snapshots; bump it when
+# snapshot_sections changes so existing snapshots are rebuilt
+SNAPSHOT_SECTIONS_FORMAT = 2
+
+
+def snapshot_sections_format():
+    """Format tag of the snapshot sections under the current configuration"""
+    return f"{SNAPSHOT_SECTIONS_FORMAT}:{config['CONTENT_SIMILARITY']}"
+
+
+def snapshot_sections(products):
+    """
+    Build a catalog over product dicts and return its snapshot sections, the
+    `derive` hook of load_snapshot
+    """
+    return CatalogVersion(products).snapshot_sections()
+
+
+def _prefixed(values, prefix):
+    """Entries of a dict whose name starts with prefix, without the prefix"""
+    return {name[len(prefix):]: value for name, value in values.items() if name.startswith(prefix)}
+
+
+class _PostingIndex(Mapping):
+    """
+    Facet value -> positions of the products that have it, read from the
+    posting lists of the scoring catalog on access
+    """
+
+    __slots__ = ('_codes', '_postings')
+
+    def __init__(self, vocab, postings):
+        # falsy values are left out, as if the products did not have the facet
+        self._codes = {value: code for value, code in vocab.items() if value}
+        self._postings = postings
+
+    def __getitem__(self, value):
+        code = self._codes[value]
+        ptr, rows = self._postings
+        return rows[ptr[code]:ptr[code + 1]].tolist()
+
+    def __iter__(self):
+        return iter(self._codes)
+
+    def __len__(self):
+        return len(self._codes)
+
+
+class _ByProductId(Mapping):
+    """
+    Per-position values looked up by product id, from the first product with
+    that id
+    """
+
+    __slots__ = ('_id_positions', '_values')
+
+    def __init__(self, id_positions, values):
+        self._id_positions = id_positions
+        self._values = values
+
+    def __getitem__(self, product_id):
+        return self._values[self._id_positions[product_id][0]]
+
+    def __iter__(self):
+        return iter(self._id_positions)
+
+    def __len__(self):
+        return len(self._id_positions)
+
+
+class CatalogVersion:
+    """
+    One loaded catalog and everything derived from it.
+
+    Never modified after construction: a reload builds a new CatalogVersion and
+    ProductService swaps it in with a single assignment, so requests never
+    need a lock and never see indexes from one version next to products from
+    another, as long as they read the version once.
+    """
+    
+    def __init__(self, products, snapshot=None, source_stamp=None):
+        """
+        Build the indexes over a product list
+
+        Parameters:
+        - products (list): Product catalog
+        - snapshot (MappedCatalog): Mapped snapshot the products live in, if
+          any; indexes stored in it are mapped instead of rebuilt
+        - source_stamp (tuple): (size, mtime_ns) of the file they were read from
+        """
+        self.products = products
+        self.snapshot = snapshot
+        self.source_stamp = source_stamp
+        if snapshot is not None and snapshot.derived_format == snapshot_sections_format():
+            self._map_indexes(snapshot.derived)
+        else:
+            self._build_indexes()
+        self.version = self.catalog_response.version
+    
+    def _build_indexes(self):
+        """
+        Build the indexes, scoring columns, prompt fragments and encoded
+        bodies over the loaded catalog
+        """
+        # columnar copy of the catalog for vectorized candidate scoring
+        self.scoring_catalog = ScoringCatalog(
+            self.products, config['CONTENT_SIMILARITY'], config['CANDIDATE_RETRIEVAL'])
+        self._index_products()
+
+        # prompt text per product, rebuilt together with the indexes
+        self.browsed_fragments, self.candidate_fragments = build_fragments(self.products)
+        self.browsed_fragment_tokens = {pid: estimate_tokens(text) for pid, text in self.browsed_fragments.items()}
+        self.candidate_fragment_tokens = {pid: estimate_tokens(text) for pid, text in self.candidate_fragments.items()}
+
+        # pre-encoded /api/products bodies; their hash doubles as the version
+        self.catalog_response = CatalogResponse(self.products)
+
+    def _map_indexes(self, sections):
+        """
+        Take the indexes from the sections snapshot_sections() stored in the
+        snapshot; arrays and bodies stay in the shared mapping and fragments
+        are decoded when they are used, so no product is read here
+        """
+        self.scoring_catalog = ScoringCatalog.from_state(
+            self.products, _prefixed(sections, 'scoring.'),
+            config['CONTENT_SIMILARITY'], config['CANDIDATE_RETRIEVAL'])
+        self._index_products()
+
+        id_positions = self.scoring_catalog.id_positions
+        self.browsed_fragments = _ByProductId(id_positions, sections['fragments.browsed'])
+        self.candidate_fragments = _ByProductId(id_positions, sections['fragments.candidate'])
+        self.browsed_fragment_tokens = _ByProductId(id_positions, sections['fragments.browsed_tokens'].tolist())
+        self.candidate_fragment_tokens = _ByProductId(id_positions, sections['fragments.candidate_tokens'].tolist())
+
+        positions = {pid: rows[0] for pid, rows in id_positions.items()}
+        self.catalog_response = CatalogResponse.from_state(self.products, positions, _prefixed(sections, 'response.'))
+
+    def _index_products(self):
+        """
+        Lookup indexes over the loaded catalog so that id lookups and facet
+        filters do not have to scan every product.
+
+        Facet posting lists are the scoring catalog's; they hold positions
+        into self.products, in catalog order.
+        """
+        scoring = self.scoring_catalog
+        # first occurrence wins, same as the old linear scan
+        self.products_by_id = {pid: self.products[rows[0]] for pid, rows in scoring.id_positions.items()}
+        self.category_index = _PostingIndex(scoring.category_vocab, scoring.category_postings)
+        self.brand_index = _PostingIndex(scoring.brand_vocab, scoring.brand_postings)
+        self.subcategory_index = _PostingIndex(scoring.subcategory_vocab, scoring.subcategory_postings)
+        self.tag_index = _PostingIndex(scoring.tag_vocab, scoring.tag_postings)
+
+    def snapshot_sections(self):
+        """
+        Everything derived from the products, to store in a catalog snapshot
+        so that processes mapping it skip _build_indexes
+
+        Returns:
+        - dict: Derived values for write_snapshot
+        """
+        ids = [product['id'] for product in self.products]
+        sections = {f'scoring.{name}': value for name, value in self.scoring_catalog.state().items()}
+        sections.update((f'response.{name}', value) for name, value in self.catalog_response.state().items())
+        sections['fragments.browsed'] = [self.browsed_fragments[pid] for pid in ids]
+        sections['fragments.candidate'] = [self.candidate_fragments[pid] for pid in ids]
+        sections['fragments.browsed_tokens'] = np.array(
+            [self.browsed_fragment_tokens[pid] for pid in ids], dtype=np.int32)
+        sections['fragments.candidate_tokens'] = np.array(
+            [self.candidate_fragment_tokens[pid] for pid in ids], dtype=np.int32)
+        return sections
+
+
+def _current(name):
+    """Read-only attribute of the current catalog version"""
+    return property(lambda self: getattr(self.catalog, name))
+
 
 class ProductService:
     """
     Service to handle product data operations
     """
-    
+
+    products = _current('products')
+    products_by_id = _current('products_by_id')
+    category_index = _current('category_index')
+    brand_index = _current('brand_index')
+    subcategory_index = _current('subcategory_index')
+    tag_index = _current('tag_index')
+    scoring_catalog = _current('scoring_catalog')
+    browsed_fragments = _current('browsed_fragments')
+    candidate_fragments = _current('candidate_fragments')
+    browsed_fragment_tokens = _current('browsed_fragment_tokens')
+    candidate_fragment_tokens = _current('candidate_fragment_tokens')
+    catalog_response = _current('catalog_response')
+    snapshot = _current('snapshot')
+    version = _current('version')
+
     def __init__(self):
         """
         Initialize the product service with data path from config
         """
         self.data_path = config['DATA_PATH']
-        self.products = self._load_products()
-        #print(self.products)
-    
+        self.snapshot_path = config['CATALOG_SNAPSHOT_PATH']
+        self._reload_lock = threading.Lock()
+        self._watcher = None
+        self._watcher_stop = threading.Event()
+        # (size, mtime_ns) of DATA_PATH when it was last read; kept here, not
+        # on the shared CatalogVersion, since a reload that finds the same
+        # content keeps the current version but still moves the stamp on
+        self._seen_stamp = None
+        self.catalog = self._load_catalog()
+
+    def _source_stamp(self):
+        try:
+            stat = os.stat(self.data_path)
+            return (stat.st_size, stat.st_mtime_ns)
+        except OSError:
+            return None
+
+    def _load_catalog(self):
+        """
+        Load products and build a CatalogVersion over them
+        """
+        source_stamp = self._source_stamp()
+        snapshot, products = self._load_products()
+        self._seen_stamp = source_stamp
+        return CatalogVersion(products, snapshot, source_stamp)
+
     def _load_products(self):
         """
         Load products from the JSON data file
+
+        With CATALOG_SNAPSHOT_PATH set, the catalog is mapped from a binary
+        snapshot of the JSON file instead (built on first use), and products
+        are read-only ProductRecord mappings shared between worker processes.
+        The snapshot also carries the catalog indexes, see snapshot_sections.
+
+        Returns:
+        - tuple: (MappedCatalog or None, product list)
         """
+        if self.snapshot_path:
+            try:
+                snapshot = load_snapshot(
+                    self.snapshot_path, self.data_path, snapshot_sections, snapshot_sections_format())
+                return snapshot, snapshot.products
+            except Exception as e:
+                log.warning('catalog.snapshot_failed', path=self.snapshot_path, error=str(e))
         try:
             with open(self.data_path, 'r') as file:
-                return json.load(file)
+                return None, json.load(file)
         except Exception as e:
-            print(f"Error loading product data: {str(e)}")
-            return []
-    
+            log.error('catalog.load_failed', path=self.data_path, error=str(e))
+            return None, []
+
+    def reload(self):
+        """
+        Re-read the catalog and swap it in if its content changed
+
+        Everything is rebuilt before the swap; requests keep using the old
+        version until then. A catalog that fails to load leaves the current
+        one in place.
+
+        Returns:
+        - bool: True if a new version was swapped in
+        """
+        with self._reload_lock:
+            source_stamp = self._source_stamp()
+            snapshot, products = self._load_products()
+            if not products and self.catalog.products:
+                log.warning('catalog.reload_empty', version=self.catalog.version)
+                return False
+            catalog = CatalogVersion(products, snapshot, source_stamp)
+            self._seen_stamp = source_stamp
+            if catalog.version == self.catalog.version:
+                return False
+            previous = self.catalog.version
+            self.catalog = catalog
+            log.info('catalog.reloaded', previous_version=previous, version=catalog.version, products=len(products))
+            return True
+
+    def reload_if_changed(self):
+        """
+        Reload the catalog if DATA_PATH changed since it was last read, e.g.
+        in a worker forked from a process that loaded it earlier
+
+        Returns:
+        - bool: True if a new version was swapped in
+        """
+        stamp = self._source_stamp()
+        if stamp is None or stamp == self._seen_stamp:
+            return False
+        return self.reload()
+
+    def start_watcher(self, interval_seconds):
+        """
+        Reload the catalog in a background thread whenever DATA_PATH changes
+
+        Parameters:
+        - interval_seconds (float): How often to check the file; 0 disables it
+        """
+        if interval_seconds <= 0 or self._watcher is not None:
+            return
+
+        def watch():
+            while not self._watcher_stop.wait(interval_seconds):
+                try:
+                    self.reload_if_changed()
+                except Exception as e:
+                    log.error('catalog.reload_failed', error=str(e))
+
+        self._watcher_stop.clear()
+        self._watcher = threading.Thread(target=watch, name='catalog-watcher', daemon=True)
+        self._watcher.start()
+
+    def stop_watcher(self):
+        """Stop the background watcher, if running"""
+        if self._watcher is not None:
+            self._watcher_stop.set()
+            self._watcher.join()
+            self._watcher = None
+
     def get_all_products(self):
         """
         Return all products
@@ -35,13 +345,112 @@ class ProductService:
         """
         Get a specific product by ID
         """
-        for product in self.products:
-            if product['id'] == product_id:
-                return product
-        return None
+        return self.products_by_id.get(product_id)
+
+    def get_products_by_ids(self, product_ids):
+        """
+        Get products for a list of IDs
+
+        Unknown IDs are skipped; order and repeats of the input are kept.
+
+        Parameters:
+        - product_ids (list): Product IDs to look up
+
+        Returns:
+        - list: Matching products
+        """
+        products_by_id = self.products_by_id
+        return [products_by_id[pid] for pid in product_ids if pid in products_by_id]
     
+    def get_browsed_fragment(self, product):
+        """
+        Prompt block for a product in the user's browsing history
+
+        Precomputed for catalog products; rendered on the fly for anything else.
+        """
+        catalog = self.catalog
+        if catalog.products_by_id.get(product['id']) is product:
+            return catalog.browsed_fragments[product['id']]
+        return format_browsed_product(product)
+
+    def get_candidate_fragment(self, product):
+        """
+        Prompt block for a candidate product
+
+        Precomputed for catalog products; rendered on the fly for anything else.
+        """
+        catalog = self.catalog
+        if catalog.products_by_id.get(product['id']) is product:
+            return catalog.candidate_fragments[product['id']]
+        return format_candidate_product(product)
+
+    def get_browsed_fragment_tokens(self, product):
+        """
+        Estimated token count of get_browsed_fragment(product)
+        """
+        catalog = self.catalog
+        if catalog.products_by_id.get(product['id']) is product:
+            return catalog.browsed_fragment_tokens[product['id']]
+        return estimate_tokens(format_browsed_product(product))
+
+    def get_candidate_fragment_tokens(self, product):
+        """
+        Estimated token count of get_candidate_fragment(product)
+        """
+        catalog = self.catalog
+        if catalog.products_by_id.get(product['id']) is product:
+            return catalog.candidate_fragment_tokens[product['id']]
+        return estimate_tokens(format_candidate_product(product))
+
     def get_products_by_category(self, category):
         """
         Get products filtered by category
         """
-        return [p for p in self.products if p['category'] == category]
\ No newline at end of file
+        catalog = self.catalog
+        return [catalog.products[i] for i in catalog.category_index.get(category, [])]
+
+    def get_products_by_brand(self, brand):
+        """
+        Get products filtered by brand
+        """
+        catalog = self.catalog
+        return [catalog.products[i] for i in catalog.brand_index.get(brand, [])]
+
+    def find_products(self, categories=None, brands=None, subcategories=None, tags=None):
+        """
+        Faceted product lookup over the catalog indexes
+
+        A product matches a facet if it has any of the given values; it has to
+        match every facet that is given. Facets left as None are not filtered on.
+
+        Parameters:
+        - categories (list): Category names
+        - brands (list): Brand names
+        - subcategories (list): Subcategory names
+        - tags (list): Tags
+
+        Returns:
+        - list: Matching products in catalog order
+        """
+        catalog = self.catalog
+        facets = (
+            (catalog.category_index, categories),
+            (catalog.brand_index, brands),
+            (catalog.subcategory_index, subcategories),
+            (catalog.tag_index, tags),
+        )
+
+        positions = None
+        for index, values in facets:
+            if values is None:
+                continue
+            matched = set()
+            for value in values:
+                matched.update(index.get(value, ()))
+            positions = matched if positions is None else positions & matched
+            if not positions:
+                return []
+
+        if positions is None:
+            return list(catalog.products)
+        return [catalog.products[i] for i in sorted(positions)]
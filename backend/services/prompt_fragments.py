@@ -0,0 +1,69 @@
+"""
+Prompt text for individual products.
+
+The product blocks of the recommendation prompt only depend on the product, so
+the product service renders them once per catalog load and the prompt builder
+just joins the precomputed strings.
+"""
+
+
+def _product_header(product):
+    return (
+        f"• {product['name']}\n"
+        f"  - ID: {product['id']}\n"
+        f"  - Category: {product['category']}\n"
+        f"  - Price: ${product['price']}\n"
+    )
+
+
+def format_browsed_product(product):
+    """
+    Render a product the user has viewed, for the BROWSING HISTORY section
+
+    Includes brand, rating and the top 3 features and tags when present.
+    """
+    parts = [_product_header(product)]
+    if 'brand' in product:
+        parts.append(f"  - Brand: {product['brand']}\n")
+    if 'rating' in product:
+        parts.append(f"  - Rating: {product['rating']}/5\n")
+    if 'features' in product and product['features']:
+        parts.append(f"  - Features: {', '.join(product['features'][:3])}\n")
+    if 'tags' in product and product['tags']:
+        parts.append(f"  - Tags: {', '.join(product['tags'][:3])}\n")
+    return ''.join(parts)
+
+
+def format_candidate_product(product):
+    """
+    Render a product for the CANDIDATE PRODUCTS section
+
+    Kept shorter than the browsed block: no tags and only the top 2 features.
+    """
+    parts = [_product_header(product)]
+    if 'brand' in product:
+        parts.append(f"  - Brand: {product['brand']}\n")
+    if 'rating' in product:
+        parts.append(f"  - Rating: {product['rating']}/5\n")
+    if 'features' in product and product['features']:
+        parts.append(f"  - Features: {', '.join(product['features'][:2])}\n")
+    return ''.join(parts)
+
+
+def build_fragments(products):
+    """
+    Render both fragment styles for every product in a catalog
+
+    Parameters:
+    - products (list): Product catalog
+
+    Returns:
+    - tuple: (browsed fragments by product id, candidate fragments by product id)
+    """
+    browsed = {}
+    candidate = {}
+    for product in products:
+        if product['id'] not in browsed:
+            browsed[product['id']] = format_browsed_product(product)
+            candidate[product['id']] = format_candidate_product(product)
+    return browsed, candidate
@@ -0,0 +1,233 @@
+"""
+Minimal blocking client for the Redis serialization protocol (RESP2).
+
+Only what the cache needs: commands, pipelines (all commands written at
+once, then all replies read) and a thread-safe connection pool. Works with
+Redis and with servers speaking its protocol (Valkey, KeyDB, DragonflyDB).
+"""
+
+import socket
+import threading
+from urllib.parse import unquote, urlparse
+
+
+class RespError(Exception):
+    """Error reply from the server"""
+
+
+def encode_command(args):
+    """
+    Encode a command as a RESP array of bulk strings
+
+    Parameters:
+    - args (tuple): Command name and arguments (str, bytes, int or float)
+
+    Returns:
+    - bytes: The encoded command
+    """
+    parts = [b'*%d\r\n' % len(args)]
+    for arg in args:
+        if isinstance(arg, str):
+            arg = arg.encode()
+        elif not isinstance(arg, bytes):
+            arg = str(arg).encode()
+        parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+    return b''.join(parts)
+
+
+class RespConnection:
+    """
+    One connection to the server; not thread-safe, see RespPool
+    """
+
+    def __init__(self, host, port, timeout=None):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._buffer = bytearray()
+
+    def close(self):
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+    def _fill(self):
+        chunk = self.sock.recv(65536)
+        if not chunk:
+            raise ConnectionError("Connection closed by the server")
+        self._buffer += chunk
+
+    def _read_line(self):
+        while True:
+            end = self._buffer.find(b'\r\n')
+            if end >= 0:
+                line = bytes(self._buffer[:end])
+                del self._buffer[:end + 2]
+                return line
+            self._fill()
+
+    def _read_exactly(self, length):
+        while len(self._buffer) < length + 2:
+            self._fill()
+        data = bytes(self._buffer[:length])
+        del self._buffer[:length + 2]
+        return data
+
+    def read_reply(self):
+        """
+        Read one reply
+
+        Returns:
+        - bytes, int, list or None: Bulk and simple strings as bytes, None for
+          nil; error replies are returned as RespError instances, so that one
+          failed command does not hide the other replies of a pipeline
+        """
+        line = self._read_line()
+        kind, rest = line[:1], line[1:]
+        if kind == b'$':
+            length = int(rest)
+            return None if length < 0 else self._read_exactly(length)
+        if kind == b'+':
+            return rest
+        if kind == b':':
+            return int(rest)
+        if kind == b'*':
+            count = int(rest)
+            return None if count < 0 else [self.read_reply() for _ in range(count)]
+        if kind == b'-':
+            return RespError(rest.decode(errors='replace'))
+        raise ConnectionError(f"Unexpected reply from the server: {line[:40]!r}")
+
+    def execute_many(self, commands):
+        """
+        Send commands in one write and read their replies
+
+        Returns:
+        - list: One reply per command, in order
+        """
+        self.sock.sendall(b''.join(encode_command(args) for args in commands))
+        return [self.read_reply() for _ in commands]
+
+
+class RespPool:
+    """
+    Thread-safe pool of connections to one server
+
+    Connections are opened on demand, up to max_connections; callers wait for
+    a free one beyond that. A connection that fails is closed instead of
+    being returned to the pool.
+    """
+
+    def __init__(self, host='localhost', port=6379, db=0, password=None, max_connections=16, timeout=5.0):
+        """
+        Parameters:
+        - host (str): Server host
+        - port (int): Server port
+        - db (int): Database selected on every new connection
+        - password (str): Sent with AUTH on every new connection, if given
+        - max_connections (int): Upper bound on open connections
+        - timeout (float): Seconds for connecting, each socket operation and
+          waiting for a free connection
+        """
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self._idle = []
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_url(cls, url, **options):
+        """
+        Pool for a redis://[:password@]host[:port][/db] URL
+        """
+        parsed = urlparse(url)
+        if parsed.scheme != 'redis':
+            raise ValueError(f"Unsupported cache URL scheme: {parsed.scheme}")
+        db = parsed.path.strip('/')
+        return cls(
+            host=parsed.hostname or 'localhost',
+            port=parsed.port or 6379,
+            db=int(db) if db else 0,
+            password=unquote(parsed.password) if parsed.password else None,
+            **options
+        )
+
+    def _connect(self):
+        connection = RespConnection(self.host, self.port, self.timeout)
+        try:
+            setup = []
+            if self.password:
+                setup.append(('AUTH', self.password))
+            if self.db:
+                setup.append(('SELECT', self.db))
+            for reply in connection.execute_many(setup) if setup else ():
+                if isinstance(reply, RespError):
+                    raise reply
+        except BaseException:
+            connection.close()
+            raise
+        return connection
+
+    def pipeline(self, commands):
+        """
+        Run commands on one connection in a single round trip
+
+        Parameters:
+        - commands (list): Tuples of command name and arguments
+
+        Returns:
+        - list: One reply per command; error replies are RespError instances
+        """
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError("No free cache connection")
+        try:
+            with self._lock:
+                connection = self._idle.pop() if self._idle else None
+            try:
+                if connection is None:
+                    connection = self._connect()
+                    replies = connection.execute_many(commands)
+                else:
+                    try:
+                        replies = connection.execute_many(commands)
+                    except ConnectionError:
+                        # the server may have dropped the idle connection; the
+                        # cache commands are idempotent, so retry once
+                        connection.close()
+                        connection = self._connect()
+                        replies = connection.execute_many(commands)
+            except BaseException:
+                if connection is not None:
+                    connection.close()
+                raise
+            with self._lock:
+                self._idle.append(connection)
+            return replies
+        finally:
+            self._slots.release()
+
+    def execute(self, *args):
+        """
+        Run one command
+
+        Returns:
+        - bytes, int, list or None: The reply
+
+        Raises:
+        - RespError: If the server answered with an error
+        """
+        reply = self.pipeline([args])[0]
+        if isinstance(reply, RespError):
+            raise reply
+        return reply
+
+    def close(self):
+        """Close the idle connections, e.g. before forking worker processes"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
@@ -0,0 +1,652 @@
+import re
+
+import numpy as np
+
+from .text_index import TfidfIndex, _ranges
+
+
+class ScoringCatalog:
+    """
+    Columnar view of the product catalog used to score recommendation candidates.
+
+    Prices and ratings are kept as float arrays, categories and brands as integer
+    codes, and tags and features as flat (row, id) pairs so that scoring a request
+    is a handful of array operations instead of a Python loop over every product.
+
+    Content similarity to the browsed products comes from a TF-IDF index over
+    name, description, features and tags. With content_similarity='features'
+    the original feature word matching is used instead, and scores and ranking
+    match the original per-product heuristic exactly.
+
+    Requests can also pass co-view scores of related products (see
+    CoViewModel.related), which are added on top.
+
+    With candidate_retrieval, a request only scores the products found in the
+    posting lists of its signals (categories, brands, subcategories, tags,
+    content terms and co-viewed products) and in the price window its price
+    range or browsed prices earn points for, plus the best rated products
+    overall and per category. Every other product scores on rating alone and
+    cannot make the top-k, so the ranking is that of the full scan while the
+    work grows with the number of matches rather than with the catalog.
+    """
+
+    # score added for a product whose text matches the browsed products perfectly
+    CONTENT_WEIGHT = 3.0
+    # score added for a product co-viewed with every browsed product, always
+    COVIEW_WEIGHT = 3.0
+
+    def __init__(self, products, content_similarity='tfidf', candidate_retrieval=False):
+        """
+        Build the columns from a list of product dicts
+
+        Parameters:
+        - products (list): Product catalog, kept by reference for returning results
+        - content_similarity (str): 'tfidf' or 'features' (legacy word matching)
+        - candidate_retrieval (bool): Only score products matching a signal of
+          the request instead of the whole catalog
+        """
+        if content_similarity not in ('tfidf', 'features'):
+            raise ValueError(f"Unsupported content similarity: {content_similarity}")
+
+        self.products = products
+        self.content_similarity = content_similarity
+        self.candidate_retrieval = candidate_retrieval
+        size = len(products)
+
+        self.prices = np.full(size, np.nan)
+        self.ratings = np.full(size, np.nan)
+        self.category_codes = np.full(size, -1, dtype=np.int32)
+        self.brand_codes = np.full(size, -1, dtype=np.int32)
+        self.subcategory_codes = np.full(size, -1, dtype=np.int32)
+        self.category_vocab = {}
+        self.brand_vocab = {}
+        self.subcategory_vocab = {}
+        self.tag_vocab = {}
+        self.id_positions = {}
+
+        tag_rows, tag_ids = [], []
+        feature_rows, feature_ids = [], []
+        feature_vocab = {}
+
+        for position, product in enumerate(products):
+            self.id_positions.setdefault(product['id'], []).append(position)
+            if 'price' in product:
+                self.prices[position] = product['price']
+            if 'rating' in product:
+                self.ratings[position] = product['rating']
+            if 'category' in product:
+                self.category_codes[position] = self.category_vocab.setdefault(
+                    product['category'], len(self.category_vocab))
+            if 'brand' in product:
+                self.brand_codes[position] = self.brand_vocab.setdefault(
+                    product['brand'], len(self.brand_vocab))
+            if product.get('subcategory'):
+                self.subcategory_codes[position] = self.subcategory_vocab.setdefault(
+                    product['subcategory'], len(self.subcategory_vocab))
+
+            for tag in set(product.get('tags') or ()):
+                tag_rows.append(position)
+                tag_ids.append(self.tag_vocab.setdefault(tag, len(self.tag_vocab)))
+
+            # every listed feature counts, including repeats
+            for feature in product.get('features') or ():
+                feature_rows.append(position)
+                feature_ids.append(feature_vocab.setdefault(feature.lower(), len(feature_vocab)))
+
+        self.tag_rows = np.array(tag_rows, dtype=np.int32)
+        self.tag_ids = np.array(tag_ids, dtype=np.int32)
+        self.feature_rows = np.array(feature_rows, dtype=np.int32)
+        self.feature_ids = np.array(feature_ids, dtype=np.int32)
+
+        # truthiness per category code, with a trailing slot for "no category"
+        self.category_truthy = np.array(
+            [bool(value) for value in self.category_vocab] + [False], dtype=bool)
+
+        # lower-cased distinct features joined into one blob so a browsed word can
+        # be located in all of them with a single regex scan
+        self.feature_blob = '\n'.join(feature_vocab)
+        starts, offset = [], 0
+        for feature in feature_vocab:
+            starts.append(offset)
+            offset += len(feature) + 1
+        self.feature_starts = np.array(starts, dtype=np.int64)
+
+        self.text_index = TfidfIndex(products) if content_similarity == 'tfidf' else None
+
+        # posting lists per category, brand, subcategory, tag and distinct feature
+        positions = np.arange(size, dtype=np.int32)
+        self.category_postings = self._postings(self.category_codes, positions, len(self.category_vocab))
+        self.brand_postings = self._postings(self.brand_codes, positions, len(self.brand_vocab))
+        self.subcategory_postings = self._postings(self.subcategory_codes, positions, len(self.subcategory_vocab))
+        self.tag_postings = self._postings(self.tag_ids, self.tag_rows, len(self.tag_vocab))
+        self.feature_postings = self._postings(self.feature_ids, self.feature_rows, len(feature_vocab))
+
+        # priced products sorted by price, to look up price windows
+        priced = np.flatnonzero(~np.isnan(self.prices)).astype(np.int32)
+        self.price_order = priced[np.argsort(self.prices[priced], kind='stable')]
+        self.sorted_prices = self.prices[self.price_order]
+
+        # backfill order for retrieval: most rating points first, catalog order
+        # on ties, which is how score() and rank() order otherwise equal products
+        self.rating_order = np.argsort(-self._rating_points(self.ratings), kind='stable').astype(np.int32)
+        # the same per category, for the category leaders rank() picks
+        self.category_rating_postings = self._postings(
+            self.category_codes[self.rating_order], self.rating_order, len(self.category_vocab))
+
+    # arrays, posting lists and vocabularies that make up a built catalog
+    STATE_ARRAYS = ('prices', 'ratings', 'category_codes', 'brand_codes', 'subcategory_codes', 'tag_rows',
+                    'tag_ids', 'feature_rows', 'feature_ids', 'category_truthy', 'feature_starts',
+                    'price_order', 'sorted_prices', 'rating_order')
+    STATE_POSTINGS = ('category_postings', 'brand_postings', 'subcategory_postings', 'tag_postings',
+                      'feature_postings', 'category_rating_postings')
+    STATE_VOCABS = ('category_vocab', 'brand_vocab', 'subcategory_vocab', 'tag_vocab')
+
+    def state(self):
+        """
+        Everything the columns are made of, to store them with the catalog
+
+        Returns:
+        - dict: Arrays by name (posting lists as '<name>_ptr' and
+          '<name>_rows'), vocabularies as lists in code order, the product ids
+          and the feature blob, and the text index state prefixed 'text_'
+        """
+        state = {name: getattr(self, name) for name in self.STATE_ARRAYS}
+        for name in self.STATE_POSTINGS:
+            state[f'{name}_ptr'], state[f'{name}_rows'] = getattr(self, name)
+        for name in self.STATE_VOCABS:
+            state[name] = list(getattr(self, name))
+        state['ids'] = [product['id'] for product in self.products]
+        state['feature_blob'] = self.feature_blob.encode('utf-8')
+        if self.text_index is not None:
+            state.update((f'text_{name}', value) for name, value in self.text_index.state().items())
+        return state
+
+    @classmethod
+    def from_state(cls, products, state, content_similarity='tfidf', candidate_retrieval=False):
+        """
+        Columns over the arrays returned by state(), without reading the products
+
+        Parameters:
+        - products (list): Product catalog the state was built from
+        - state (Mapping): Output of state(), e.g. mapped from a catalog
+          snapshot; the arrays are used as they are
+        - content_similarity (str): 'tfidf' (the state must include the text
+          index) or 'features'
+        - candidate_retrieval (bool): As for the constructor
+
+        Returns:
+        - ScoringCatalog: The columns
+        """
+        if content_similarity not in ('tfidf', 'features'):
+            raise ValueError(f"Unsupported content similarity: {content_similarity}")
+
+        catalog = cls.__new__(cls)
+        catalog.products = products
+        catalog.content_similarity = content_similarity
+        catalog.candidate_retrieval = candidate_retrieval
+        for name in cls.STATE_ARRAYS:
+            setattr(catalog, name, state[name])
+        for name in cls.STATE_POSTINGS:
+            setattr(catalog, name, (state[f'{name}_ptr'], state[f'{name}_rows']))
+        for name in cls.STATE_VOCABS:
+            setattr(catalog, name, {value: code for code, value in enumerate(state[name])})
+        catalog.id_positions = {}
+        for position, product_id in enumerate(state['ids']):
+            catalog.id_positions.setdefault(product_id, []).append(position)
+        catalog.feature_blob = bytes(state['feature_blob']).decode('utf-8')
+        catalog.text_index = None
+        if content_similarity == 'tfidf':
+            catalog.text_index = TfidfIndex.from_state(
+                {name[len('text_'):]: value for name, value in state.items() if name.startswith('text_')})
+        return catalog
+
+    def __len__(self):
+        return len(self.products)
+
+    @staticmethod
+    def _postings(keys, rows, size):
+        """
+        CSR posting lists: the rows of key k are rows[ptr[k]:ptr[k + 1]], in
+        the order given (ascending for positions).
+        Rows with key -1 (field missing) are left out.
+        """
+        present = keys >= 0
+        keys, rows = keys[present], rows[present]
+        ptr = np.zeros(size + 1, dtype=np.int64)
+        np.cumsum(np.bincount(keys, minlength=size), out=ptr[1:])
+        return ptr, rows[np.argsort(keys, kind='stable')]
+
+    @staticmethod
+    def _rating_points(ratings):
+        """Score points per rating; NaN (unrated) never compares true"""
+        return np.where(ratings >= 4.7, 2.0, np.where(ratings >= 4.5, 1.5, np.where(ratings >= 4.0, 1.0, 0.0)))
+
+    @staticmethod
+    def _gather(postings, keys):
+        """Concatenated posting lists of some keys (rows repeat across keys)"""
+        ptr, rows = postings
+        parts = [rows[ptr[key]:ptr[key + 1]] for key in keys]
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=np.int32)
+
+    @staticmethod
+    def _codes(vocab, values):
+        return [vocab[value] for value in values if value in vocab]
+
+    def _lookup_table(self, vocab, values):
+        """
+        Boolean table over the codes of a vocabulary, True for the given values.
+        The extra last slot is what code -1 (field missing) indexes.
+        """
+        table = np.zeros(len(vocab) + 1, dtype=bool)
+        for value in values:
+            code = vocab.get(value)
+            if code is not None:
+                table[code] = True
+        return table
+
+    def _feature_matches(self, words):
+        """
+        Mark the distinct features that contain any of the given words as a substring
+        """
+        matched = np.zeros(len(self.feature_starts), dtype=bool)
+        if not words or not len(matched):
+            return matched
+
+        positions = []
+        for word in words:
+            positions.extend(m.start() for m in re.finditer(re.escape(word), self.feature_blob))
+        if positions:
+            matched[np.searchsorted(self.feature_starts, positions, side='right') - 1] = True
+        return matched
+
+    def request_context(self, user_preferences, browsed_products, related=None):
+        """
+        Collect the per-request signals that scoring and explanations work from
+
+        Parameters:
+        - user_preferences (dict): User's stated preferences
+        - browsed_products (list): Products the user has viewed
+        - related (dict): Co-view score in [0, 1] per product ID, optional
+
+        Returns:
+        - dict: Browsed ids, categories, brands, subcategories, tags, feature
+          words and average price, preferred categories and brands, the parsed price range and
+          the co-view scores
+        """
+        browsed_ids = set()
+        browsed_categories = set()
+        browsed_brands = set()
+        browsed_subcategories = set()
+        browsed_tags = set()
+        browsed_price_points = []
+        browsed_words = set()
+
+        for product in browsed_products:
+            browsed_ids.add(product['id'])
+            if 'category' in product:
+                browsed_categories.add(product['category'])
+            if 'brand' in product:
+                browsed_brands.add(product['brand'])
+            if product.get('subcategory'):
+                browsed_subcategories.add(product['subcategory'])
+            if 'tags' in product and product['tags']:
+                browsed_tags.update(product['tags'])
+            if 'price' in product:
+                browsed_price_points.append(product['price'])
+            for feature in product.get('features') or ():
+                browsed_words.update(feature.lower().split())
+
+        # price range is parsed once per request; None when 'all' or unparsable
+        price_range = None
+        if user_preferences['priceRange'] != 'all':
+            try:
+                price_range = tuple(map(float, user_preferences['priceRange'].split('-')))
+                min_price, max_price = price_range
+            except Exception:
+                price_range = None
+
+        avg_browsed_price = None
+        if user_preferences['priceRange'] == 'all' and browsed_price_points:
+            avg_browsed_price = sum(browsed_price_points) / len(browsed_price_points)
+
+        return {
+            'browsed_ids': browsed_ids,
+            'browsed_categories': browsed_categories,
+            'browsed_brands': browsed_brands,
+            'browsed_subcategories': browsed_subcategories,
+            'browsed_tags': browsed_tags,
+            'browsed_words': browsed_words,
+            'avg_browsed_price': avg_browsed_price,
+            'preferred_categories': set(user_preferences['categories']) if user_preferences['categories'] else set(),
+            'preferred_brands': set(user_preferences['brands']) if user_preferences['brands'] else set(),
+            'price_range': price_range,
+            'related': related or {},
+        }
+
+    def _browsed_positions(self, context):
+        return [position for product_id in context['browsed_ids']
+                for position in self.id_positions.get(product_id, ())]
+
+    def _feature_rows(self, context):
+        """Catalog rows of every listed feature containing a browsed feature word"""
+        if not context['browsed_words'] or not len(self.feature_ids):
+            return np.zeros(0, dtype=np.int32)
+        matched = np.flatnonzero(self._feature_matches(context['browsed_words']))
+        return self._gather(self.feature_postings, matched)
+
+    def _price_window(self, context):
+        """
+        Catalog rows whose price earns points in score(): within 20% of the
+        preferred range, or within 40% of the average browsed price
+        """
+        if context['price_range'] is not None:
+            min_price, max_price = context['price_range']
+            low, high = min_price * 0.8, max_price * 1.2
+        elif context['avg_browsed_price']:
+            low, high = context['avg_browsed_price'] * 0.6, context['avg_browsed_price'] * 1.4
+        else:
+            return np.zeros(0, dtype=np.int32)
+        start = np.searchsorted(self.sorted_prices, low, side='left')
+        end = np.searchsorted(self.sorted_prices, high, side='right')
+        return self.price_order[start:end]
+
+    def _related_matches(self, context):
+        """(catalog rows, co-view scores) of the related products in the catalog"""
+        rows, weights = [], []
+        for product_id, weight in context['related'].items():
+            for position in self.id_positions.get(product_id, ()):
+                rows.append(position)
+                weights.append(weight)
+        return np.array(rows, dtype=np.int32), np.array(weights)
+
+    def _count(self, rows, positions, weights=None):
+        """
+        Sum weights (count, without weights) per scored product over some catalog rows
+
+        Parameters:
+        - rows (numpy.ndarray): Catalog positions, repeats allowed
+        - positions (numpy.ndarray): Sorted positions being scored, or None for all
+        - weights (numpy.ndarray): One weight per row
+
+        Returns:
+        - numpy.ndarray: One sum per scored product; rows not scored are ignored
+        """
+        if positions is None:
+            return np.bincount(rows, weights=weights, minlength=len(self.products))
+        index = np.searchsorted(positions, rows)
+        hit = index < len(positions)
+        hit[hit] = positions[index[hit]] == rows[hit]
+        return np.bincount(index[hit], weights=None if weights is None else weights[hit],
+                           minlength=len(positions))
+
+    def retrieve(self, context, min_candidates):
+        """
+        Candidate products for a request, from the posting lists of its signals
+
+        Parameters:
+        - context (dict): Output of request_context
+        - min_candidates (int): How many of the best rated products are always
+          added, so that products matching no signal but outscoring weak
+          matches on rating are scored too; the best rated product of every
+          category is added as well
+
+        Returns:
+        - numpy.ndarray: Sorted catalog positions, browsed products excluded
+        """
+        parts = [
+            self._gather(self.category_postings, self._codes(
+                self.category_vocab, context['preferred_categories'] | context['browsed_categories'])),
+            self._gather(self.brand_postings, self._codes(
+                self.brand_vocab, context['preferred_brands'] | context['browsed_brands'])),
+            self._gather(self.subcategory_postings, self._codes(
+                self.subcategory_vocab, context['browsed_subcategories'])),
+            self._gather(self.tag_postings, self._codes(self.tag_vocab, context['browsed_tags'])),
+            self._related_matches(context)[0],
+            self._price_window(context),
+        ]
+        browsed = np.unique(np.array(self._browsed_positions(context), dtype=np.int32))
+        if self.text_index is not None:
+            if len(browsed):
+                parts.append(self.text_index.candidates(browsed))
+        else:
+            parts.append(self._feature_rows(context))
+        # products outside every part score on rating alone; the best rated
+        # ones may still beat candidates that only matched weakly, and the
+        # best rated of a category leads it when rank() adds categories
+        parts.append(self.rating_order[:min_candidates + len(browsed)])
+        ptr, rows = self.category_rating_postings
+        parts.append(rows[_ranges(ptr[:-1], np.minimum(np.diff(ptr), 1 + len(browsed)))])
+        return np.setdiff1d(np.concatenate(parts), browsed)
+
+    def score(self, user_preferences, browsed_products, context=None, positions=None):
+        """
+        Score the products of the catalog for a request
+
+        Parameters:
+        - user_preferences (dict): User's stated preferences
+        - browsed_products (list): Products the user has viewed
+        - context (dict): Output of request_context, computed if not given
+        - positions (numpy.ndarray): Sorted catalog positions to score, e.g.
+          from retrieve(); every product if None
+
+        Returns:
+        - tuple: (scores array, boolean array of products eligible for
+          selection), one entry per scored product
+        """
+        if context is None:
+            context = self.request_context(user_preferences, browsed_products)
+        rows = slice(None) if positions is None else positions
+        size = len(self.products) if positions is None else len(positions)
+
+        browsed_categories = context['browsed_categories']
+        browsed_brands = context['browsed_brands']
+        browsed_tags = context['browsed_tags']
+        preferred_categories = context['preferred_categories']
+        preferred_brands = context['preferred_brands']
+
+        browsed_positions = self._browsed_positions(context)
+        eligible = np.ones(size, dtype=bool)
+        if browsed_positions:
+            eligible &= self._count(np.array(browsed_positions, dtype=np.int32), positions) == 0
+
+        scores = np.zeros(size)
+
+        # category and brand matches
+        category_codes = self.category_codes[rows]
+        preferred_cat = self._lookup_table(self.category_vocab, preferred_categories)[category_codes]
+        browsed_cat = self._lookup_table(self.category_vocab, browsed_categories)[category_codes]
+        scores += np.where(preferred_cat, 4.0, np.where(browsed_cat, 3.0, 0.0))
+
+        brand_codes = self.brand_codes[rows]
+        preferred_brand = self._lookup_table(self.brand_vocab, preferred_brands)[brand_codes]
+        browsed_brand = self._lookup_table(self.brand_vocab, browsed_brands)[brand_codes]
+        scores += np.where(preferred_brand, 4.0, np.where(browsed_brand, 2.5, 0.0))
+
+        # price fit; NaN prices never compare true
+        prices = self.prices[rows]
+        avg_browsed_price = context['avg_browsed_price']
+        if context['price_range'] is not None:
+            min_price, max_price = context['price_range']
+            in_range = (prices >= min_price) & (prices <= max_price)
+            near_range = ((prices < min_price) & (prices >= min_price * 0.8)) | \
+                         ((prices > max_price) & (prices <= max_price * 1.2))
+            scores += np.where(in_range, 3.0, np.where(near_range, 1.0, 0.0))
+        elif avg_browsed_price is not None:
+            if avg_browsed_price > 0:
+                price_diff_ratio = np.abs(prices - avg_browsed_price) / avg_browsed_price
+                scores += np.where(price_diff_ratio <= 0.2, 2.0, np.where(price_diff_ratio <= 0.4, 1.0, 0.0))
+
+        # rating buckets
+        scores += self._rating_points(self.ratings[rows])
+
+        # shared tags
+        if browsed_tags:
+            tag_rows = self._gather(self.tag_postings, self._codes(self.tag_vocab, browsed_tags))
+            scores += self._count(tag_rows, positions) * 0.75
+
+        # content similarity to what the user has browsed
+        if self.text_index is not None:
+            if browsed_positions:
+                if positions is None:
+                    scores += self.text_index.similarity(browsed_positions) * self.CONTENT_WEIGHT
+                else:
+                    scores += self.text_index.similarity_at(positions, browsed_positions) * self.CONTENT_WEIGHT
+        # features containing a word from a browsed feature
+        else:
+            feature_rows = self._feature_rows(context)
+            if len(feature_rows):
+                scores += self._count(feature_rows, positions) * 0.5
+
+        # products other users viewed together with the browsed ones
+        related_rows, related_weights = self._related_matches(context)
+        if len(related_rows):
+            scores += self._count(related_rows, positions, related_weights) * self.COVIEW_WEIGHT
+
+        # bonus for preferred categories the user has not browsed yet
+        scores += (preferred_cat & ~browsed_cat).astype(float)
+
+        return scores, eligible
+
+    @staticmethod
+    def _top_k(values, k):
+        """
+        Indices of the k largest values, ordered by value descending and index
+        ascending on ties (the order a stable descending sort would give)
+        """
+        size = len(values)
+        if k >= size:
+            return np.argsort(-values, kind='stable')
+
+        kth_value = values[np.argpartition(values, size - k)[size - k]]
+        above = np.flatnonzero(values > kth_value)
+        above = above[np.argsort(-values[above], kind='stable')]
+        ties = np.flatnonzero(values == kth_value)[:k - len(above)]
+        return np.concatenate([above, ties])
+
+    def select(self, user_preferences, browsed_products, max_products=15, related=None):
+        """
+        Pick the most relevant products for a request, keeping some category diversity
+
+        See rank(); this returns the product dicts only. related is passed on
+        to request_context.
+
+        Returns:
+        - list: Selected products, most relevant first
+        """
+        context = self.request_context(user_preferences, browsed_products, related)
+        return [self.products[position] for position, _ in
+                self.rank(user_preferences, browsed_products, max_products, context)]
+
+    def rank(self, user_preferences, browsed_products, max_products=15, context=None):
+        """
+        Rank the most relevant products for a request, keeping some category diversity
+
+        The top scored product comes first, followed by the best product of each
+        new category until three categories are represented, then the remaining
+        products in score order. With candidate_retrieval only the products
+        from retrieve() are scored.
+
+        Parameters:
+        - user_preferences (dict): User's stated preferences
+        - browsed_products (list): Products the user has viewed
+        - max_products (int): Maximum number of products to include
+        - context (dict): Output of request_context, computed if not given
+
+        Returns:
+        - list: (catalog position, score) pairs, most relevant first
+        """
+        if context is None:
+            context = self.request_context(user_preferences, browsed_products)
+        positions = self.retrieve(context, max_products) if self.candidate_retrieval else None
+        scores, eligible = self.score(user_preferences, browsed_products, context, positions)
+        # indices below are into the scored products; positions maps them back
+        category_codes = self.category_codes if positions is None else self.category_codes[positions]
+        candidates = np.flatnonzero(eligible)
+        if max_products <= 0 or not len(candidates):
+            return []
+
+        candidate_scores = scores[candidates]
+        ranked = candidates[self._top_k(candidate_scores, min(max_products, len(candidates)))].tolist()
+
+        top = ranked[0]
+        selected = [top]
+        selected_categories = set()
+        if category_codes[top] >= 0:
+            selected_categories.add(int(category_codes[top]))
+
+        # best ranked product of every category
+        codes = category_codes[candidates]
+        best = np.full(len(self.category_vocab) + 1, -np.inf)
+        np.maximum.at(best, codes, candidate_scores)
+        leading = np.flatnonzero(candidate_scores == best[codes])
+        _, first = np.unique(codes[leading], return_index=True)
+        leaders = leading[first]
+        leaders = leaders[np.lexsort((leaders, -candidate_scores[leaders]))]
+
+        for position in candidates[leaders].tolist():
+            if len(selected) >= max_products or len(selected_categories) >= 3:
+                break
+            code = int(category_codes[position])
+            if position == top or not self.category_truthy[code] or code in selected_categories:
+                continue
+            selected.append(position)
+            selected_categories.add(code)
+
+        chosen = set(selected)
+        for position in ranked[1:]:
+            if len(selected) >= max_products:
+                break
+            if position not in chosen:
+                selected.append(position)
+
+        if positions is None:
+            return [(position, float(scores[position])) for position in selected]
+        return [(int(positions[index]), float(scores[index])) for index in selected]
+
+    def match_signals(self, product, context):
+        """
+        Which scoring signals a single product matched, for explaining a pick
+
+        Parameters:
+        - product (dict): A product
+        - context (dict): Output of request_context
+
+        Returns:
+        - dict: 'category' and 'brand' ('preferred', 'browsed' or None),
+          'price' ('in_range', 'near_range', 'similar' or None), 'rating',
+          shared 'tags', 'features' containing browsed feature words and
+          'coview' (whether it is co-viewed with the browsed products)
+        """
+        signals = {'category': None, 'brand': None, 'price': None,
+                   'rating': product.get('rating'), 'tags': [], 'features': [],
+                   'coview': product['id'] in context['related']}
+
+        for field, preferred, browsed in (('category', 'preferred_categories', 'browsed_categories'),
+                                           ('brand', 'preferred_brands', 'browsed_brands')):
+            if field in product:
+                if product[field] in context[preferred]:
+                    signals[field] = 'preferred'
+                elif product[field] in context[browsed]:
+                    signals[field] = 'browsed'
+
+        price = product.get('price')
+        if price is not None and context['price_range'] is not None:
+            min_price, max_price = context['price_range']
+            if min_price <= price <= max_price:
+                signals['price'] = 'in_range'
+            elif min_price * 0.8 <= price < min_price or max_price < price <= max_price * 1.2:
+                signals['price'] = 'near_range'
+        elif price is not None and context['avg_browsed_price']:
+            avg = context['avg_browsed_price']
+            if avg > 0 and abs(price - avg) / avg <= 0.4:
+                signals['price'] = 'similar'
+
+        if context['browsed_tags']:
+            signals['tags'] = [tag for tag in dict.fromkeys(product.get('tags') or ())
+                               if tag in context['browsed_tags']]
+
+        words = context['browsed_words']
+        if words:
+            signals['features'] = [feature for feature in product.get('features') or ()
+                                   if any(word in feature.lower() for word in words)]
+        return signals
@@ -0,0 +1,50 @@
+import asyncio
+
+
+class SingleFlight:
+    """
+    In-process request coalescing for async work.
+
+    While a call for a key is in flight, further calls for the same key wait on
+    it and share its result instead of starting their own.
+    """
+
+    def __init__(self):
+        """
+        Initialize an empty in-flight table
+        """
+        self._calls = {}
+
+    def __len__(self):
+        return len(self._calls)
+
+    async def do(self, key, func):
+        """
+        Run func() for key, or join the call already running for it
+
+        The shared call runs in its own task, so a cancelled caller does not
+        cancel the work the other callers are waiting on.
+
+        Parameters:
+        - key (str): Deduplication key
+        - func (callable): Coroutine function producing the result
+
+        Returns:
+        - tuple: (result, True if this caller joined an existing call)
+        """
+        task = self._calls.get(key)
+        if task is not None:
+            return await asyncio.shield(task), True
+
+        task = asyncio.ensure_future(func())
+        self._calls[key] = task
+        task.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(task), False
+
+    def _finish(self, key, task):
+        """Drop a completed call from the table"""
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # mark the exception as retrieved in case every caller went away
+        if not task.cancelled():
+            task.exception()
@@ -0,0 +1,83 @@
+import json
+
+
+class IncrementalJSONArrayParser:
+    """
+    Pull complete objects out of a JSON array while its text is still arriving.
+
+    The LLM streams its answer a few characters at a time. Each time a
+    top-level object in the array closes, it is decoded and returned, so the
+    caller can act on it before the rest of the response exists. Text before
+    the opening '[' (prose, a ```json fence) is skipped, like the non-streaming
+    parser does.
+    """
+
+    def __init__(self):
+        self._buffer = []
+        self._started = False
+        self._finished = False
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self.errors = 0
+
+    @property
+    def finished(self):
+        """True once the closing ']' of the array has been seen"""
+        return self._finished
+
+    def feed(self, text):
+        """
+        Consume the next piece of the response
+
+        Parameters:
+        - text (str): Newly received characters
+
+        Returns:
+        - list: Objects completed by this piece, in order
+        """
+        completed = []
+        for char in text:
+            if self._finished:
+                break
+            if not self._started:
+                if char == '[':
+                    self._started = True
+                continue
+
+            if self._depth > 0:
+                self._buffer.append(char)
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in '{[':
+                if self._depth == 0:
+                    self._buffer = [char]
+                self._depth += 1
+            elif char in '}]':
+                if self._depth == 0:
+                    # the array itself closed
+                    if char == ']':
+                        self._finished = True
+                    continue
+                self._depth -= 1
+                if self._depth == 0:
+                    item = self._decode(''.join(self._buffer))
+                    self._buffer = []
+                    if isinstance(item, dict):
+                        completed.append(item)
+        return completed
+
+    def _decode(self, text):
+        try:
+            return json.loads(text)
+        except ValueError:
+            self.errors += 1
+            return None
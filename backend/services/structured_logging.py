@@ -0,0 +1,246 @@
+"""
+Structured logging that keeps I/O off the request path.
+
+Code logs events with fields rather than formatted messages:
+
+    log = get_logger(__name__)
+    log.debug('cache.hit', key=cache_key)
+
+The calling thread only checks the level and the sample rate of the event and
+puts a record on a bounded queue; a listener thread formats the records (JSON
+lines, or key=value text) and writes them out. When the queue is full, records
+are dropped and counted instead of blocking the event loop.
+
+configure_logging() installs the pipeline on the root logger, so records of
+other libraries go through it too. Until it is called, loggers behave like
+plain `logging` loggers.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import threading
+import time
+import traceback
+
+LEVELS = {'debug': logging.DEBUG, 'info': logging.INFO, 'warning': logging.WARNING,
+          'error': logging.ERROR, 'critical': logging.CRITICAL}
+
+# event name -> fraction of its records kept
+_sample_rates = {}
+_listener = None
+_handler = None
+_dropped = 0
+_dropped_lock = threading.Lock()
+
+
+def parse_levels(spec):
+    """
+    Parse per-logger levels, e.g. 'services.cache_service=debug,openai=warning'
+
+    Returns:
+    - dict: logger name -> logging level
+    """
+    levels = {}
+    for item in (spec or '').split(','):
+        name, _, level = item.partition('=')
+        if name.strip() and level.strip():
+            levels[name.strip()] = LEVELS[level.strip().lower()]
+    return levels
+
+
+def parse_sample_rates(spec):
+    """
+    Parse per-event sample rates, e.g. 'cache.hit=0.01,recommendations.request=0.1'
+
+    Returns:
+    - dict: event name -> fraction of records kept, between 0 and 1
+    """
+    rates = {}
+    for item in (spec or '').split(','):
+        event, _, rate = item.partition('=')
+        if event.strip() and rate.strip():
+            rates[event.strip()] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+
+class StructuredLogger:
+    """
+    Logs events with keyword fields through a standard library logger
+    """
+
+    __slots__ = ('logger',)
+
+    def __init__(self, logger):
+        self.logger = logger
+
+    def log(self, level, event, exc_info=None, **fields):
+        if not self.logger.isEnabledFor(level):
+            return
+        rate = _sample_rates.get(event)
+        if rate is not None and random.random() >= rate:
+            return
+        self.logger.log(level, event, exc_info=exc_info, extra={'fields': fields})
+
+    def debug(self, event, **fields):
+        self.log(logging.DEBUG, event, **fields)
+
+    def info(self, event, **fields):
+        self.log(logging.INFO, event, **fields)
+
+    def warning(self, event, **fields):
+        self.log(logging.WARNING, event, **fields)
+
+    def error(self, event, **fields):
+        self.log(logging.ERROR, event, **fields)
+
+    def exception(self, event, **fields):
+        """Log at error level with the traceback of the exception being handled"""
+        self.log(logging.ERROR, event, exc_info=True, **fields)
+
+
+def get_logger(name):
+    return StructuredLogger(logging.getLogger(name))
+
+
+def _utc_timestamp(created):
+    return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(created)) + f".{int(created % 1 * 1000):03d}Z"
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line: ts, level, logger, event and the event's fields
+    """
+
+    def format(self, record):
+        entry = {
+            'ts': _utc_timestamp(record.created),
+            'level': record.levelname.lower(),
+            'logger': record.name,
+            'event': record.getMessage(),
+        }
+        fields = getattr(record, 'fields', None)
+        if fields:
+            for key, value in fields.items():
+                entry.setdefault(key, value)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """
+    Human readable lines: ts LEVEL logger event key=value ...
+    """
+
+    def format(self, record):
+        parts = [_utc_timestamp(record.created), record.levelname, record.name, record.getMessage()]
+        fields = getattr(record, 'fields', None)
+        if fields:
+            parts.extend(f"{key}={json.dumps(value, default=str, ensure_ascii=False)}" for key, value in fields.items())
+        line = ' '.join(parts)
+        if record.exc_text:
+            line += '\n' + record.exc_text
+        return line
+
+
+class _EnqueueHandler(logging.handlers.QueueHandler):
+    """
+    Puts records on the queue without formatting them, dropping them when
+    the queue is full
+    """
+
+    def prepare(self, record):
+        if record.exc_info:
+            # tracebacks hold on to frames; render them while they are current
+            record.exc_text = ''.join(traceback.format_exception(*record.exc_info)).rstrip()
+            record.exc_info = None
+        if record.args:
+            # arguments of foreign records may change before the listener formats them
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+    def enqueue(self, record):
+        global _dropped
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with _dropped_lock:
+                _dropped += 1
+
+
+class _Listener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        # a full queue must not lose the sentinel, or stop() never returns
+        self.queue.put(self._sentinel)
+
+
+def configure_logging(level='info', fmt='json', sample_rates=None, logger_levels=None,
+                      queue_size=10000, stream=None, queued=True):
+    """
+    Route all logging through the queue and start the writer thread
+
+    Calling it again replaces the previous configuration.
+
+    Parameters:
+    - level (str): Level of the root logger
+    - fmt (str): 'json' or 'text'
+    - sample_rates (dict): Event name -> fraction of its records kept
+    - logger_levels (dict): Logger name -> level, overriding the root level
+    - queue_size (int): Records buffered before new ones are dropped
+    - stream (file): Where records are written, stdout by default
+    - queued (bool): Write from a background thread; False writes from the
+      calling thread, for processes that fork (threads do not survive fork)
+    """
+    global _listener, _handler
+    shutdown_logging()
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(TextFormatter() if fmt == 'text' else JsonFormatter())
+    if queued:
+        records = queue.Queue(maxsize=queue_size)
+        _handler = _EnqueueHandler(records)
+        _listener = _Listener(records, output)
+    else:
+        _handler = output
+
+    root = logging.getLogger()
+    root.addHandler(_handler)
+    root.setLevel(LEVELS[level.lower()] if isinstance(level, str) else level)
+    for name, logger_level in (logger_levels or {}).items():
+        logging.getLogger(name).setLevel(logger_level)
+    _sample_rates.clear()
+    _sample_rates.update(sample_rates or {})
+    if _listener is not None:
+        _listener.start()
+    # write out what is still queued if the process exits without shutting down
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """
+    Write out the queued records, stop the writer thread and go back to
+    plain logging
+    """
+    global _listener, _handler
+    atexit.unregister(shutdown_logging)
+    _sample_rates.clear()
+    if _handler is not None:
+        logging.getLogger().removeHandler(_handler)
+        _handler = None
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def dropped_records():
+    """
+    Returns:
+    - int: Records dropped because the queue was full
+    """
+    return _dropped
@@ -0,0 +1,255 @@
+import re
+from collections import Counter
+
+import numpy as np
+
+_TOKEN = re.compile(r'[a-z0-9]+')
+
+STOPWORDS = frozenset("""
+    a an and are as at be by for from has have in into is it its of on or our so
+    than that the their this to was were which while with without you your
+""".split())
+
+# how much a term in each field counts towards a product's vector
+FIELD_WEIGHTS = (('name', 2.0), ('tags', 1.5), ('features', 1.5), ('description', 1.0))
+
+
+def tokenize(text):
+    """
+    Lower-case word tokens of a text, without stopwords, with plural 's' removed
+    """
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        if len(token) < 2 or token in STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def _field_text(value):
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (list, tuple)):
+        return ' '.join(item for item in value if isinstance(item, str))
+    return ''
+
+
+def _ranges(starts, lengths):
+    """Concatenation of the index ranges [start, start + length)"""
+    return np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+
+
+class TfidfIndex:
+    """
+    Sparse TF-IDF vectors over product text, for content similarity.
+
+    Each product's name, description, features and tags are tokenized into a
+    weighted bag of words, scaled by inverse document frequency and L2
+    normalized. Rows are kept in CSR form (to build query vectors from
+    products) and postings in CSC form (to score the whole catalog against a
+    query by touching only the products that share a term with it).
+    """
+
+    # longest query vector, in terms; the weakest terms beyond it are dropped
+    MAX_QUERY_TERMS = 64
+
+    def __init__(self, products):
+        """
+        Build the index
+
+        Parameters:
+        - products (list): Product catalog, in the order results refer to
+        """
+        self.size = len(products)
+        self.vocab = {}
+        self.terms = []
+        rows, cols, counts = [], [], []
+        for position, product in enumerate(products):
+            weights = Counter()
+            for field, field_weight in FIELD_WEIGHTS:
+                for token in tokenize(_field_text(product.get(field))):
+                    weights[token] += field_weight
+            for token, weight in weights.items():
+                rows.append(position)
+                if token not in self.vocab:
+                    self.vocab[token] = len(self.terms)
+                    self.terms.append(token)
+                cols.append(self.vocab[token])
+                counts.append(weight)
+
+        rows = np.array(rows, dtype=np.int32)
+        cols = np.array(cols, dtype=np.int32)
+        values = np.array(counts, dtype=np.float64)
+
+        document_frequency = np.bincount(cols, minlength=len(self.vocab))
+        self.idf = np.log((1 + self.size) / (1 + document_frequency)) + 1.0
+        values = (1.0 + np.log(values)) * self.idf[cols] if len(values) else values
+
+        norms = np.sqrt(np.bincount(rows, weights=values ** 2, minlength=self.size))
+        if len(values):
+            values /= norms[rows]
+
+        # rows were appended in position order, so they are already CSR
+        self.row_ptr = np.zeros(self.size + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=self.size), out=self.row_ptr[1:])
+        self.row_terms = cols
+        self.row_values = values
+
+        order = np.argsort(cols, kind='stable')
+        self.col_ptr = np.zeros(len(self.vocab) + 1, dtype=np.int64)
+        np.cumsum(document_frequency, out=self.col_ptr[1:])
+        self.col_rows = rows[order]
+        self.col_values = values[order]
+
+    # arrays that make up a built index, besides its terms
+    STATE_ARRAYS = ('idf', 'row_ptr', 'row_terms', 'row_values', 'col_ptr', 'col_rows', 'col_values')
+
+    def state(self):
+        """
+        Everything the index is made of, to store it with the catalog
+
+        Returns:
+        - dict: The arrays of STATE_ARRAYS by name, plus 'terms'
+        """
+        state = {name: getattr(self, name) for name in self.STATE_ARRAYS}
+        state['terms'] = self.terms
+        return state
+
+    @classmethod
+    def from_state(cls, state):
+        """
+        Index over the arrays returned by state(), without tokenizing anything
+
+        Parameters:
+        - state (Mapping): Output of state(), e.g. mapped from a catalog
+          snapshot; the arrays are used as they are
+
+        Returns:
+        - TfidfIndex: The index
+        """
+        index = cls.__new__(cls)
+        for name in cls.STATE_ARRAYS:
+            setattr(index, name, state[name])
+        index.terms = list(state['terms'])
+        index.vocab = {term: term_id for term_id, term in enumerate(index.terms)}
+        index.size = len(index.row_ptr) - 1
+        return index
+
+    def __len__(self):
+        return self.size
+
+    def query_vector(self, positions):
+        """
+        Normalized centroid of the vectors of some products
+
+        Parameters:
+        - positions (iterable): Catalog positions, e.g. the browsed products
+
+        Returns:
+        - tuple: (term ids, weights), the strongest MAX_QUERY_TERMS terms in
+          ascending term id order
+        """
+        parts = [slice(self.row_ptr[p], self.row_ptr[p + 1]) for p in positions]
+        if not parts:
+            return np.zeros(0, dtype=np.int32), np.zeros(0)
+        terms = np.concatenate([self.row_terms[part] for part in parts])
+        values = np.concatenate([self.row_values[part] for part in parts])
+        if not len(terms):
+            return terms, values
+
+        unique_terms, inverse = np.unique(terms, return_inverse=True)
+        weights = np.bincount(inverse, weights=values)
+        if len(unique_terms) > self.MAX_QUERY_TERMS:
+            keep = np.sort(np.argpartition(-weights, self.MAX_QUERY_TERMS)[:self.MAX_QUERY_TERMS])
+            unique_terms, weights = unique_terms[keep], weights[keep]
+        return unique_terms, weights / np.sqrt(np.sum(weights ** 2))
+
+    def similarity(self, positions):
+        """
+        Cosine similarity of every product to the centroid of some products
+
+        Parameters:
+        - positions (iterable): Catalog positions of the query products
+
+        Returns:
+        - numpy.ndarray: One score in [0, 1] per catalog position
+        """
+        scores = np.zeros(self.size)
+        terms, weights = self.query_vector(positions)
+        if not len(terms):
+            return scores
+
+        # gather all postings of the query terms in one go
+        starts = self.col_ptr[terms]
+        lengths = self.col_ptr[terms + 1] - starts
+        offsets = _ranges(starts, lengths)
+        contributions = self.col_values[offsets] * np.repeat(weights, lengths)
+        scores += np.bincount(self.col_rows[offsets], weights=contributions, minlength=self.size)
+        return scores
+
+    def similarity_at(self, rows, positions):
+        """
+        Cosine similarity of some products to the centroid of some others
+
+        Works from the rows of the scored products, matching their terms
+        against the sorted query terms, so the cost grows with how many are
+        scored, not with the catalog or its vocabulary.
+
+        Parameters:
+        - rows (numpy.ndarray): Catalog positions to score
+        - positions (iterable): Catalog positions of the query products
+
+        Returns:
+        - numpy.ndarray: One score in [0, 1] per scored row
+        """
+        terms, weights = self.query_vector(positions)
+        if not len(terms) or not len(rows):
+            return np.zeros(len(rows))
+
+        starts = self.row_ptr[rows]
+        lengths = self.row_ptr[np.asarray(rows) + 1] - starts
+        offsets = _ranges(starts, lengths)
+        row_terms = self.row_terms[offsets]
+        index = np.minimum(np.searchsorted(terms, row_terms), len(terms) - 1)
+        contributions = np.where(terms[index] == row_terms, self.row_values[offsets] * weights[index], 0.0)
+        return np.bincount(np.repeat(np.arange(len(rows)), lengths), weights=contributions, minlength=len(rows))
+
+    def candidates(self, positions):
+        """
+        Products containing a term of the centroid of some products, for
+        candidate retrieval: every product similarity() scores above zero
+
+        Parameters:
+        - positions (iterable): Catalog positions of the query products
+
+        Returns:
+        - numpy.ndarray: Catalog positions, with repeats
+        """
+        terms, _ = self.query_vector(positions)
+        starts = self.col_ptr[terms]
+        return self.col_rows[_ranges(starts, self.col_ptr[terms + 1] - starts)]
+
+    def most_similar(self, positions, k=10, exclude_query=True):
+        """
+        Top-k products most similar to some products
+
+        Returns:
+        - list: (position, score) pairs, best first, only positive scores
+        """
+        positions = list(positions)
+        scores = self.similarity(positions)
+        if exclude_query:
+            scores[list(positions)] = 0.0
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k)[:k]]
+        candidates = candidates[np.lexsort((candidates, -scores[candidates]))]
+        return [(int(position), float(scores[position])) for position in candidates]
+
+    def shared_terms(self, position, positions):
+        """Terms a product shares with the query built from positions"""
+        terms, _ = self.query_vector(positions)
+        own = self.row_terms[self.row_ptr[position]:self.row_ptr[position + 1]]
+        return [self.terms[t] for t in np.intersect1d(own, terms).tolist()]
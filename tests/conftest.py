@@ -0,0 +1,19 @@
+"""
+Shared setup for the backend unit tests.
+
+The backend modules import `config` and read paths relative to the backend
+directory, so the tests put that directory on sys.path and point DATA_PATH
+at the bundled catalog before anything imports it.
+"""
+
+import os
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+BACKEND_DIR = os.path.normpath(BACKEND_DIR)
+
+sys.path.insert(0, BACKEND_DIR)
+os.environ.setdefault('DATA_PATH', os.path.join(BACKEND_DIR, 'data', 'products.json'))
+os.environ.setdefault('OPENAI_API_KEY', 'test-key')
+os.environ.setdefault('CACHE_DIR', tempfile.mkdtemp(prefix='llm-cache-'))
@@ -0,0 +1,112 @@
+"""
+Minimal local stand-in for the OpenAI chat completions endpoint.
+
+Answers every POST with a fixed completion after an optional delay and keeps
+track of how many requests were in flight at the same time. Requests with
+"stream": true get the completion as server-sent chunks of `chunk_size`
+characters, `chunk_delay` seconds apart.
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_CONTENT = json.dumps([
+    {"product_id": "prod009", "explanation": "Matches your audio browsing", "score": 8},
+    {"product_id": "prod002", "explanation": "Premium sound", "score": 7},
+])
+
+
+class StubLLMServer:
+    def __init__(self, content=DEFAULT_CONTENT, delay=0.0, chunk_size=8, chunk_delay=0.0):
+        self.content = content
+        self.delay = delay
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def api_base(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/v1"
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _stream(self):
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.end_headers()
+                for start in range(0, len(stub.content), stub.chunk_size):
+                    chunk = {
+                        "id": "chatcmpl-stub",
+                        "object": "chat.completion.chunk",
+                        "created": int(time.time()),
+                        "model": "stub",
+                        "choices": [{
+                            "index": 0,
+                            "delta": {"content": stub.content[start:start + stub.chunk_size]},
+                            "finish_reason": None
+                        }]
+                    }
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                    self.wfile.flush()
+                    time.sleep(stub.chunk_delay)
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+                self.close_connection = True
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                with stub._lock:
+                    stub.requests += 1
+                    stub.in_flight += 1
+                    stub.max_in_flight = max(stub.max_in_flight, stub.in_flight)
+                try:
+                    time.sleep(stub.delay)
+                    if request.get('stream'):
+                        self._stream()
+                        return
+                    body = json.dumps({
+                        "id": "chatcmpl-stub",
+                        "object": "chat.completion",
+                        "created": int(time.time()),
+                        "model": "stub",
+                        "choices": [{
+                            "index": 0,
+                            "message": {"role": "assistant", "content": stub.content},
+                            "finish_reason": "stop"
+                        }],
+                        "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2}
+                    }).encode()
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    with stub._lock:
+                        stub.in_flight -= 1
+
+        return Handler
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,148 @@
+"""
+Minimal local stand-in for a Redis server.
+
+Speaks RESP2 over TCP and implements the commands the cache backend uses
+(GET, MGET, SET with EX/PX, DEL, PTTL, SCAN, DBSIZE, INFO) plus PING, AUTH,
+SELECT and FLUSHDB, with keys expiring lazily. Records every command and the
+number of connections opened, so tests can check pooling and pipelining.
+"""
+
+import fnmatch
+import socket
+import socketserver
+import threading
+import time
+
+
+def _encode(reply):
+    if reply is None:
+        return b'$-1\r\n'
+    if isinstance(reply, Exception):
+        return b'-ERR %s\r\n' % str(reply).encode()
+    if isinstance(reply, bool):
+        return b'+OK\r\n'
+    if isinstance(reply, int):
+        return b':%d\r\n' % reply
+    if isinstance(reply, (list, tuple)):
+        return b'*%d\r\n' % len(reply) + b''.join(_encode(item) for item in reply)
+    return b'$%d\r\n%s\r\n' % (len(reply), reply)
+
+
+class StubRespServer:
+    def __init__(self, password=None):
+        self.password = password
+        self.data = {}
+        self.commands = []
+        self.connections = 0
+        self._lock = threading.Lock()
+        self._server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._open = set()
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        auth = f":{self.password}@" if self.password else ''
+        return f"redis://{auth}{host}:{port}/0"
+
+    def drop_connections(self):
+        """Close every open client connection, like a server timing them out"""
+        with self._lock:
+            open_connections = list(self._open)
+        for connection in open_connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def _live(self, key):
+        entry = self.data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.time():
+            del self.data[key]
+            return None
+        return entry
+
+    def _run(self, args, session):
+        name = args[0].upper()
+        self.commands.append([name] + args[1:])
+        if self.password and not session['authenticated'] and name != b'AUTH':
+            return Exception('NOAUTH Authentication required.')
+        if name == b'AUTH':
+            session['authenticated'] = args[1].decode() == self.password
+            return True if session['authenticated'] else Exception('invalid password')
+        if name in (b'PING', b'SELECT'):
+            return True
+        if name == b'GET':
+            entry = self._live(args[1])
+            return entry[0] if entry else None
+        if name == b'MGET':
+            return [entry[0] if entry else None for entry in map(self._live, args[1:])]
+        if name == b'SET':
+            expires = None
+            options = [arg.upper() for arg in args[3:]]
+            if b'PX' in options:
+                expires = time.time() + int(args[3 + options.index(b'PX') + 1]) / 1000
+            elif b'EX' in options:
+                expires = time.time() + int(args[3 + options.index(b'EX') + 1])
+            self.data[args[1]] = (args[2], expires)
+            return True
+        if name == b'DEL':
+            return sum(1 for key in args[1:] if self._live(key) and self.data.pop(key))
+        if name == b'PTTL':
+            entry = self._live(args[1])
+            if entry is None:
+                return -2
+            return -1 if entry[1] is None else int((entry[1] - time.time()) * 1000)
+        if name == b'SCAN':
+            # the whole keyspace in one page, cursor 0 ends the iteration
+            pattern = args[args.index(b'MATCH') + 1].decode() if b'MATCH' in args else '*'
+            keys = [key for key in list(self.data) if self._live(key) and fnmatch.fnmatchcase(key.decode(), pattern)]
+            return [b'0', keys]
+        if name == b'DBSIZE':
+            return sum(1 for key in list(self.data) if self._live(key))
+        if name == b'INFO':
+            used = sum(len(key) + len(value) for key, (value, _) in self.data.items())
+            return f"# Memory\r\nused_memory:{used}\r\n".encode()
+        if name == b'FLUSHDB':
+            self.data.clear()
+            return True
+        return Exception(f"unknown command '{name.decode()}'")
+
+    def _handler(self):
+        stub = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                with stub._lock:
+                    stub.connections += 1
+                    stub._open.add(self.request)
+                session = {'authenticated': False}
+                try:
+                    while True:
+                        line = self.rfile.readline()
+                        if not line:
+                            return
+                        args = []
+                        for _ in range(int(line[1:])):
+                            length = int(self.rfile.readline()[1:])
+                            args.append(self.rfile.read(length + 2)[:-2])
+                        with stub._lock:
+                            reply = stub._run(args, session)
+                        self.wfile.write(_encode(reply))
+                except (OSError, ValueError):
+                    return
+                finally:
+                    with stub._lock:
+                        stub._open.discard(self.request)
+
+        return Handler
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+        self.drop_connections()
@@ -0,0 +1,214 @@
+"""
+Async LLM call path, exercised against a local stub completions server.
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from services.llm_service import LLMService
+from stub_llm_server import StubLLMServer
+
+PREFERENCES = {"priceRange": "all", "categories": ["Electronics"], "brands": []}
+
+
+def make_service(api_base, timeout=5, max_concurrency=8):
+    service = LLMService()
+    service.use_cache = False
+    service.api_base = api_base
+    service.request_timeout = timeout
+    service.max_concurrency = max_concurrency
+    return service
+
+
+def test_async_recommendations_from_stub():
+    async def run():
+        with StubLLMServer() as stub:
+            service = make_service(stub.api_base)
+            try:
+                result = await service.agenerate_recommendations(
+                    PREFERENCES, ["prod007"], service.product_service.get_all_products())
+            finally:
+                await service.aclose()
+        return result
+
+    result = asyncio.run(run())
+    assert [r["product"]["id"] for r in result["recommendations"]] == ["prod009", "prod002"]
+
+
+def test_concurrency_is_bounded_and_loop_stays_responsive():
+    async def run(stub):
+        service = make_service(stub.api_base, max_concurrency=2)
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        products = service.product_service.get_all_products()
+        tick_task = asyncio.create_task(ticker())
+        try:
+            # distinct histories so the calls are not coalesced
+            await asyncio.gather(*[
+                service.agenerate_recommendations(PREFERENCES, [products[i]["id"]], products)
+                for i in range(6)
+            ])
+        finally:
+            tick_task.cancel()
+            await service.aclose()
+        return ticks
+
+    with StubLLMServer(delay=0.2) as stub:
+        started = time.monotonic()
+        ticks = asyncio.run(run(stub))
+        elapsed = time.monotonic() - started
+
+    assert stub.requests == 6
+    assert stub.max_in_flight == 2
+    # three waves of two calls; the event loop kept ticking meanwhile
+    assert elapsed >= 0.55
+    assert ticks > 20
+
+
+def test_timeout_raises_without_fallback():
+    async def run(stub):
+        service = make_service(stub.api_base, timeout=0.2)
+        service.llm_fallback = False
+        try:
+            await service.agenerate_recommendations(PREFERENCES, [], service.product_service.get_all_products())
+        finally:
+            await service.aclose()
+
+    with StubLLMServer(delay=1.0) as stub:
+        with pytest.raises(Exception, match="Failed to generate recommendations"):
+            asyncio.run(run(stub))
+
+
+def test_identical_concurrent_requests_share_one_llm_call():
+    async def run(stub):
+        service = make_service(stub.api_base)
+        products = service.product_service.get_all_products()
+        try:
+            results = await asyncio.gather(*[
+                service.agenerate_recommendations(PREFERENCES, ["prod007"], products)
+                for _ in range(5)
+            ])
+        finally:
+            await service.aclose()
+        return service, results
+
+    with StubLLMServer(delay=0.2) as stub:
+        service, results = asyncio.run(run(stub))
+
+    assert stub.requests == 1
+    stats = service.get_request_stats()
+    assert stats["cache_misses"] == 1
+    assert stats["coalesced"] == 4
+    assert stats["in_flight"] == 0
+    assert all(r["recommendations"] == results[0]["recommendations"] for r in results)
+
+
+def test_llm_error_falls_back_to_fast_ranker():
+    async def run(stub):
+        service = make_service(stub.api_base, timeout=0.2)
+        try:
+            result = await service.agenerate_recommendations(
+                PREFERENCES, ["prod002"], service.product_service.get_all_products())
+        finally:
+            await service.aclose()
+        return service, result
+
+    with StubLLMServer(delay=1.0) as stub:
+        service, result = asyncio.run(run(stub))
+
+    assert result["fallback"] is True and result["source"] == "fast"
+    assert result["count"] == 5
+    assert all(rec["explanation"] for rec in result["recommendations"])
+    assert service.get_request_stats()["fallbacks"] == 1
+
+
+def test_latency_slo_serves_fast_result_then_upgrades_from_cache():
+    history = ["prod021", "prod044"]
+
+    async def run(stub):
+        service = make_service(stub.api_base)
+        service.use_cache = True
+        service.latency_slo = 0.05
+        products = service.product_service.get_all_products()
+        try:
+            first = await service.agenerate_recommendations(PREFERENCES, history, products)
+            # the LLM call finishes in the background and fills the cache
+            await asyncio.sleep(0.6)
+            second = await service.agenerate_recommendations(PREFERENCES, history, products)
+        finally:
+            await service.aclose()
+        return first, second
+
+    with StubLLMServer(delay=0.3) as stub:
+        first, second = asyncio.run(run(stub))
+
+    assert first["provisional"] is True and first["source"] == "fast"
+    assert second["cached"] is True
+    assert [r["product"]["id"] for r in second["recommendations"]] == ["prod009", "prod002"]
+
+
+def test_fast_mode_never_calls_the_llm():
+    service = make_service("http://127.0.0.1:9/v1")
+    service.recommendation_mode = "fast"
+    products = service.product_service.get_all_products()
+    result = asyncio.run(service.agenerate_recommendations(PREFERENCES, ["prod002"], products))
+
+    ids = [r["product"]["id"] for r in result["recommendations"]]
+    history = service.product_service.get_products_by_ids(["prod002"])
+    assert ids == [p["id"] for p in service._select_relevant_products(PREFERENCES, history, products, 5)]
+    assert "Electronics" in result["recommendations"][0]["explanation"]
+
+
+def test_batch_dedupes_serves_hits_and_bounds_concurrency():
+    histories = [["prod031"], ["prod032"], ["prod031"], ["prod033"], ["prod034"], ["prod035"]]
+
+    async def run(stub):
+        service = make_service(stub.api_base)
+        service.use_cache = True
+        products = service.product_service.get_all_products()
+        cached = {"recommendations": [{"product": products[0], "explanation": "x", "confidence_score": 5}],
+                  "count": 1}
+        await service.cache_service.acache_recommendations(PREFERENCES, ["prod035"], cached)
+        results = []
+        try:
+            async for indices, result, error in service.agenerate_batch(
+                    [(PREFERENCES, h) for h in histories], products, concurrency=2):
+                results.append((indices, result, error))
+        finally:
+            await service.aclose()
+        return results
+
+    with StubLLMServer(delay=0.1) as stub:
+        results = asyncio.run(run(stub))
+
+    # the cache hit comes first, the duplicate shares one call
+    assert results[0][0] == [5] and results[0][1]["cached"] is True
+    assert sorted(i for indices, _, _ in results for i in indices) == list(range(6))
+    assert [0, 2] in [indices for indices, _, _ in results]
+    assert all(error is None for _, _, error in results)
+    assert stub.requests == 4
+    assert stub.max_in_flight == 2
+
+
+def test_batch_reports_errors_per_item():
+    async def run():
+        service = make_service("http://127.0.0.1:9/v1", timeout=1)
+        service.llm_fallback = False
+        products = service.product_service.get_all_products()
+        try:
+            return [item async for item in service.agenerate_batch(
+                [(PREFERENCES, ["prod036"]), (PREFERENCES, ["prod037"])], products)]
+        finally:
+            await service.aclose()
+
+    results = asyncio.run(run())
+    assert sorted(indices[0] for indices, _, _ in results) == [0, 1]
+    assert all(result is None and error is not None for _, result, error in results)
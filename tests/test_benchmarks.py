@@ -0,0 +1,72 @@
+"""
+Synthetic data generators and the hot path and catalog load benchmarks, on
+tiny inputs.
+"""
+
+import os
+
+from benchmarks import baselines, bench_catalog_load
+from benchmarks.bench_hot_path import STAGES, compare, run_size
+from benchmarks.bench_prompt import make_requests
+from benchmarks.synthetic import generate_catalog, generate_requests, load_bundled_catalog
+
+
+def test_synthetic_catalog_keeps_the_product_schema():
+    bundled = load_bundled_catalog()
+    products = generate_catalog(500, seed=3)
+    assert len(products) == 500
+    assert len({p['id'] for p in products}) == 500
+    for product in products:
+        assert set(product) == set(bundled[0])
+        assert 1.0 <= product['rating'] <= 5.0 and product['price'] >= 1.0
+    assert generate_catalog(50, seed=3) == generate_catalog(50, seed=3)
+
+    requests = generate_requests(products, 200, seed=1)
+    ids = {p['id'] for p in products}
+    assert all(p['id'] in ids for _, history in requests for p in history)
+    assert any(not history for _, history in requests)
+    assert any(prefs['priceRange'] != 'all' for prefs, _ in requests)
+
+
+def test_hot_path_benchmark_runs_and_flags_regressions():
+    result = run_size(50, request_count=5, iterations=5, stages=STAGES)
+    assert result['catalog']['products'] == 50
+    assert set(result['stages']) == set(STAGES)
+    for metrics in result['stages'].values():
+        assert metrics['mean_us'] > 0 and metrics['peak_bytes'] >= 0
+
+    run = {'sizes': {'50': result}}
+    assert compare(run, run, 0.25) == []
+    faster = {'sizes': {'50': {'stages': {'select': dict(result['stages']['select'], mean_us=0.001)}}}}
+    assert len(compare(run, faster, 0.25)) == 1
+
+
+def test_catalog_load_benchmark_loads_the_same_catalog_each_way():
+    result = bench_catalog_load.run_size(200, seed=1)
+    assert {result[mode]['version'] for mode in bench_catalog_load.MODES} == {result['json']['version']}
+    assert all(result[mode]['products'] == 200 for mode in bench_catalog_load.MODES)
+    assert result['snapshot_bytes'] > 0
+
+    run = {'sizes': {'200': result}}
+    assert bench_catalog_load.compare(run, run, 0.25) == []
+    slower = {'sizes': {'200': dict(result, snapshot=dict(result['snapshot'], load_ms=0.001))}}
+    assert len(bench_catalog_load.compare(run, slower, 0.25)) == 1
+
+
+def test_prompt_benchmark_price_ranges_parse():
+    for preferences, _ in make_requests(load_bundled_catalog(), 50):
+        if preferences['priceRange'] != 'all':
+            low, high = map(float, preferences['priceRange'].split('-'))
+            assert low < high
+
+
+def test_baselines_are_committed_and_flag_regressions():
+    for name in ('bench_prompt', 'bench_hot_path', 'bench_catalog_load'):
+        assert os.path.exists(baselines.default_path(name))
+    run = {'mean_us': 10.0, 'peak_bytes_per_prompt': 100}
+    tracked = lambda result: {metric: result.get(metric) for metric in run}
+    assert baselines.compare(run, run, tracked, 0.25) == []
+    assert baselines.compare(dict(run, mean_us=13.0), run, tracked, 0.25) == [
+        'mean_us 13.0 > 12.50 (baseline 10.0)'
+    ]
+    assert baselines.compare(run, {}, tracked, 0.25) == []
@@ -0,0 +1,137 @@
+"""
+Cache backends: the file backend and the Redis-protocol backend, run against
+a local stand-in server.
+"""
+
+import threading
+import time
+
+import pytest
+
+from services.cache_backends import CacheBackend, FileCacheBackend, RedisCacheBackend, make_cache_backend
+from services.cache_service import LLMCacheService
+from services.resp_client import RespError, RespPool
+from stub_resp_server import StubRespServer
+
+PREFERENCES = {"priceRange": "all", "categories": ["Home"], "brands": []}
+RECOMMENDATIONS = {"recommendations": [{"product": {"id": "prod010"}, "explanation": "x", "confidence_score": 7}],
+                   "count": 1}
+
+
+def test_redis_backend_operations():
+    with StubRespServer() as server:
+        backend = RedisCacheBackend(server.url, key_prefix='t:')
+        assert backend.get('a') is None and backend.ttl('a') is None
+        backend.set('a', b'\x00binary\r\n', 60)
+        backend.set('b', b'two', 60)
+        assert backend.get('a') == b'\x00binary\r\n'
+        assert 59 < backend.ttl('a') <= 60
+        ttls = backend.ttl_many(['b', 'missing', 'a'])
+        assert 59 < ttls[0] <= 60 and ttls[1] is None and 59 < ttls[2] <= 60
+        assert b't:a' in server.data
+
+        server.data[b'other'] = (b'not ours', None)
+        assert backend.stats()['entries'] == 3
+        assert backend.delete('a') and not backend.delete('a')
+        assert backend.get_many(['a', 'b']) == [None, b'two']
+
+        backend.set('short', b'x', 0.05)
+        time.sleep(0.1)
+        assert backend.get('short') is None
+        assert backend.clear() == 1
+        assert list(server.data) == [b'other']
+
+
+def test_bulk_operations_are_pipelined_on_pooled_connections():
+    with StubRespServer() as server:
+        backend = RedisCacheBackend(server.url, max_connections=2)
+        keys = [f"k{i}" for i in range(600)]
+        for key in keys[::2]:
+            backend.set(key, key.encode(), 60)
+        server.commands.clear()
+
+        values = backend.get_many(keys)
+        assert values == [key.encode() if i % 2 == 0 else None for i, key in enumerate(keys)]
+        assert [command[0] for command in server.commands] == [b'MGET'] * 3
+        assert backend.delete_many(keys) == 300
+        assert server.connections == 1
+
+        def read():
+            for _ in range(50):
+                backend.get('k0')
+
+        threads = [threading.Thread(target=read) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert server.connections <= 2
+
+        # a connection the server dropped is replaced transparently
+        server.drop_connections()
+        backend.set('k0', b'again', 60)
+        assert backend.get('k0') == b'again'
+
+
+def test_auth_and_error_replies():
+    with StubRespServer(password='s3cret') as server:
+        pool = RespPool.from_url(server.url)
+        assert pool.execute('PING') == b'OK'
+        with pytest.raises(RespError):
+            pool.execute('NOSUCHCOMMAND')
+        assert pool.execute('DBSIZE') == 0
+
+        wrong = RespPool.from_url(server.url.replace('s3cret', 'wrong'))
+        with pytest.raises(RespError):
+            wrong.execute('PING')
+
+
+def test_cache_service_shares_entries_through_redis():
+    with StubRespServer() as server:
+        node_a = LLMCacheService(backend=RedisCacheBackend(server.url), ttl_hours=1)
+        node_b = LLMCacheService(backend=RedisCacheBackend(server.url), ttl_hours=1)
+        assert node_a.cache_recommendations(PREFERENCES, ["prod001"], RECOMMENDATIONS)
+
+        assert node_b.get_cached_recommendations(PREFERENCES, ["prod001"]) == RECOMMENDATIONS
+        assert node_b.get_memory_stats()["l2_hits"] == 1
+        assert 0 <= node_b.get_entry_age(PREFERENCES, ["prod001"]) < 5
+
+        found = node_b.get_many_cached_recommendations([(PREFERENCES, ["prod001"]), (PREFERENCES, ["prod002"])])
+        assert found == [RECOMMENDATIONS, None]
+        stats = node_b.get_cache_stats()
+        assert stats["total_entries"] == 1 and stats["backend"]["backend"] == "redis"
+
+    # server gone: lookups are misses and writes fail softly
+    assert node_b.get_cached_recommendations(PREFERENCES, ["prod002"]) is None
+    assert node_b.get_many_cached_recommendations([(PREFERENCES, ["prod003"])]) == [None]
+    assert not node_b.cache_recommendations(PREFERENCES, ["prod002"], RECOMMENDATIONS)
+
+
+def test_file_backend_honors_per_entry_ttl(tmp_path):
+    backend = FileCacheBackend(str(tmp_path), ttl_seconds=3600)
+    backend.set('aa01', b'long', 3600)
+    backend.set('aa02', b'short', 0.05)
+    assert backend.ttl('aa02') < 1 < backend.ttl('aa01')
+    short, missing, long_ = backend.ttl_many(['aa02', 'aa03', 'aa01'])
+    assert short < 1 < long_ and missing is None
+    assert backend.get_many(['aa01', 'aa02', 'aa03']) == [b'long', b'short', None]
+
+    time.sleep(0.1)
+    assert backend.stats()['expired_entries'] == 1
+    assert backend.clear_expired() == 1
+    assert backend.get('aa02') is None and backend.get('aa01') == b'long'
+    backend.close()
+
+
+def test_incomplete_backend_fails_when_created():
+    class GetOnly(CacheBackend):
+        def get(self, key):
+            return None
+
+    with pytest.raises(TypeError, match="abstract"):
+        GetOnly()
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError):
+        make_cache_backend('memcached')
@@ -0,0 +1,55 @@
+"""
+Cache key canonicalization rules and their hit statistics.
+"""
+
+from services.cache_key import CacheKeyCanonicalizer
+from services.cache_service import LLMCacheService
+from services.product_service import ProductService
+
+RECOMMENDATIONS = {"recommendations": [], "count": 0}
+
+
+def test_rules_normalize_requests():
+    canonicalizer = CacheKeyCanonicalizer(
+        ProductService(), history_limit=3, price_buckets=[0, 50, 100, 200]
+    )
+    prefs, history, applied = canonicalizer.canonicalize(
+        {"priceRange": "60-120", "categories": ["Home", "Electronics", "Home"], "brands": []},
+        ["prod001", "nope", "prod002", "prod003", "prod001", "prod004"]
+    )
+    assert prefs == {"priceRange": "50-200", "categories": ["Electronics", "Home"], "brands": []}
+    # the repeated view counts as its most recent position
+    assert history == ["prod003", "prod001", "prod004"]
+    assert applied == ["facets", "price_bucket", "unknown_ids", "history_dedupe", "history_limit"]
+
+    # canonical requests are left alone
+    assert canonicalizer.canonicalize(prefs, history)[2] == []
+    assert canonicalizer.canonicalize({"priceRange": "all"}, [])[0] == {"priceRange": "all"}
+
+
+def test_history_dedupe_can_be_switched_off():
+    canonicalizer = CacheKeyCanonicalizer(history_dedupe=False, history_limit=3)
+    prefs, history, applied = canonicalizer.canonicalize({}, ["a", "b", "a", "c", "a"])
+    # repeats are kept and the limit counts every view
+    assert history == ["a", "c", "a"]
+    assert applied == ["history_limit"]
+    assert canonicalizer.canonicalize({}, ["a", "a"])[1:] == (["a", "a"], [])
+
+
+def test_order_insensitive_history():
+    canonicalizer = CacheKeyCanonicalizer(history_order_insensitive=True)
+    assert canonicalizer.canonicalize({}, ["b", "a"])[1:] == (["a", "b"], ["history_order"])
+
+
+def test_equivalent_requests_share_an_entry_and_rules_are_counted(tmp_path):
+    cache = LLMCacheService(cache_dir=str(tmp_path))
+    cache.cache_recommendations({"priceRange": "all", "categories": ["A", "B"]}, ["x"], RECOMMENDATIONS)
+
+    assert cache.get_cached_recommendations({"priceRange": "all", "categories": ["B", "A"]}, ["x", "x"]) \
+        == RECOMMENDATIONS
+    assert cache.get_cached_recommendations({"priceRange": "all", "categories": ["C", "B"]}, ["x"]) is None
+
+    stats = cache.get_cache_stats()["canonicalization"]
+    assert stats["facets"] == {"applied": 2, "hits": 1, "hit_rate": 0.5}
+    assert stats["history_dedupe"]["hits"] == 1
+    assert stats["price_bucket"]["applied"] == 0
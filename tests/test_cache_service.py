@@ -0,0 +1,150 @@
+"""
+Unit tests for LLMCacheService.
+"""
+
+import os
+import shutil
+import time
+
+from services.cache_backends import FileCacheBackend
+from services.cache_service import LLMCacheService
+
+PREFERENCES = {"priceRange": "all", "categories": ["Home"], "brands": []}
+RECOMMENDATIONS = {"recommendations": [{"product": {"id": "prod010"}, "explanation": "x", "confidence_score": 7}],
+                   "count": 1}
+
+
+def test_write_through_and_l1_hit_without_disk(tmp_path):
+    cache = LLMCacheService(cache_dir=str(tmp_path))
+    assert cache.cache_recommendations(PREFERENCES, ["prod001"], RECOMMENDATIONS)
+
+    # remove the file: an L1 hit must not need it
+    key = cache.get_cache_key(PREFERENCES, ["prod001"])
+    os.remove(cache.backend.path(key))
+    assert cache.get_cached_recommendations(PREFERENCES, ["prod001"]) == RECOMMENDATIONS
+
+    stats = cache.get_memory_stats()
+    assert stats["l1_hits"] == 1
+    assert stats["entries"] == 1
+
+
+def test_l2_hit_is_promoted(tmp_path):
+    writer = LLMCacheService(cache_dir=str(tmp_path))
+    writer.cache_recommendations(PREFERENCES, [], RECOMMENDATIONS)
+
+    reader = LLMCacheService(cache_dir=str(tmp_path))
+    assert reader.get_cached_recommendations(PREFERENCES, []) == RECOMMENDATIONS
+    assert reader.get_cached_recommendations(PREFERENCES, []) == RECOMMENDATIONS
+    assert reader.get_cached_recommendations(PREFERENCES, ["prod404"]) is None
+
+    stats = reader.get_memory_stats()
+    assert (stats["l2_hits"], stats["l1_hits"], stats["misses"]) == (1, 1, 1)
+    assert stats["l1_hit_rate"] == round(1 / 3, 4)
+
+
+def test_lru_limits_and_ttl(tmp_path):
+    cache = LLMCacheService(cache_dir=str(tmp_path), memory_max_entries=2)
+    for pid in ["a", "b", "c"]:
+        cache.cache_recommendations(PREFERENCES, [pid], RECOMMENDATIONS)
+    keys = list(cache._memory)
+    assert keys == [cache.get_cache_key(PREFERENCES, [pid]) for pid in ["b", "c"]]
+
+    tiny = LLMCacheService(cache_dir=str(tmp_path), memory_max_bytes=10)
+    tiny.cache_recommendations(PREFERENCES, ["a"], RECOMMENDATIONS)
+    assert tiny.get_memory_stats()["entries"] == 0
+
+    expiring = LLMCacheService(cache_dir=str(tmp_path), ttl_hours=0.5 / 3600)
+    expiring.cache_recommendations(PREFERENCES, ["z"], RECOMMENDATIONS)
+    time.sleep(0.6)
+    assert expiring.get_cached_recommendations(PREFERENCES, ["z"]) is None
+    assert expiring.get_memory_stats()["entries"] == 0
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_sharded_layout_index_stats_and_expiry(tmp_path):
+    cache = LLMCacheService(cache_dir=str(tmp_path), ttl_hours=1)
+    cache.backend._reconcile_thread.join()
+    for pid in ["a", "b", "c"]:
+        cache.cache_recommendations(PREFERENCES, [pid], RECOMMENDATIONS)
+
+    key = cache.get_cache_key(PREFERENCES, ["a"])
+    assert os.path.exists(tmp_path / key[:2] / f"{key}.json")
+
+    stats = cache.get_cache_stats()
+    assert (stats["total_entries"], stats["expired_entries"]) == (3, 0)
+    assert stats["total_size_kb"] > 0
+
+    # age one entry in the index only; expiry must not need the payload
+    cache.backend.index.put(key, time.time() - 7200, 10)
+    assert cache.get_cache_stats()["expired_entries"] == 1
+    assert cache.clear_expired_cache() == 1
+    assert not os.path.exists(tmp_path / key[:2] / f"{key}.json")
+    assert cache.get_cache_stats()["total_entries"] == 2
+
+    assert cache.clear_all_cache() == 2
+    assert cache.get_cache_stats()["total_entries"] == 0
+
+
+def test_flat_layout_files_are_migrated(tmp_path):
+    legacy = LLMCacheService(cache_dir=str(tmp_path))
+    legacy.cache_recommendations(PREFERENCES, ["old"], RECOMMENDATIONS)
+    key = legacy.get_cache_key(PREFERENCES, ["old"])
+    legacy.backend.close()
+    os.replace(tmp_path / key[:2] / f"{key}.json", tmp_path / f"{key}.json")
+    os.remove(tmp_path / FileCacheBackend.INDEX_FILENAME)
+
+    cache = LLMCacheService(cache_dir=str(tmp_path))
+    assert wait_for(lambda: cache.get_cache_stats()["total_entries"] == 1)
+    assert not os.path.exists(tmp_path / f"{key}.json")
+    assert cache.get_cached_recommendations(PREFERENCES, ["old"]) == RECOMMENDATIONS
+
+
+def test_compact_compressed_entries_rehydrate_from_catalog(tmp_path):
+    from services.product_service import ProductService
+
+    products = ProductService()
+    full = {
+        "recommendations": [
+            {"product": products.get_product_by_id(pid), "explanation": f"because {pid}", "confidence_score": 8}
+            for pid in ["prod002", "prod009", "prod015"]
+        ],
+        "count": 3
+    }
+
+    plain = LLMCacheService(cache_dir=str(tmp_path / "plain"))
+    plain.cache_recommendations(PREFERENCES, [], full)
+    compact = LLMCacheService(cache_dir=str(tmp_path / "compact"), product_service=products, compression="zlib")
+    compact.cache_recommendations(PREFERENCES, [], full)
+
+    key = compact.get_cache_key(PREFERENCES, [])
+    plain_key = plain.get_cache_key(PREFERENCES, [])
+    plain_size = os.path.getsize(plain.backend.path(plain_key))
+    compact_size = os.path.getsize(compact.backend.path(key))
+    assert compact_size * 5 < plain_size
+    # only the entry itself is left in the shard, no temp files
+    assert os.listdir(tmp_path / "compact" / key[:2]) == [f"{key}.json"]
+
+    reader = LLMCacheService(cache_dir=str(tmp_path / "compact"), product_service=products)
+    assert reader.get_cached_recommendations(PREFERENCES, []) == full
+
+    # full-format entries are still readable with a product service
+    legacy_reader = LLMCacheService(cache_dir=str(tmp_path / "plain"), product_service=products)
+    legacy_reader.backend._ensure_shard(key)
+    shutil.copy(plain.backend.path(plain_key), legacy_reader.backend.path(key))
+    assert legacy_reader.get_cached_recommendations(PREFERENCES, []) == full
+
+
+def test_unreadable_entry_is_a_miss(tmp_path):
+    cache = LLMCacheService(cache_dir=str(tmp_path), memory_max_entries=0)
+    cache.cache_recommendations(PREFERENCES, [], RECOMMENDATIONS)
+    with open(cache.backend.path(cache.get_cache_key(PREFERENCES, [])), "wb") as f:
+        f.write(b'{"timestamp": 1')
+    assert cache.get_cached_recommendations(PREFERENCES, []) is None
@@ -0,0 +1,129 @@
+"""
+Cold-start cache warm-up against the local stub completions server.
+"""
+
+import asyncio
+import threading
+
+from services.cache_warmer import CacheWarmer, enumerate_preferences
+from services.llm_service import LLMService
+from stub_llm_server import StubLLMServer
+
+
+PRODUCTS = [
+    {"id": "1", "category": "Home", "brand": "A"},
+    {"id": "2", "category": "Home", "brand": "B"},
+    {"id": "3", "category": "Electronics", "brand": "C"},
+    {"id": "4", "category": "Home", "brand": "A"},
+]
+
+
+def test_enumerate_preferences():
+    combos = enumerate_preferences(PRODUCTS, ["all", "0-50"], max_categories=1, max_brands=1)
+    assert combos[0] == {"priceRange": "all", "categories": [], "brands": []}
+    # brands are only paired with categories they sell in
+    assert {"priceRange": "all", "categories": ["Home"], "brands": ["C"]} not in combos
+    assert {"priceRange": "0-50", "categories": ["Electronics"], "brands": ["C"]} in combos
+    # (none + 3 brands) + Home (none + 2) + Electronics (none + 1), per price range
+    assert len(combos) == 2 * (4 + 3 + 2)
+
+    popular = enumerate_preferences(PRODUCTS, max_categories=1, max_brands=0, popular=1)
+    assert [c["categories"] for c in popular] == [[], ["Home"]]
+
+
+def test_warmer_fills_the_cache_and_resumes():
+    async def run(stub):
+        service = LLMService()
+        service.api_base = stub.api_base
+        warmer = CacheWarmer(service, price_ranges=["10-20"], max_brands=0, popular=2, rate=0)
+        try:
+            first = await warmer.run()
+            second = await warmer.run()
+            hit = await service.agenerate_recommendations(
+                {"priceRange": "10-20", "categories": [], "brands": []}, [],
+                service.product_service.get_all_products())
+        finally:
+            await service.aclose()
+        return first, second, hit
+
+    with StubLLMServer() as stub:
+        first, second, hit = asyncio.run(run(stub))
+
+    assert (first["total"], first["warmed"], first["failed"]) == (3, 3, 0)
+    assert (second["fresh"], second["warmed"]) == (3, 0)
+    assert hit["cached"] is True
+    assert stub.requests == 3
+
+
+def test_freshness_is_checked_in_bulk_off_the_event_loop():
+    service = LLMService()
+    backend = service.cache_service.backend
+    calls = []
+
+    def ttl_many(keys):
+        calls.append((len(keys), threading.current_thread() is threading.main_thread()))
+        return [None] * len(keys)
+
+    backend.ttl = None
+    backend.ttl_many = ttl_many
+    warmer = CacheWarmer(service, price_ranges=["all", "0-50", "50-100"], max_brands=1, rate=0)
+    warmer.FRESHNESS_BATCH = 16
+    combos = warmer.preferences()
+
+    stats = asyncio.run(warmer.run(dry_run=True))
+    assert stats["total"] == stats["total"] - stats["fresh"] == len(combos)
+    assert sum(size for size, _ in calls) == len(combos)
+    assert len(calls) == -(-len(combos) // 16)
+    assert not any(on_main_thread for _, on_main_thread in calls)
+
+
+def test_warmer_counts_failures():
+    async def run():
+        service = LLMService()
+        service.api_base = "http://127.0.0.1:9/v1"
+        service.request_timeout = 1
+        warmer = CacheWarmer(service, price_ranges=["1-2"], max_categories=0, max_brands=0, rate=0)
+        try:
+            return await warmer.run()
+        finally:
+            await service.aclose()
+
+    stats = asyncio.run(run())
+    assert (stats["total"], stats["warmed"], stats["failed"]) == (1, 0, 1)
+
+
+def test_empty_answers_count_as_failed_and_are_retried():
+    async def run(stub):
+        service = LLMService()
+        service.api_base = stub.api_base
+        warmer = CacheWarmer(service, price_ranges=["30-40"], max_brands=0, popular=2, rate=0)
+        try:
+            return await warmer.run(), await warmer.run()
+        finally:
+            await service.aclose()
+
+    with StubLLMServer(content="[]") as stub:
+        first, second = asyncio.run(run(stub))
+
+    assert (first["total"], first["warmed"], first["failed"]) == (3, 0, 3)
+    # nothing was cached, so the next run tries every combination again
+    assert (second["fresh"], second["failed"]) == (0, 3)
+    assert stub.requests == 6
+
+
+def test_worker_pool_bounds_the_calls_in_flight():
+    async def run(stub):
+        service = LLMService()
+        service.api_base = stub.api_base
+        warmer = CacheWarmer(service, price_ranges=["1-5", "5-10", "10-20"], max_brands=1, rate=0,
+                             concurrency=2)
+        try:
+            return await warmer.run()
+        finally:
+            await service.aclose()
+
+    with StubLLMServer(delay=0.05) as stub:
+        stats = asyncio.run(run(stub))
+
+    assert stats["warmed"] == stats["total"] - stats["fresh"] > 2
+    assert stub.max_in_flight == 2
@@ -0,0 +1,58 @@
+"""
+Pre-encoded product list bodies: projection, pagination, ETags and gzip.
+"""
+
+import gzip
+import json
+
+from services.catalog_response import CatalogResponse, etag_matches
+from services.product_service import ProductService
+
+
+def test_full_body_matches_catalog():
+    products = ProductService().products
+    catalog = CatalogResponse(products)
+    page = catalog.page()
+    assert json.loads(page["body"]) == products
+    assert gzip.decompress(catalog.gzip_page(page)) == page["body"]
+    assert page["next_cursor"] is None
+
+
+def test_cursor_pagination_walks_the_catalog():
+    products = ProductService().products
+    catalog = CatalogResponse(products)
+    fields = catalog.parse_fields("id, name,price,id")
+    assert fields == ("id", "name", "price")
+
+    seen, cursor = [], None
+    while True:
+        page = catalog.page(fields, catalog.cursor_offset(cursor), limit=7)
+        seen.extend(json.loads(page["body"]))
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert seen == [{"id": p["id"], "name": p["name"], "price": p["price"]} for p in products]
+    assert catalog.cursor_offset("missing") is None
+
+
+def test_etag_is_stable_per_page_and_changes_with_catalog():
+    products = ProductService().products
+    catalog = CatalogResponse(products)
+    first = catalog.page(None, 0, 5)
+    assert CatalogResponse(products).page(None, 0, 5)["etag"] == first["etag"]
+    assert catalog.page(None, 5, 5)["etag"] != first["etag"]
+    assert catalog.page(("id",), 0, 5)["etag"] != first["etag"]
+
+    changed = [dict(products[0], price=1.0)] + products[1:]
+    assert CatalogResponse(changed).page(None, 0, 5)["etag"] != first["etag"]
+
+
+def test_if_none_match_parsing():
+    etag = '"abc-1234"'
+    assert etag_matches('"abc-1234"', etag)
+    assert etag_matches('W/"abc-1234"', etag)
+    assert etag_matches('"old", W/"abc-1234" ,"other"', etag)
+    assert etag_matches(' * ', etag)
+    assert not etag_matches('"abc-12345", W/"abc"', etag)
+    assert not etag_matches('', etag) and not etag_matches(None, etag)
@@ -0,0 +1,143 @@
+"""
+Memory-mapped catalog snapshots and their dict-like product records.
+"""
+
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import generate_catalog, generate_requests, load_bundled_catalog
+from services.catalog_snapshot import (
+    MappedCatalog, ProductRecord, StringTable, json_default, load_snapshot, write_snapshot
+)
+from services.product_service import CatalogVersion, snapshot_sections, snapshot_sections_format
+
+
+PRODUCTS = [
+    {"id": "p1", "name": "Café Mug", "category": "Kitchen", "price": 12.5, "inventory": 3,
+     "tags": ["mug", "kitchen"], "features": []},
+    {"id": "p2", "category": "Kitchen", "price": 7.0, "tags": ["mug"], "on_sale": True,
+     "dimensions": {"h": 10, "w": 8}},
+    {"name": "No id", "id": "p3", "category": "Garden", "price": 30, "tags": []},
+]
+
+
+def test_records_round_trip_as_dicts(tmp_path):
+    path = str(tmp_path / "catalog.snapshot")
+    write_snapshot(PRODUCTS, path)
+    catalog = MappedCatalog(path)
+
+    assert catalog.products == PRODUCTS
+    for record, product in zip(catalog.products, PRODUCTS):
+        assert list(record) == list(product)
+        assert json.dumps(record, default=json_default) == json.dumps(product)
+
+    record = catalog.products[1]
+    assert "name" not in record and record.get("name", "?") == "?"
+    assert record["on_sale"] is True
+    assert record.copy() == PRODUCTS[1]
+    # interned strings are shared between records
+    assert catalog.products[0]["category"] is catalog.products[1]["category"]
+
+
+def test_stale_snapshot_is_rebuilt(tmp_path):
+    source = tmp_path / "products.json"
+    snapshot = str(tmp_path / "products.snapshot")
+    source.write_text(json.dumps(PRODUCTS))
+    assert load_snapshot(snapshot, str(source)).products == PRODUCTS
+
+    changed = PRODUCTS[:2]
+    source.write_text(json.dumps(changed))
+    stat = os.stat(source)
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert load_snapshot(snapshot, str(source)).products == changed
+
+
+def test_concurrent_loads_rebuild_a_stale_snapshot_once(tmp_path):
+    source = tmp_path / "products.json"
+    snapshot = str(tmp_path / "products.snapshot")
+    source.write_text(json.dumps(PRODUCTS))
+    builds = []
+
+    def derive(products):
+        builds.append(len(products))
+        # keep the lock long enough for the other loaders to queue on it
+        time.sleep(0.2)
+        return {"count": np.array([len(products)])}
+
+    loaded = []
+    threads = [threading.Thread(target=lambda: loaded.append(load_snapshot(snapshot, str(source), derive, "1")))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert builds == [3]
+    assert [catalog.products for catalog in loaded] == [PRODUCTS] * 4
+
+
+def test_garbage_snapshot_is_replaced(tmp_path):
+    source = tmp_path / "products.json"
+    snapshot = tmp_path / "products.snapshot"
+    source.write_text(json.dumps(PRODUCTS))
+    snapshot.write_bytes(b"not a snapshot")
+    assert load_snapshot(str(snapshot), str(source)).products == PRODUCTS
+
+
+def test_derived_sections_round_trip(tmp_path):
+    path = str(tmp_path / "catalog.snapshot")
+    derived = {
+        "rows": np.arange(12, dtype=np.int32).reshape(3, 4),
+        "blob": b"\x00encoded",
+        "names": ["Café", "", "mug"],
+        "values": ["a", None, 3],
+    }
+    write_snapshot(PRODUCTS, path, derived=derived, derived_format="1")
+    catalog = MappedCatalog(path)
+
+    assert catalog.derived_format == "1"
+    assert np.array_equal(catalog.derived["rows"], derived["rows"])
+    assert bytes(catalog.derived["blob"]) == derived["blob"]
+    names = catalog.derived["names"]
+    assert isinstance(names, StringTable)
+    assert names[0] == "Café" and names[-1] == "mug" and list(names) == derived["names"]
+    assert catalog.derived["values"] == derived["values"]
+
+    write_snapshot(PRODUCTS, path)
+    assert MappedCatalog(path).derived == {} and MappedCatalog(path).derived_format is None
+
+
+def test_catalog_indexes_are_mapped_without_reading_products(tmp_path, monkeypatch):
+    source = tmp_path / "products.json"
+    source.write_text(json.dumps(generate_catalog(400, seed=3) + load_bundled_catalog()[:5]))
+    built = CatalogVersion(json.loads(source.read_text()))
+    snapshot = load_snapshot(str(tmp_path / "products.snapshot"), str(source),
+                             snapshot_sections, snapshot_sections_format())
+
+    def no_record_access(self, key):
+        raise AssertionError(f"product field {key!r} read while mapping the catalog")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(ProductRecord, "__getitem__", no_record_access)
+        mapped = CatalogVersion(snapshot.products, snapshot)
+
+    assert mapped.version == built.version
+    assert mapped.products_by_id.keys() == built.products_by_id.keys()
+    for index in ("category_index", "brand_index", "subcategory_index", "tag_index"):
+        assert dict(getattr(mapped, index)) == dict(getattr(built, index))
+    for name in ("browsed_fragments", "candidate_fragments", "browsed_fragment_tokens", "candidate_fragment_tokens"):
+        assert dict(getattr(mapped, name)) == dict(getattr(built, name))
+
+    for fields, offset, limit in ((None, 0, None), (None, 7, 20), (None, 400, 50), (("id", "price"), 3, 5)):
+        page = mapped.catalog_response.page(fields, offset, limit)
+        expected = built.catalog_response.page(fields, offset, limit)
+        assert page["body"] == expected["body"] and page["etag"] == expected["etag"]
+
+    requests = generate_requests(built.products, 40, seed=5)
+    for preferences, history in requests:
+        mapped_history = [mapped.products_by_id[p["id"]] for p in history]
+        assert mapped.scoring_catalog.rank(preferences, mapped_history) == \
+            built.scoring_catalog.rank(preferences, history)
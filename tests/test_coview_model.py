@@ -0,0 +1,135 @@
+"""
+Co-view counts, neighbor lists, snapshots and their use in candidate scoring.
+"""
+
+import json
+import os
+import tempfile
+
+from services.coview_model import CoViewModel
+from services.product_service import ProductService
+from services.scoring_engine import ScoringCatalog
+
+
+def test_neighbors_rank_by_cosine_and_respect_min_count():
+    model = CoViewModel(top_n=2, min_count=2)
+    for history in (['a', 'b'], ['a', 'b'], ['a', 'c'], ['a', 'c'], ['c', 'd'], ['a', 'e'], ['a', 'a', 'b']):
+        model.ingest(history)
+    model.rebuild_neighbors()
+
+    # a-b: 3 sessions, a in 6 and b in 3; a-c: 2, c in 3; a-e only once
+    assert [pid for pid, _ in model.neighbors('a')] == ['b', 'c']
+    assert model.neighbors('b')[0] == ('a', round(3 / (6 * 3) ** 0.5, 6))
+    assert model.neighbors('d') == ()
+    assert model.ingest(['a', 'a']) is False
+
+    related = model.related(['b', 'c'])
+    assert set(related) == {'a'}
+    assert related['a'] == (model.neighbors('b')[0][1] + model.neighbors('c')[0][1]) / 2
+
+
+def test_max_history_keeps_the_most_recent_views():
+    model = CoViewModel(min_count=1, max_history=2)
+    model.ingest(['old', 'x', 'y'])
+    model.rebuild_neighbors()
+    assert model.neighbors('old') == ()
+    assert model.neighbors('x') == (('y', 1.0),)
+
+
+def test_observe_is_ingested_on_flush():
+    model = CoViewModel(min_count=1)
+    model.observe(['a', 'b'])
+    model.observe(['a'])
+    assert model.neighbors('a') == ()
+    assert model.flush() == 1
+    assert model.neighbors('a') == (('b', 1.0),)
+    assert model.get_stats()['pending'] == 0
+
+
+def test_delta_buffer_is_merged_into_the_counts():
+    model = CoViewModel(min_count=1)
+    model.MAX_DELTA = 4
+    model.ingest(['a', 'b'])
+    assert (model.get_stats()['pairs'], model.get_stats()['delta_pairs']) == (0, 1)
+    # a full buffer is merged while ingesting
+    model.ingest(['a', 'b', 'c'])
+    assert (model.get_stats()['pairs'], model.get_stats()['delta_pairs']) == (3, 0)
+    model.ingest(['c', 'd'])
+    model.rebuild_neighbors()
+    assert (model.get_stats()['pairs'], model.get_stats()['delta_pairs']) == (4, 0)
+    assert model.neighbors('a') == (('b', 1.0), ('c', 0.5))
+    assert model.neighbors('c') == (('d', round(2 ** -0.5, 6)), ('a', 0.5), ('b', 0.5))
+
+
+def test_snapshot_round_trip_and_jsonl_ingestion():
+    directory = tempfile.mkdtemp()
+    log_path = os.path.join(directory, 'requests.jsonl')
+    with open(log_path, 'w') as f:
+        f.write(json.dumps({'preferences': {}, 'browsing_history': ['a', 'b', 'c']}) + '\n')
+        f.write(json.dumps({'request': {'browsing_history': ['a', 'b']}}) + '\n')
+        f.write(json.dumps(['b', 'c']) + '\n')
+        f.write('not json\n\n')
+        f.write(json.dumps({'browsing_history': 'a'}) + '\n')
+
+    model = CoViewModel(min_count=1, snapshot_path=os.path.join(directory, 'coview.npz'))
+    assert model.ingest_jsonl(log_path) == (3, 2)
+    model.save()
+
+    restored = CoViewModel(min_count=1, snapshot_path=model.snapshot_path)
+    restored.load()
+    assert restored.get_stats() == model.get_stats()
+    for product_id in 'abc':
+        assert restored.neighbors(product_id) == model.neighbors(product_id)
+
+    # counting carries on from the snapshot
+    restored.ingest(['a', 'c'])
+    restored.rebuild_neighbors()
+    # c was seen with b twice before; now with a twice as well
+    assert restored.neighbors('c')[0][1] == restored.neighbors('c')[1][1]
+    assert restored.sessions == 4
+
+
+def test_workers_share_the_model_through_spool_and_snapshot():
+    directory = tempfile.mkdtemp()
+    snapshot = os.path.join(directory, 'coview.npz')
+    spool = snapshot + '.spool.jsonl'
+    owner = CoViewModel(min_count=1, snapshot_path=snapshot)
+    other = CoViewModel(min_count=1, snapshot_path=snapshot)
+
+    # stop() runs the background job once more, as the interval would
+    other.start(3600, save=False, spool_path=spool)
+    other.observe(['a', 'b'])
+    other.stop()
+    assert other.neighbors('a') == () and other.get_stats()['pending'] == 0
+
+    owner.start(3600, save=True, spool_path=spool)
+    owner.observe(['c', 'd'])
+    owner.stop()
+    assert owner.neighbors('a') == (('b', 1.0),) and owner.sessions == 2
+    assert os.path.getsize(spool) == 0
+
+    other.start(3600, save=False, spool_path=spool)
+    other.stop()
+    assert other.get_stats() == owner.get_stats()
+    assert other.neighbors('c') == (('d', 1.0),)
+    assert not other.reload_if_changed()
+
+
+def test_coview_scores_lift_related_candidates():
+    products = ProductService().get_all_products()
+    catalog = ScoringCatalog(products)
+    preferences = {'priceRange': 'all', 'categories': [], 'brands': []}
+    browsed = products[:1]
+
+    baseline = [p['id'] for p in catalog.select(preferences, browsed, 5)]
+    outsider = next(p['id'] for p in products[1:] if p['id'] not in baseline)
+    related = {outsider: 1.0, 'not-in-catalog': 1.0}
+    scores, _ = catalog.score(preferences, browsed)
+    boosted, _ = catalog.score(preferences, browsed, catalog.request_context(preferences, browsed, related))
+    position = catalog.id_positions[outsider][0]
+    assert boosted[position] - scores[position] == ScoringCatalog.COVIEW_WEIGHT
+    assert (boosted != scores).sum() == 1
+
+    context = catalog.request_context(preferences, browsed, related)
+    product = next(p for p in products if p['id'] == outsider)
+    assert catalog.match_signals(product, context)['coview'] is True
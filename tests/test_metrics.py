@@ -0,0 +1,78 @@
+"""
+Metric rendering, request timing spans and the instrumented LLM path.
+"""
+
+import asyncio
+
+from services.llm_service import LLMService
+from services.metrics import (
+    STAGE_SECONDS, MetricsRegistry, server_timing, span, start_request_timing, stop_request_timing
+)
+from stub_llm_server import StubLLMServer
+
+
+def test_prometheus_rendering():
+    registry = MetricsRegistry()
+    errors = registry.counter('errors_total', 'Errors', ('call',))
+    latency = registry.histogram('latency_seconds', 'Latency', ('stage',), buckets=(0.1, 1.0))
+    errors.inc(call='a "quoted" call')
+    errors.inc(2, call='a "quoted" call')
+    latency.observe(0.05, stage='llm')
+    latency.observe(0.5, stage='llm')
+    latency.observe(5, stage='llm')
+    registry.add_collector(lambda: [('in_flight', 'gauge', 'In flight', [({}, 3)])])
+    registry.add_collector(lambda: 1 / 0)
+
+    lines = registry.render().splitlines()
+    assert 'errors_total{call="a \\"quoted\\" call"} 3' in lines
+    assert 'latency_seconds_bucket{stage="llm",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{stage="llm",le="1.0"} 2' in lines
+    assert 'latency_seconds_bucket{stage="llm",le="+Inf"} 3' in lines
+    assert 'latency_seconds_sum{stage="llm"} 5.55' in lines
+    assert 'latency_seconds_count{stage="llm"} 3' in lines
+    assert '# TYPE in_flight gauge' in lines and 'in_flight 3' in lines
+
+
+def test_spans_are_collected_per_request():
+    timings, token = start_request_timing()
+    try:
+        with span('parse'):
+            pass
+        with span('parse'):
+            pass
+        with span('llm'):
+            pass
+    finally:
+        stop_request_timing(token)
+    with span('parse'):
+        pass
+
+    assert [stage for stage, _ in timings] == ['parse', 'parse', 'llm']
+    header = server_timing(timings, total=0.5)
+    assert [entry.split(';')[0] for entry in header.split(', ')] == ['parse', 'llm', 'total']
+    assert header.endswith('total;dur=500.00')
+
+
+def test_llm_path_records_its_stages():
+    service = LLMService()
+    service.use_cache = False
+
+    async def run(stub):
+        service.api_base = stub.api_base
+        timings, token = start_request_timing()
+        try:
+            await service.agenerate_recommendations(
+                {"priceRange": "all", "categories": [], "brands": []}, ["prod007"],
+                service.product_service.get_all_products())
+        finally:
+            stop_request_timing(token)
+            await service.aclose()
+        return timings
+
+    llm_calls = STAGE_SECONDS.count(stage='llm')
+    with StubLLMServer() as stub:
+        timings = asyncio.run(run(stub))
+    stages = [stage for stage, _ in timings]
+    for stage in ('history', 'select', 'prompt', 'llm_wait', 'llm', 'parse'):
+        assert stage in stages
+    assert STAGE_SECONDS.count(stage='llm') == llm_calls + 1
@@ -0,0 +1,121 @@
+"""
+Unit tests for the indexed ProductService lookups.
+"""
+
+import json
+import time
+
+import pytest
+
+from services.catalog_snapshot import json_default
+from services.product_service import ProductService
+
+
+def test_id_lookup_matches_linear_scan():
+    service = ProductService()
+    for product in service.products:
+        assert service.get_product_by_id(product['id']) is product
+    assert service.get_product_by_id('missing') is None
+
+
+def test_get_products_by_ids_keeps_order_and_skips_unknown():
+    service = ProductService()
+    products = service.get_products_by_ids(['prod007', 'nope', 'prod002', 'prod007'])
+    assert [p['id'] for p in products] == ['prod007', 'prod002', 'prod007']
+
+
+def test_category_and_facet_lookup():
+    service = ProductService()
+    electronics = service.get_products_by_category('Electronics')
+    assert electronics == [p for p in service.products if p['category'] == 'Electronics']
+
+    found = service.find_products(categories=['Electronics'], tags=['wireless'])
+    expected = [
+        p for p in service.products
+        if p['category'] == 'Electronics' and 'wireless' in p.get('tags', [])
+    ]
+    assert found == expected
+    assert service.find_products(categories=['Electronics'], brands=['no-such-brand']) == []
+    assert service.find_products() == service.products
+
+
+def test_prompt_fragments_are_precomputed_for_catalog_products():
+    service = ProductService()
+    product = service.get_product_by_id('prod002')
+    assert service.get_browsed_fragment(product) is service.browsed_fragments['prod002']
+    assert '  - Tags: wireless, audio, noise-cancelling\n' in service.get_browsed_fragment(product)
+    assert '  - Tags:' not in service.get_candidate_fragment(product)
+
+    # a modified copy is rendered from its own fields
+    changed = dict(product, price=1.0)
+    assert '  - Price: $1.0\n' in service.get_candidate_fragment(changed)
+
+
+def _catalog_copy(tmp_path, service):
+    path = tmp_path / 'products.json'
+    path.write_text(json.dumps(service.products, default=json_default))
+    service.data_path = str(path)
+    return path
+
+
+def test_reload_swaps_in_a_new_version(tmp_path):
+    from services.cache_service import LLMCacheService
+
+    service = ProductService()
+    path = _catalog_copy(tmp_path, service)
+    assert service.reload() is False
+
+    cache = LLMCacheService(cache_dir=str(tmp_path / 'cache'), product_service=service)
+    key = cache.get_cache_key({'priceRange': 'all'}, ['prod002'])
+    old_catalog = service.catalog
+
+    products = json.loads(path.read_text())
+    products[1]['price'] = 1.0
+    path.write_text(json.dumps(products))
+    assert service.reload() is True
+
+    assert service.get_product_by_id('prod002')['price'] == 1.0
+    assert service.version != old_catalog.version
+    assert service.scoring_catalog.products is service.products
+    # the old version is left untouched for requests still using it
+    assert old_catalog.products_by_id['prod002']['price'] != 1.0
+    assert cache.get_cache_key({'priceRange': 'all'}, ['prod002']) != key
+
+
+def test_reload_if_changed_checks_the_file_stamp(tmp_path):
+    service = ProductService()
+    path = _catalog_copy(tmp_path, service)
+    assert service.reload_if_changed() is False
+    loaded = service.catalog
+
+    path.write_text(json.dumps(service.products[:10], default=json_default))
+    assert service.reload_if_changed() is True
+    assert len(service.products) == 10 and service.catalog is not loaded
+    assert service.reload_if_changed() is False
+
+
+def test_same_content_reload_leaves_the_shared_version_alone(tmp_path):
+    service = ProductService()
+    loaded = service.catalog
+    stamp = loaded.source_stamp
+    _catalog_copy(tmp_path, service)
+    assert service.reload_if_changed() is False
+    # the version in use is not modified, but the new stamp is remembered
+    assert service.catalog is loaded and loaded.source_stamp == stamp
+    service.reload = lambda: pytest.fail("reloaded an unchanged file again")
+    assert service.reload_if_changed() is False
+
+
+def test_watcher_reloads_on_file_change(tmp_path):
+    service = ProductService()
+    path = _catalog_copy(tmp_path, service)
+    service.reload()
+    service.start_watcher(0.02)
+    try:
+        path.write_text(json.dumps(service.products[:10], default=json_default))
+        deadline = time.monotonic() + 5
+        while len(service.products) != 10 and time.monotonic() < deadline:
+            time.sleep(0.02)
+    finally:
+        service.stop_watcher()
+    assert len(service.products) == 10
@@ -0,0 +1,59 @@
+"""
+Token-budgeted prompt construction.
+"""
+
+from services.llm_service import LLMService
+from services.token_estimator import estimate_tokens
+
+PREFERENCES = {"priceRange": "50-100", "categories": ["Electronics"], "brands": []}
+
+
+def test_estimator_is_in_a_sensible_range():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("Premium Wireless Headphones") == 4
+    assert estimate_tokens("Price: $199.99") == 6
+    text = "Select EXACTLY 5 products that would create the most compelling recommendations."
+    assert len(text) / 6 < estimate_tokens(text) < len(text) / 3
+
+
+def test_candidates_fill_the_budget_in_relevance_order():
+    service = LLMService()
+    service.prompt_max_candidates = 30
+    products = service.product_service.get_all_products()
+    history = service.product_service.get_products_by_ids(["prod002", "prod007"])
+    ranked = service._select_relevant_products(PREFERENCES, history, products, max_products=30)
+
+    counts = []
+    for budget in (800, 1500, 2500):
+        service.prompt_token_budget = budget
+        prompt, tokens = service._build_prompt(PREFERENCES, history, products)
+        assert tokens == estimate_tokens(prompt)
+        listed = [line.split("ID: ")[1] for line in prompt.splitlines() if "- ID: " in line][len(history):]
+        # a prefix of the ranking, or the ranking with oversized items skipped
+        assert listed == [p["id"] for p in ranked if p["id"] in listed]
+        if len(listed) > service.prompt_min_candidates:
+            assert tokens <= budget
+        counts.append(len(listed))
+
+    assert counts[0] == service.prompt_min_candidates
+    assert counts[0] < counts[1] < counts[2]
+
+
+def test_default_prompt_is_not_larger_than_the_fixed_cut():
+    service = LLMService()
+    products = service.product_service.get_all_products()
+    categories = sorted({p["category"] for p in products})
+    brands = sorted({p["brand"] for p in products})
+    fixed_cut = LLMService()
+    fixed_cut.prompt_token_budget = 10 ** 9
+    fixed_cut.prompt_max_candidates = 15
+
+    for i in range(60):
+        preferences = {"priceRange": ["all", "0-50", "50-100", "100-500"][i % 4],
+                       "categories": categories[i % len(categories):][:i % 3],
+                       "brands": brands[i % len(brands):][:i % 2]}
+        history = products[i % len(products):][:i % 5]
+        prompt, tokens = service._build_prompt(preferences, history, products)
+        baseline, baseline_tokens = fixed_cut._build_prompt(preferences, history, products)
+        assert tokens <= baseline_tokens
+        assert len(prompt) <= len(baseline)
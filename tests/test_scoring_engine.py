@@ -0,0 +1,257 @@
+"""
+With legacy feature matching, the vectorized ScoringCatalog must rank
+candidates exactly like the original per-product scoring loop, which is kept
+here as the reference.
+"""
+
+import random
+
+import numpy as np
+
+from benchmarks.synthetic import generate_catalog
+from services.product_service import ProductService
+from services.scoring_engine import ScoringCatalog
+
+
+def reference_select(user_preferences, browsed_products, all_products, max_products=15):
+    browsed_ids = set()
+    browsed_categories = set()
+    browsed_brands = set()
+    browsed_tags = set()
+    browsed_price_points = []
+
+    for product in browsed_products:
+        browsed_ids.add(product['id'])
+        if 'category' in product:
+            browsed_categories.add(product['category'])
+        if 'brand' in product:
+            browsed_brands.add(product['brand'])
+        if 'tags' in product and product['tags']:
+            browsed_tags.update(product['tags'])
+        if 'price' in product:
+            browsed_price_points.append(product['price'])
+
+    preferred_categories = set(user_preferences['categories']) if user_preferences['categories'] else set()
+    preferred_brands = set(user_preferences['brands']) if user_preferences['brands'] else set()
+
+    avg_browsed_price = None
+    if browsed_price_points:
+        avg_browsed_price = sum(browsed_price_points) / len(browsed_price_points)
+
+    product_scores = []
+    for product in all_products:
+        if product['id'] in browsed_ids:
+            continue
+        score = 0
+        if 'category' in product:
+            if product['category'] in preferred_categories:
+                score += 4
+            elif product['category'] in browsed_categories:
+                score += 3
+        if 'brand' in product:
+            if product['brand'] in preferred_brands:
+                score += 4
+            elif product['brand'] in browsed_brands:
+                score += 2.5
+        if user_preferences['priceRange'] != 'all' and 'price' in product:
+            try:
+                min_price, max_price = map(float, user_preferences['priceRange'].split('-'))
+                if min_price <= product['price'] <= max_price:
+                    score += 3
+                elif (product['price'] < min_price and product['price'] >= min_price * 0.8) or \
+                     (product['price'] > max_price and product['price'] <= max_price * 1.2):
+                    score += 1
+            except:
+                pass
+        elif avg_browsed_price is not None and 'price' in product:
+            price_diff_ratio = abs(product['price'] - avg_browsed_price) / avg_browsed_price if avg_browsed_price > 0 else 1
+            if price_diff_ratio <= 0.2:
+                score += 2
+            elif price_diff_ratio <= 0.4:
+                score += 1
+        if 'rating' in product:
+            if product['rating'] >= 4.7:
+                score += 2
+            elif product['rating'] >= 4.5:
+                score += 1.5
+            elif product['rating'] >= 4.0:
+                score += 1
+        if 'tags' in product and product['tags'] and browsed_tags:
+            score += len(set(product['tags']).intersection(browsed_tags)) * 0.75
+        if browsed_products and 'features' in product and product['features']:
+            browsed_features = set()
+            for bp in browsed_products:
+                if 'features' in bp and bp['features']:
+                    browsed_features.update(bp['features'])
+            feature_matches = 0
+            for feature in product['features']:
+                feature_lower = feature.lower()
+                for browsed_feature in browsed_features:
+                    if any(word in feature_lower for word in browsed_feature.lower().split()):
+                        feature_matches += 1
+                        break
+            score += feature_matches * 0.5
+        if preferred_categories and 'category' in product:
+            if product['category'] not in browsed_categories and product['category'] in preferred_categories:
+                score += 1
+        product_scores.append((product, score))
+
+    product_scores.sort(key=lambda x: x[1], reverse=True)
+
+    selected_products = []
+    selected_categories = set()
+    if product_scores:
+        selected_products.append(product_scores[0][0])
+        if 'category' in product_scores[0][0]:
+            selected_categories.add(product_scores[0][0]['category'])
+    remaining_scores = product_scores[1:]
+    for product, score in remaining_scores:
+        if len(selected_products) >= max_products:
+            break
+        category = product.get('category', '')
+        if len(selected_categories) >= 3 or not category or category in selected_categories:
+            continue
+        selected_products.append(product)
+        if category:
+            selected_categories.add(category)
+    for product, score in remaining_scores:
+        if len(selected_products) >= max_products:
+            break
+        if product not in selected_products:
+            selected_products.append(product)
+    return selected_products[:max_products]
+
+
+PRICE_RANGES = ['all', '0-50', '50-100', '100-200', '100+', '0-25']
+
+
+def random_request(rng, products, categories, brands):
+    preferences = {
+        'priceRange': rng.choice(PRICE_RANGES),
+        'categories': rng.sample(categories, rng.randint(0, min(3, len(categories)))),
+        'brands': rng.sample(brands, rng.randint(0, min(2, len(brands)))),
+    }
+    history = rng.sample(products, rng.randint(0, min(5, len(products))))
+    return preferences, history
+
+
+def assert_same_selection(products, rng, rounds, max_products=15):
+    catalog = ScoringCatalog(products, content_similarity='features')
+    categories = sorted({p['category'] for p in products if 'category' in p})
+    brands = sorted({p['brand'] for p in products if 'brand' in p})
+    for _ in range(rounds):
+        preferences, history = random_request(rng, products, categories, brands)
+        expected = reference_select(preferences, history, products, max_products)
+        actual = catalog.select(preferences, history, max_products)
+        assert [p['id'] for p in actual] == [p['id'] for p in expected]
+
+
+def test_matches_reference_on_bundled_catalog():
+    products = ProductService().get_all_products()
+    assert_same_selection(products, random.Random(7), rounds=300)
+    assert_same_selection(products, random.Random(8), rounds=50, max_products=3)
+
+
+def test_matches_reference_on_sparse_synthetic_catalog():
+    rng = random.Random(11)
+    words = ['fast', 'charge', 'steel', 'cotton', 'wireless', 'battery', 'light', 'a']
+    products = []
+    for i in range(400):
+        product = {'id': f'p{i}', 'name': f'Product {i}'}
+        if rng.random() > 0.05:
+            product['category'] = rng.choice(['Home', 'Electronics', 'Beauty', 'Sports', ''])
+        if rng.random() > 0.1:
+            product['brand'] = rng.choice(['A', 'B', 'C', 'D'])
+        if rng.random() > 0.1:
+            product['price'] = round(rng.uniform(5, 300), 2)
+        if rng.random() > 0.1:
+            product['rating'] = rng.choice([3.5, 4.0, 4.2, 4.5, 4.6, 4.7, 4.9])
+        product['tags'] = rng.sample(words, rng.randint(0, 3))
+        product['features'] = [' '.join(rng.sample(words, 2)).title() for _ in range(rng.randint(0, 3))]
+        products.append(product)
+    assert_same_selection(products, rng, rounds=200)
+
+
+def test_retrieval_scores_candidates_like_the_full_scan():
+    products = ProductService().get_all_products()
+    full = ScoringCatalog(products)
+    retrieval = ScoringCatalog(products, candidate_retrieval=True)
+    categories = sorted({p['category'] for p in products})
+    brands = sorted({p['brand'] for p in products})
+    rng = random.Random(5)
+    for _ in range(100):
+        preferences, history = random_request(rng, products, categories, brands)
+        context = retrieval.request_context(preferences, history)
+        candidates = retrieval.retrieve(context, 0)
+        all_scores, eligible = full.score(preferences, history)
+        scores, _ = retrieval.score(preferences, history, positions=candidates)
+        assert np.allclose(scores, all_scores[candidates])
+        assert not set(candidates.tolist()) & {p for h in history for p in full.id_positions[h['id']]}
+
+        # every product sharing a category, brand or tag with the request is a candidate
+        wanted = set(preferences['categories']) | {h['category'] for h in history}
+        brands_wanted = set(preferences['brands']) | {h['brand'] for h in history}
+        tags = {t for h in history for t in h['tags']}
+        matching = {i for i, p in enumerate(products) if eligible[i] and (
+            p['category'] in wanted or p['brand'] in brands_wanted or set(p['tags']) & tags)}
+        assert matching <= set(candidates.tolist())
+
+        ranked = retrieval.rank(preferences, history, 10)
+        assert len(ranked) == 10
+        assert np.allclose([score for _, score in ranked], [all_scores[position] for position, _ in ranked])
+
+
+def test_retrieval_ranks_like_the_full_scan():
+    for products, seed in ((ProductService().get_all_products(), 11), (generate_catalog(3000, seed=4), 12)):
+        full = ScoringCatalog(products)
+        retrieval = ScoringCatalog(products, candidate_retrieval=True)
+        categories = sorted({p['category'] for p in products})
+        brands = sorted({p['brand'] for p in products})
+        rng = random.Random(seed)
+        for _ in range(150):
+            preferences, history = random_request(rng, products, categories, brands)
+            for max_products in (1, 3, 10, 30):
+                expected = full.rank(preferences, history, max_products)
+                actual = retrieval.rank(preferences, history, max_products)
+                assert [position for position, _ in actual] == [position for position, _ in expected]
+                assert np.allclose([score for _, score in actual], [score for _, score in expected])
+
+
+def test_retrieval_backfills_with_best_rated_products():
+    products = ProductService().get_all_products()
+    catalog = ScoringCatalog(products, candidate_retrieval=True)
+    preferences = {'priceRange': 'all', 'categories': [], 'brands': []}
+    context = catalog.request_context(preferences, [])
+    points = catalog._rating_points(catalog.ratings)
+    order = sorted(range(len(products)), key=lambda i: (-points[i], i))
+    leaders = {next(i for i in order if products[i]['category'] == category)
+               for category in {p['category'] for p in products}}
+    assert catalog.retrieve(context, 0).tolist() == sorted(leaders)
+
+    candidates = catalog.retrieve(context, 5).tolist()
+    assert candidates == sorted(leaders | set(order[:5]))
+    full = ScoringCatalog(products)
+    assert catalog.rank(preferences, [], 5) == full.rank(preferences, [], 5)
+
+
+def test_retrieval_ranks_price_only_requests_like_the_full_scan():
+    products = ProductService().get_all_products()
+    full = ScoringCatalog(products)
+    retrieval = ScoringCatalog(products, candidate_retrieval=True)
+    for price_range in PRICE_RANGES + ['20-30', '150-400', '1000-2000']:
+        preferences = {'priceRange': price_range, 'categories': [], 'brands': []}
+        for max_products in (1, 3, 5, 10, 15, 30):
+            assert retrieval.rank(preferences, [], max_products) == full.rank(preferences, [], max_products)
+
+    # cold start on a budget gets products in the budget, like the full scan
+    preferences = {'priceRange': '0-50', 'categories': [], 'brands': []}
+    ranked = [products[position] for position, _ in retrieval.rank(preferences, [], 10)]
+    assert all(product['price'] <= 50 for product in ranked)
+
+    # browsed prices: products priced like the history are candidates
+    history = [p for p in products if p['id'] in ('prod002', 'prod014')]
+    context = retrieval.request_context({'priceRange': 'all', 'categories': [], 'brands': []}, history)
+    average = sum(p['price'] for p in history) / len(history)
+    similar = {i for i, p in enumerate(products)
+               if abs(p['price'] - average) / average <= 0.4 and p not in history}
+    assert similar <= set(retrieval.retrieve(context, 0).tolist())
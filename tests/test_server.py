@@ -0,0 +1,158 @@
+"""
+Pre-forking production server and the cache shared by its workers.
+"""
+
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from conftest import BACKEND_DIR
+from services.cache_service import LLMCacheService
+
+PREFERENCES = {"priceRange": "all", "categories": [], "brands": []}
+
+
+def test_forked_workers_share_the_cache():
+    cache = LLMCacheService(cache_dir=tempfile.mkdtemp(prefix='shared-cache-'), memory_max_entries=0)
+    cache.before_fork()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            cache.after_fork()
+            cache.cache_recommendations(PREFERENCES, ['prod001'], {'recommendations': [], 'from': 'child'})
+        finally:
+            os._exit(0)
+    os.waitpid(pid, 0)
+    cache.after_fork()
+    try:
+        assert cache.get_cached_recommendations(PREFERENCES, ['prod001'])['from'] == 'child'
+        assert cache.get_cache_stats()['total_entries'] == 1
+    finally:
+        cache.backend.close()
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _start_server(port, **env):
+    env = dict(os.environ, CACHE_DIR=tempfile.mkdtemp(prefix='server-cache-'), RECOMMENDATION_MODE='fast',
+               LOG_LEVEL='warning', **env)
+    return subprocess.Popen(
+        [sys.executable, 'server.py', '--host', '127.0.0.1', '--port', str(port), '--workers', '2'],
+        cwd=BACKEND_DIR, env=env
+    )
+
+
+def _recommend(server, port, history, timeout=30):
+    request = urllib.request.Request(
+        f"http://127.0.0.1:{port}/api/recommendations",
+        data=json.dumps({"preferences": PREFERENCES, "browsing_history": history}).encode(),
+        headers={"Content-Type": "application/json"}
+    )
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with urllib.request.urlopen(request, timeout=5) as response:
+                assert response.status == 200
+                return json.loads(response.read())
+        except OSError:
+            assert time.monotonic() < deadline and server.poll() is None
+            time.sleep(0.2)
+
+
+def _children(server):
+    with open(f"/proc/{server.pid}/task/{server.pid}/children") as f:
+        return [int(pid) for pid in f.read().split()]
+
+
+def test_server_forks_workers_and_stops_on_sigterm():
+    port = _free_port()
+    server = _start_server(port, COVIEW_ENABLED='false')
+    try:
+        assert _recommend(server, port, ["prod001"])["recommendations"]
+        assert len(_children(server)) == 2
+        # the master built a catalog snapshot the workers map
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/api/recommendations/stats", timeout=5) as response:
+            assert json.loads(response.read())["catalog"]["mapped"] is True
+
+        url = f"http://127.0.0.1:{port}/api/products?limit=5"
+        with urllib.request.urlopen(url, timeout=5) as response:
+            etag = response.headers["ETag"]
+        # a tag weakened by a proxy, in a list, still revalidates
+        conditional = urllib.request.Request(url, headers={"If-None-Match": f'"stale", W/{etag}'})
+        with pytest.raises(urllib.error.HTTPError) as not_modified:
+            urllib.request.urlopen(conditional, timeout=5)
+        assert not_modified.value.code == 304
+    finally:
+        server.send_signal(signal.SIGTERM)
+        assert server.wait(timeout=30) == 0
+
+
+def test_workers_share_coview_histories():
+    port = _free_port()
+    server = _start_server(port, COVIEW_ENABLED='true', COVIEW_MIN_COUNT='1', COVIEW_SNAPSHOT_PATH='',
+                           COVIEW_SNAPSHOT_INTERVAL_SECONDS='0.1')
+    try:
+        # fresh connections are spread over both workers
+        for _ in range(20):
+            _recommend(server, port, ["prod001", "prod002"])
+
+        deadline = time.monotonic() + 30
+        while True:
+            sessions = set()
+            for _ in range(10):
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/api/recommendations/stats", timeout=5) as f:
+                    sessions.add(json.loads(f.read())["coview"]["sessions"])
+            if sessions == {20}:
+                break
+            assert time.monotonic() < deadline, sessions
+            time.sleep(0.2)
+    finally:
+        server.send_signal(signal.SIGTERM)
+        assert server.wait(timeout=30) == 0
+
+
+def test_restarted_workers_reload_a_changed_catalog():
+    with open(os.path.join(BACKEND_DIR, 'data', 'products.json')) as f:
+        products = json.load(f)
+    data_path = os.path.join(tempfile.mkdtemp(prefix='server-catalog-'), 'products.json')
+    with open(data_path, 'w') as f:
+        json.dump(products, f)
+
+    port = _free_port()
+    # no watcher: only the restart can pick the change up
+    server = _start_server(port, DATA_PATH=data_path, COVIEW_ENABLED='false', CATALOG_RELOAD_INTERVAL_SECONDS='0')
+    try:
+        _recommend(server, port, ["prod001"])
+        with open(data_path, 'w') as f:
+            json.dump(products[:10], f)
+        workers = _children(server)
+        for pid in workers:
+            os.kill(pid, signal.SIGKILL)
+
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/api/recommendations/stats", timeout=5) as f:
+                    if json.loads(f.read())["catalog"]["products"] == 10:
+                        break
+            except OSError:
+                pass
+            assert time.monotonic() < deadline and server.poll() is None
+            time.sleep(0.2)
+        assert not set(_children(server)) & set(workers)
+    finally:
+        server.send_signal(signal.SIGTERM)
+        assert server.wait(timeout=30) == 0
@@ -0,0 +1,76 @@
+"""
+Incremental JSON parsing and the streaming recommendations path.
+"""
+
+import asyncio
+import json
+import time
+
+from services.llm_service import LLMService
+from services.stream_parser import IncrementalJSONArrayParser
+from stub_llm_server import StubLLMServer
+
+PREFERENCES = {"priceRange": "all", "categories": ["Electronics"], "brands": []}
+# not used by other tests, so the shared test cache has no entry for it
+HISTORY = ["prod004", "prod013"]
+
+
+def feed_by_char(parser, text):
+    items = []
+    for char in text:
+        items.extend(parser.feed(char))
+    return items
+
+
+def test_parser_emits_objects_as_they_close():
+    parser = IncrementalJSONArrayParser()
+    assert parser.feed('Here you go:\n```json\n[{"product_id": "a", "score": 1},') == [
+        {"product_id": "a", "score": 1}
+    ]
+    assert parser.feed(' {"product_id": "b"') == []
+    assert parser.feed(', "score": 2}]\n```') == [{"product_id": "b", "score": 2}]
+    assert parser.finished
+
+
+def test_parser_handles_delimiters_inside_strings():
+    items = [
+        {"product_id": "a", "explanation": 'Has {braces}, [brackets] and "quotes" \\ too'},
+        {"product_id": "b", "explanation": "nested", "meta": {"tags": ["x", "y]"]}},
+    ]
+    parser = IncrementalJSONArrayParser()
+    assert feed_by_char(parser, json.dumps(items)) == items
+    assert parser.finished
+    assert parser.errors == 0
+
+
+def test_parser_skips_malformed_objects():
+    parser = IncrementalJSONArrayParser()
+    assert feed_by_char(parser, '[{"product_id": }, {"product_id": "b"}]') == [{"product_id": "b"}]
+    assert parser.errors == 1
+
+
+def test_stream_yields_before_completion_and_caches_result():
+    async def run(stub):
+        service = LLMService()
+        service.api_base = stub.api_base
+        products = service.product_service.get_all_products()
+        events = []
+        started = time.monotonic()
+        try:
+            async for event, data in service.astream_recommendations(PREFERENCES, HISTORY, products):
+                events.append((event, data, time.monotonic() - started))
+            cached = await service.cache_service.aget_cached_recommendations(PREFERENCES, HISTORY)
+        finally:
+            await service.aclose()
+        return events, cached
+
+    with StubLLMServer(chunk_size=4, chunk_delay=0.01) as stub:
+        events, cached = asyncio.run(run(stub))
+
+    assert [event for event, _, _ in events] == ["recommendation", "recommendation", "done"]
+    assert [data["product"]["id"] for _, data, _ in events[:2]] == ["prod009", "prod002"]
+    # the first recommendation went out well before the stream finished
+    assert events[0][2] < events[-1][2] - 0.1
+    assert events[-1][1]["count"] == 2
+    assert "recommendations" not in events[-1][1]
+    assert [r["product"]["id"] for r in cached["recommendations"]] == ["prod009", "prod002"]
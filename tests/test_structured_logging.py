@@ -0,0 +1,86 @@
+"""
+Queued structured logging: formatting, level control, sampling and drops.
+"""
+
+import io
+import json
+import logging
+import queue
+
+from services import structured_logging
+from services.structured_logging import (
+    _EnqueueHandler, configure_logging, dropped_records, get_logger, parse_levels, parse_sample_rates,
+    shutdown_logging
+)
+
+
+def _lines(stream):
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def test_json_records_are_written_by_the_listener():
+    stream = io.StringIO()
+    configure_logging(level='info', stream=stream,
+                      logger_levels={'test.verbose': logging.DEBUG})
+    try:
+        log = get_logger('test.quiet')
+        log.debug('cache.hit', key='abc')
+        log.info('catalog.reloaded', version=3, products=[1, 2])
+        get_logger('test.verbose').debug('cache.hit', key='abc')
+        try:
+            raise ValueError('boom')
+        except ValueError as e:
+            log.exception('llm.error', error=str(e))
+        logging.getLogger('test.foreign').warning('plain %s message', 'std')
+    finally:
+        shutdown_logging()
+        logging.getLogger('test.verbose').setLevel(logging.NOTSET)
+
+    records = _lines(stream)
+    assert [(r['logger'], r['event']) for r in records] == [
+        ('test.quiet', 'catalog.reloaded'), ('test.verbose', 'cache.hit'),
+        ('test.quiet', 'llm.error'), ('test.foreign', 'plain std message')]
+    assert records[0]['level'] == 'info' and records[0]['products'] == [1, 2]
+    assert records[0]['ts'].endswith('Z')
+    assert records[2]['error'] == 'boom' and 'ValueError: boom' in records[2]['exc']
+
+
+def test_text_format_and_sampling():
+    stream = io.StringIO()
+    configure_logging(level='debug', fmt='text', stream=stream,
+                      sample_rates={'cache.hit': 0.0, 'cache.write': 1.0})
+    try:
+        log = get_logger('test.sampled')
+        for _ in range(20):
+            log.debug('cache.hit', key='abc')
+        log.debug('cache.write', key='abc')
+    finally:
+        shutdown_logging()
+        logging.getLogger().setLevel(logging.WARNING)
+
+    assert structured_logging._sample_rates == {}
+    lines = stream.getvalue().splitlines()
+    assert len(lines) == 1
+    assert lines[0].split(' ', 1)[1] == 'DEBUG test.sampled cache.write key="abc"'
+
+
+def test_full_queue_drops_instead_of_blocking():
+    handler = _EnqueueHandler(queue.Queue(maxsize=1))
+    logger = logging.getLogger('test.dropped')
+    logger.addHandler(handler)
+    logger.propagate = False
+    dropped = dropped_records()
+    try:
+        get_logger('test.dropped').warning('cache.write_failed', error='disk full')
+        get_logger('test.dropped').warning('cache.write_failed', error='disk full')
+    finally:
+        logger.removeHandler(handler)
+        logger.propagate = True
+    assert handler.queue.qsize() == 1
+    assert dropped_records() == dropped + 1
+
+
+def test_parse_settings():
+    assert parse_levels('services.cache_service=debug, openai=WARNING,') == {
+        'services.cache_service': logging.DEBUG, 'openai': logging.WARNING}
+    assert parse_sample_rates('cache.hit=0.01,cache.write=2') == {'cache.hit': 0.01, 'cache.write': 1.0}
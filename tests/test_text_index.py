@@ -0,0 +1,85 @@
+"""
+TF-IDF content similarity index.
+"""
+
+import random
+
+import numpy as np
+
+from services.product_service import ProductService
+from services.scoring_engine import ScoringCatalog
+from services.text_index import TfidfIndex, tokenize
+
+
+def dense_matrix(index):
+    matrix = np.zeros((index.size, len(index.vocab)))
+    for row in range(index.size):
+        span = slice(index.row_ptr[row], index.row_ptr[row + 1])
+        matrix[row, index.row_terms[span]] = index.row_values[span]
+    return matrix
+
+
+def test_tokenize():
+    assert tokenize("The Wireless Headphones, with 30-hour battery!") == \
+        ["wireless", "headphone", "30", "hour", "battery"]
+
+
+def test_similarity_matches_dense_cosine():
+    products = ProductService().get_all_products()
+    index = TfidfIndex(products)
+    # compare full query vectors; truncation is an approximation
+    index.MAX_QUERY_TERMS = 10 ** 6
+    matrix = dense_matrix(index)
+    assert np.allclose(np.linalg.norm(matrix, axis=1), 1.0)
+
+    rng = random.Random(3)
+    for _ in range(20):
+        positions = rng.sample(range(len(products)), rng.randint(1, 4))
+        query = matrix[positions].sum(axis=0)
+        query /= np.linalg.norm(query)
+        assert np.allclose(index.similarity(positions), matrix @ query)
+
+
+def test_similarity_at_matches_full_similarity():
+    products = ProductService().get_all_products()
+    index = TfidfIndex(products)
+    # a truncated query, so the kept terms come out of argpartition
+    index.MAX_QUERY_TERMS = 5
+
+    rng = random.Random(5)
+    for _ in range(20):
+        positions = rng.sample(range(len(products)), rng.randint(1, 4))
+        terms, _ = index.query_vector(positions)
+        assert list(terms) == sorted(terms)
+        rows = np.array(sorted(rng.sample(range(len(products)), 12)))
+        assert np.allclose(index.similarity_at(rows, positions), index.similarity(positions)[rows])
+
+
+def test_most_similar_uses_descriptions():
+    products = [
+        {"id": "q", "name": "Trail Pack", "description": "Waterproof hiking backpack for mountain trails"},
+        {"id": "a", "name": "Summit Bag", "description": "A waterproof backpack built for mountain hiking"},
+        {"id": "b", "name": "Desk Lamp", "description": "LED lamp for your office desk"},
+        {"id": "c", "name": "Rain Jacket", "description": "Waterproof jacket"},
+    ]
+    index = TfidfIndex(products)
+    ranked = index.most_similar([0], k=3)
+    assert [position for position, _ in ranked] == [1, 3]
+    assert "backpack" in index.shared_terms(1, [0])
+
+
+def test_scoring_uses_text_similarity():
+    products = ProductService().get_all_products()
+    catalog = ScoringCatalog(products)
+    legacy = ScoringCatalog(products, content_similarity='features')
+    preferences = {"priceRange": "all", "categories": [], "brands": []}
+    browsed = [p for p in products if p["id"] == "prod002"]
+
+    scores, eligible = catalog.score(preferences, browsed)
+    base, _ = legacy.score(preferences, [])
+    similarity = catalog.text_index.similarity([products.index(browsed[0])])
+    assert not eligible[products.index(browsed[0])]
+    # the other audio products benefit most from the text signal
+    best = max((i for i in range(len(products)) if eligible[i]), key=lambda i: similarity[i])
+    assert products[best]["subcategory"] == "Audio"
+    assert scores[best] > base[best]